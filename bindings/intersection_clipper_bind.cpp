@@ -1,5 +1,6 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h> 
+#include "numpy_buffers.h"
 namespace py = pybind11;
 
 std::tuple<bool, std::pair<double, double>> do_lines_intersect(const std::pair<double, double> &p1, const std::pair<double, double> &p2,
@@ -24,12 +25,36 @@ std::vector<std::pair<double, double>> subtract_polygon(
         const std::vector<std::pair<double, double>>& polygon1,
         const std::vector<std::pair<double, double>>& polygon2);
 
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_pairs(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    const std::vector<std::pair<int, int>>& pairs,
+    bool with_area);
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_layers(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    bool with_area);
+
+bool polygons_overlap(const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2,
+    const std::string& mode);
+
 PYBIND11_MODULE(intersection_clipper_cpp, m) 
 {
-    m.def("is_point_inside_polygon", &is_point_inside_polygon, "Check if point is inside polygon");
-    m.def("do_lines_intersect", &do_lines_intersect, "Check if lines intersect");
-    m.def("get_intersection_points", &get_intersection_points, "Get all intersection points between two polygons");
-    m.def("intersect_polygon", &intersect_polygon, "Intersect two polygons");
-    m.def("subtract_polygon", &subtract_polygon, "Subtract one polygon from another");
-    m.def("split_polygon", &split_polygon, "Split a polygon into two non-overlapping parts");
+    bind_numpy_overloads<double>(m);
+    bind_numpy_overloads<int64_t>(m);
+
+    m.def("is_point_inside_polygon", &is_point_inside_polygon, "Check if point is inside polygon", py::call_guard<py::gil_scoped_release>());
+    m.def("do_lines_intersect", &do_lines_intersect, "Check if lines intersect", py::call_guard<py::gil_scoped_release>());
+    m.def("get_intersection_points", &get_intersection_points, "Get all intersection points between two polygons", py::call_guard<py::gil_scoped_release>());
+    m.def("intersect_polygon", &intersect_polygon, "Intersect two polygons", py::call_guard<py::gil_scoped_release>());
+    m.def("subtract_polygon", &subtract_polygon, "Subtract one polygon from another", py::call_guard<py::gil_scoped_release>());
+    m.def("split_polygon", &split_polygon, "Split a polygon into two non-overlapping parts", py::call_guard<py::gil_scoped_release>());
+    m.def("polygons_overlap", &polygons_overlap, "Check whether two polygons overlap by area or touch", py::call_guard<py::gil_scoped_release>(),
+          py::arg("polygon1"), py::arg("polygon2"), py::arg("mode") = "area");
+    m.def("intersect_pairs", &intersect_pairs, "Intersect candidate pairs of polygons from two lists", py::call_guard<py::gil_scoped_release>(),
+          py::arg("polygons1"), py::arg("polygons2"), py::arg("pairs"), py::arg("with_area") = false);
+    m.def("intersect_layers", &intersect_layers, "Intersect every polygon of one list with every polygon of another", py::call_guard<py::gil_scoped_release>(),
+          py::arg("polygons1"), py::arg("polygons2"), py::arg("with_area") = false);
 }
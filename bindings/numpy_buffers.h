@@ -0,0 +1,187 @@
+#pragma once
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <climits>
+#include <cstdint>
+#include <stdexcept>
+#include <string>
+#include <vector>
+#include <utility>
+namespace py = pybind11;
+
+// Полигоны в виде массивов NumPy: один полигон - массив (N, 2),
+// слой - пара "coords (N, 2) + offsets (n + 1)", как в CSR.
+
+std::vector<std::pair<double, double>> intersect_polygon(
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2);
+
+std::vector<std::pair<double, double>> subtract_polygon(
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2);
+
+std::pair<std::vector<std::pair<double, double>>, std::vector<std::pair<double, double>>> split_polygon(
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2);
+
+bool polygons_overlap(const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2,
+    const std::string& mode);
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_pairs(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    const std::vector<std::pair<int, int>>& pairs,
+    bool with_area);
+
+template <typename T>
+using coords_array = py::array_t<T, py::array::c_style>;
+using index_array = py::array_t<int64_t, py::array::c_style>;
+
+template <typename T>
+std::vector<std::pair<double, double>> polygon_from_array(const coords_array<T>& coords, int64_t begin, int64_t end)
+{
+    auto view = coords.template unchecked<2>();
+    std::vector<std::pair<double, double>> polygon;
+    polygon.reserve(end - begin);
+    for (int64_t i = begin; i < end; ++i)
+        polygon.push_back({static_cast<double>(view(i, 0)), static_cast<double>(view(i, 1))});
+    return polygon;
+}
+
+template <typename T>
+std::vector<std::pair<double, double>> polygon_from_array(const coords_array<T>& coords)
+{
+    if (coords.ndim() != 2 || coords.shape(1) != 2)
+        throw std::invalid_argument("polygon array must have shape (N, 2)");
+    return polygon_from_array(coords, 0, coords.shape(0));
+}
+
+template <typename T>
+std::vector<std::vector<std::pair<double, double>>> polygons_from_arrays(const coords_array<T>& coords, const index_array& offsets)
+{
+    if (coords.ndim() != 2 || coords.shape(1) != 2)
+        throw std::invalid_argument("coords array must have shape (N, 2)");
+    if (offsets.ndim() != 1 || offsets.shape(0) < 1)
+        throw std::invalid_argument("offsets array must have shape (n + 1,)");
+    auto bounds = offsets.unchecked<1>();
+    std::vector<std::vector<std::pair<double, double>>> polygons;
+    polygons.reserve(offsets.shape(0) - 1);
+    for (py::ssize_t i = 0; i + 1 < offsets.shape(0); ++i)
+    {
+        if (bounds(i) < 0 || bounds(i) > bounds(i + 1) || bounds(i + 1) > coords.shape(0))
+            throw std::invalid_argument("offsets must be non-decreasing and within coords");
+        polygons.push_back(polygon_from_array(coords, bounds(i), bounds(i + 1)));
+    }
+    return polygons;
+}
+
+inline std::vector<std::pair<int, int>> pairs_from_array(const index_array& pairs, size_t size1, size_t size2)
+{
+    if (pairs.ndim() != 2 || pairs.shape(1) != 2)
+        throw std::invalid_argument("pairs array must have shape (K, 2)");
+    auto view = pairs.unchecked<2>();
+    std::vector<std::pair<int, int>> result;
+    result.reserve(pairs.shape(0));
+    for (py::ssize_t k = 0; k < pairs.shape(0); ++k)
+    {
+        // Номера проверяются до приведения к int: иначе 2**32 + 1 станет 1
+        int64_t i = view(k, 0), j = view(k, 1);
+        if (i < 0 || i > INT_MAX || (uint64_t)i >= size1 || j < 0 || j > INT_MAX || (uint64_t)j >= size2)
+            throw std::out_of_range("pair (" + std::to_string(i) + ", " + std::to_string(j) + ") is out of range");
+        result.push_back({static_cast<int>(i), static_cast<int>(j)});
+    }
+    return result;
+}
+
+inline py::array_t<double> array_from_polygon(const std::vector<std::pair<double, double>>& polygon)
+{
+    py::array_t<double> result({static_cast<py::ssize_t>(polygon.size()), static_cast<py::ssize_t>(2)});
+    auto view = result.mutable_unchecked<2>();
+    for (size_t i = 0; i < polygon.size(); ++i)
+    {
+        view(i, 0) = polygon[i].first;
+        view(i, 1) = polygon[i].second;
+    }
+    return result;
+}
+
+inline py::tuple arrays_from_pairs(const std::pair<std::vector<std::pair<int, int>>, std::vector<double>>& found)
+{
+    const auto& [pairs, areas] = found;
+    index_array result_pairs({static_cast<py::ssize_t>(pairs.size()), static_cast<py::ssize_t>(2)});
+    auto view = result_pairs.mutable_unchecked<2>();
+    for (size_t k = 0; k < pairs.size(); ++k)
+    {
+        view(k, 0) = pairs[k].first;
+        view(k, 1) = pairs[k].second;
+    }
+    py::array_t<double> result_areas(static_cast<py::ssize_t>(areas.size()));
+    std::copy(areas.begin(), areas.end(), result_areas.mutable_data());
+    return py::make_tuple(result_pairs, result_areas);
+}
+
+// Перегрузки регистрируются раньше списочных версий и с noconvert():
+// массивы не уходят в медленную stl-конверсию, а списки кортежей
+// по-прежнему попадают в списочные версии и возвращают списки.
+template <typename T>
+void bind_numpy_overloads(py::module_& m)
+{
+    m.def("intersect_polygon", [](const coords_array<T>& polygon1, const coords_array<T>& polygon2) {
+        auto path1 = polygon_from_array(polygon1);
+        auto path2 = polygon_from_array(polygon2);
+        std::vector<std::pair<double, double>> result;
+        {
+            py::gil_scoped_release release;
+            result = intersect_polygon(path1, path2);
+        }
+        return array_from_polygon(result);
+    }, "Intersect two polygons given as (N, 2) arrays", py::arg("polygon1").noconvert(), py::arg("polygon2").noconvert());
+
+    m.def("subtract_polygon", [](const coords_array<T>& polygon1, const coords_array<T>& polygon2) {
+        auto path1 = polygon_from_array(polygon1);
+        auto path2 = polygon_from_array(polygon2);
+        std::vector<std::pair<double, double>> result;
+        {
+            py::gil_scoped_release release;
+            result = subtract_polygon(path1, path2);
+        }
+        return array_from_polygon(result);
+    }, "Subtract one (N, 2) array polygon from another", py::arg("polygon1").noconvert(), py::arg("polygon2").noconvert());
+
+    m.def("split_polygon", [](const coords_array<T>& polygon1, const coords_array<T>& polygon2) {
+        auto path1 = polygon_from_array(polygon1);
+        auto path2 = polygon_from_array(polygon2);
+        std::pair<std::vector<std::pair<double, double>>, std::vector<std::pair<double, double>>> parts;
+        {
+            py::gil_scoped_release release;
+            parts = split_polygon(path1, path2);
+        }
+        return py::make_tuple(array_from_polygon(parts.first), array_from_polygon(parts.second));
+    }, "Split an (N, 2) array polygon into two non-overlapping parts", py::arg("polygon1").noconvert(), py::arg("polygon2").noconvert());
+
+    m.def("polygons_overlap", [](const coords_array<T>& polygon1, const coords_array<T>& polygon2, const std::string& mode) {
+        auto path1 = polygon_from_array(polygon1);
+        auto path2 = polygon_from_array(polygon2);
+        py::gil_scoped_release release;
+        return polygons_overlap(path1, path2, mode);
+    }, "Check whether two (N, 2) array polygons overlap by area or touch",
+          py::arg("polygon1").noconvert(), py::arg("polygon2").noconvert(), py::arg("mode") = "area");
+
+    m.def("intersect_pairs", [](const coords_array<T>& coords1, const index_array& offsets1,
+                                const coords_array<T>& coords2, const index_array& offsets2,
+                                const index_array& pairs, bool with_area) {
+        auto polygons1 = polygons_from_arrays(coords1, offsets1);
+        auto polygons2 = polygons_from_arrays(coords2, offsets2);
+        auto candidates = pairs_from_array(pairs, polygons1.size(), polygons2.size());
+        std::pair<std::vector<std::pair<int, int>>, std::vector<double>> found;
+        {
+            py::gil_scoped_release release;
+            found = intersect_pairs(polygons1, polygons2, candidates, with_area);
+        }
+        return arrays_from_pairs(found);
+    }, "Intersect candidate pairs of polygons given as coords + offsets arrays",
+          py::arg("coords1").noconvert(), py::arg("offsets1"), py::arg("coords2").noconvert(), py::arg("offsets2"),
+          py::arg("pairs"), py::arg("with_area") = false);
+}
@@ -0,0 +1,55 @@
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <cstdint>
+#include <vector>
+namespace py = pybind11;
+
+using index_array = py::array_t<int64_t, py::array::c_style | py::array::forcecast>;
+
+std::vector<int64_t> vf2pp_search(
+    const std::vector<int64_t>& order,
+    const std::vector<int64_t>& back_ptr,
+    const std::vector<int64_t>& back_nodes,
+    const std::vector<int64_t>& back_labels,
+    const std::vector<int64_t>& pattern_colours,
+    const std::vector<int64_t>& pattern_degrees,
+    const std::vector<int64_t>& target_ptr,
+    const std::vector<int64_t>& target_nodes,
+    const std::vector<int64_t>& target_labels,
+    const std::vector<int64_t>& target_colours,
+    const std::vector<int64_t>& target_degrees,
+    const std::vector<int64_t>& colour_ptr,
+    const std::vector<int64_t>& colour_nodes,
+    bool induced);
+
+static std::vector<int64_t> vector_from_array(const index_array& values)
+{
+    if (values.ndim() != 1)
+        throw std::invalid_argument("index arrays must be one-dimensional");
+    return std::vector<int64_t>(values.data(), values.data() + values.shape(0));
+}
+
+PYBIND11_MODULE(vf2pp_cpp, m)
+{
+    m.def("search", [](const index_array& order, const index_array& back_ptr, const index_array& back_nodes,
+                       const index_array& back_labels, const index_array& pattern_colours, const index_array& pattern_degrees,
+                       const index_array& target_ptr, const index_array& target_nodes, const index_array& target_labels,
+                       const index_array& target_colours, const index_array& target_degrees,
+                       const index_array& colour_ptr, const index_array& colour_nodes, bool induced) {
+        std::vector<std::vector<int64_t>> arrays;
+        for (const index_array* values : {&order, &back_ptr, &back_nodes, &back_labels, &pattern_colours, &pattern_degrees,
+                                          &target_ptr, &target_nodes, &target_labels, &target_colours, &target_degrees,
+                                          &colour_ptr, &colour_nodes})
+            arrays.push_back(vector_from_array(*values));
+        std::vector<int64_t> core;
+        {
+            py::gil_scoped_release release;
+            core = vf2pp_search(arrays[0], arrays[1], arrays[2], arrays[3], arrays[4], arrays[5], arrays[6],
+                                arrays[7], arrays[8], arrays[9], arrays[10], arrays[11], arrays[12], induced);
+        }
+        index_array result(static_cast<py::ssize_t>(core.size()));
+        std::copy(core.begin(), core.end(), result.mutable_data());
+        return result;
+    }, "VF2++ depth-first search over CSR graphs with integer labels; returns the image of every pattern node or an empty array");
+}
@@ -0,0 +1,34 @@
+from src.algorithms.mismatch_localization import localize_mismatches
+from src.circuits.ElectricalСircuit import ElecrticalCircuit
+
+
+def tiled_adders(filename, blocks, defect=False):
+    # blocks копий сумматора на общих VCC и GND; при defect у первой копии
+    # исток TP1 переставлен с VCC на GND
+    with open(filename, 'r') as file:
+        rows = [line.split() for line in file if line.strip()]
+    devices = []
+    for k in range(blocks):
+        def net(name):
+            return name if name in ("VCC", "GND") else f"{name}_{k}"
+        for name, drain, gate, source, _ in rows:
+            if defect and k == 0 and name == "TP1":
+                source = "GND"
+            devices.append((name[1], net(gate), net(drain), net(source)))
+    circuit = ElecrticalCircuit(f"{blocks} adders")
+    circuit.add_devices(devices)
+    circuit.compile()
+    return circuit
+
+
+if __name__ == "__main__":
+    # У одинаковых блоков нет уникальных якорей: без индивидуализации
+    # все блоки вдали от дефекта оставались без пары. Степени VCC и GND
+    # у графов разные, поэтому цепи питания заранее не сопоставляются
+    for blocks in (1, 2, 5):
+        first = tiled_adders("resources/input/sum.net", blocks)
+        second = tiled_adders("resources/input/sum.net", blocks, defect=True)
+        report = localize_mismatches(first.nx_graph, second.nx_graph)
+        print(f"{blocks} blocks : unmatched {len(report.unmatched[0])}/{len(report.unmatched[1])}, suspects {len(report.suspects[1])}")
+        assert len(report.unmatched[0]) <= 3 and len(report.unmatched[1]) <= 3
+        assert len(report.suspects[1]) <= 2
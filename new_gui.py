@@ -10,9 +10,10 @@ import pyvista as pv
 from pyvistaqt import QtInteractor
 import numpy as np
 import sys
-from src.circuits.verification import verification
-from src.circuits.verification import search_subcircuit
+import os
+from src.circuits.verification_session import VerificationSession
 from src.circuits.TopologicalCircuit import TopologicalCircuit
+from src.circuits.circuit_cache import CircuitCache, ResultCache
 
 
 class MeshBuilderWorker(QObject):
@@ -47,8 +48,7 @@ class CircuitLoaderWorker(QObject):
     def run(self):
         try:
             self.topological_circuit.clean()
-            self.topological_circuit.load_CIF(self.file_path_top)
-            self.topological_circuit.compile()
+            CircuitCache().compile(self.topological_circuit, self.file_path_top, workers=os.cpu_count() or 1)
             self.finished.emit(self.topological_circuit)
         except Exception as e:
             self.error.emit(str(e))
@@ -175,6 +175,11 @@ class MainWindow(QMainWindow):
         self.topological_circuit = TopologicalCircuit()
         self.file_path_top = None
         self.file_path_el = None
+        # Повторная проверка той же пары схем берёт готовый результат
+        self.results = ResultCache()
+        # Схемы компилируются один раз при выборе файлов, проверка и поиск
+        # подсхем идут через сессию
+        self.session = VerificationSession(cache=CircuitCache(), results=self.results)
         self.highlighted_polygons = []
         self.highlighted_elements = []
         self.subcircuits = []
@@ -389,6 +394,7 @@ class MainWindow(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Выберите CIF файл", "", "CIF Files (*.cif);;All Files (*)")
         if file_path:
             self.file_path_top = file_path
+            self.session.open_topological(file_path, "Топологическая схема")
             self.result_log.append(f"Компиляция схемы из файла {file_path}")
             self.highlighted_polygons = []
             self.highlighted_elements = []
@@ -411,6 +417,7 @@ class MainWindow(QMainWindow):
     def on_topo_loaded(self, topo):
         self.result_log.append("Топологическая схема загружена и скомпилирована.")
         self.topological_circuit = topo
+        self.session.open_topological(self.file_path_top, "Топологическая схема", circuit=topo)
         self.progress_bar.setRange(0, 1)
         self.progress_bar.setValue(0)
         self.show_plot_2D()
@@ -424,7 +431,7 @@ class MainWindow(QMainWindow):
     def open_file_dialog_el(self):
         self.progress_bar.setRange(0, 0)
         self.progress_bar.setValue(0)
-        file_path, _ = QFileDialog.getOpenFileName(self, "Выберите net файл", "", "net Files (*.net);;All Files (*)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "Выберите net файл", "", "Netlist Files (*.net *.sp *.spi *.spice *.cir *.cdl *.ckt);;All Files (*)")
         if file_path:
             try:
                 with open(file_path, 'r', encoding='utf-8') as file:
@@ -433,6 +440,7 @@ class MainWindow(QMainWindow):
                     self.netlist_name.setText(f"Название: {netlist_name}")
                     self.netlist_text.setPlainText(content)
                     self.file_path_el = file_path
+                    self.session.open_electrical(file_path, "Электрическая схема")
                     self.result_log.append(f"Загружен файл электрической схемы {file_path}")
             except Exception as e:
                 self.netlist_text.setPlainText("Файл не загружен")
@@ -452,7 +460,7 @@ class MainWindow(QMainWindow):
         self.progress_bar.setValue(0)
         self.highlighted_polygons = []
         self.highlighted_elements = []
-        is_isomorphic, connections, time = verification(self.file_path_el, "Электрическая схема", topological_circuit=self.topological_circuit)
+        is_isomorphic, connections, time = self.session.verify()
         self.result_log.append("Результат верификации:")
         self.progress_bar.setRange(0, 1)
         self.progress_bar.setValue(0)
@@ -462,7 +470,7 @@ class MainWindow(QMainWindow):
             self.result_log.append("Графы схем не изоморфны.\n" + f"Время выполнения проверки: {time} секунд.")
             if connections:
                 self.result_log.append("Найдена точка разрыва.")
-                self.highlighted_polygons = [self.topological_circuit.get_polygons(id) for id in connections]
+                self.highlighted_polygons = [self.session.topological.get_polygons(id) for id in connections]
                 self.highlighted_elements = connections
                 self.show_plot_3D()
     
@@ -476,7 +484,7 @@ class MainWindow(QMainWindow):
         self.progress_bar.setRange(0, 0)
         self.progress_bar.setValue(0)
         self.subcircuits = []
-        subcircuits, time = search_subcircuit(self.file_path_el, "Электрическая схема", topological_circuit=self.topological_circuit)
+        subcircuits, time = self.session.search_subcircuit()
         self.progress_bar.setRange(0, 1)
         self.progress_bar.setValue(0)
         self.result_log.append("Результат верификации:")
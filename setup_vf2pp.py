@@ -0,0 +1,20 @@
+from setuptools import setup, Extension
+import pybind11
+
+ext_modules = [
+    Extension(
+        "vf2pp_cpp",
+        ["bindings/vf2pp_bind.cpp",
+         "src/cpp/vf2pp.cpp"
+         ],
+        include_dirs=[pybind11.get_include()
+        ],
+        language="c++",
+        extra_compile_args=['/std:c++17']
+    )
+]
+
+setup(
+    name="vf2pp_cpp",
+    ext_modules=ext_modules,
+)
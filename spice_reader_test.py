@@ -0,0 +1,47 @@
+import os
+import tempfile
+from src.circuits.spice_reader import SpiceNetlist
+
+
+def expand(text):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "netlist.sp")
+        with open(filename, 'w') as file:
+            file.write(text)
+        return SpiceNetlist().read(filename).expand()
+
+
+GLOBAL_RAILS = """
+.global VDD GND
+.subckt inv a y
+m1 y a vdd vdd pch
+m2 y a gnd gnd nch
+.ends
+x1 in mid inv
+x2 mid out inv
+"""
+
+# Выводы VDD и GND совпадают по имени с глобальными цепями, но подключаются
+# снаружи: у Xb питание - vdd_core
+RAIL_PINS = """
+.global VDD GND
+.subckt buf A Y VDD GND
+m1 m A VDD VDD pch
+m2 m A GND GND nch
+m3 Y m VDD VDD pch
+m4 Y m GND GND nch
+.ends
+Xb in out vdd_core gnd buf
+"""
+
+
+if __name__ == "__main__":
+    # .global не зависит от регистра: vdd внутри ячеек - общая шина VDD
+    devices = expand(GLOBAL_RAILS)
+    print(devices)
+    assert {source for _, _, _, source in devices} == {"vdd", "gnd"}
+
+    devices = expand(RAIL_PINS)
+    print(devices)
+    assert ('P', 'in', 'Xb.m', 'vdd_core') in devices and ('P', 'Xb.m', 'out', 'vdd_core') in devices
+    assert all(source != "vdd" for _, _, _, source in devices)
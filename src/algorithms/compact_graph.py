@@ -0,0 +1,182 @@
+import numpy as np
+
+
+def mix(values):
+    # splitmix64: перемешивание битов, переполнение uint64 здесь намеренное
+    x = np.asarray(values).astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def segment_sums(values, indptr):
+    # Суммы по отрезкам CSR по модулю 2^64; пустые отрезки дают ноль
+    sums = np.zeros(len(values) + 1, dtype=np.uint64)
+    np.cumsum(values, out=sums[1:])
+    return sums[indptr[1:]] - sums[indptr[:-1]]
+
+
+class CompactGraph:
+    # Граф в формате CSR: соседи вершины k - indices[indptr[k]:indptr[k + 1]],
+    # метки вершин и рёбер - целые номера из общего словаря vocabulary,
+    # чтобы метки разных графов можно было сравнивать
+    def __init__(self, nodes, node_labels, indptr, indices, edge_labels):
+        self.nodes = nodes
+        self.node_labels = node_labels
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_labels = edge_labels
+        self.index = {node: k for k, node in enumerate(nodes)}
+
+
+    @classmethod
+    def from_networkx(cls, graph, vocabulary=None):
+        vocabulary = {} if vocabulary is None else vocabulary
+
+        def code(label):
+            value = vocabulary.get(label)
+            if value is None:
+                value = vocabulary[label] = len(vocabulary)
+            return value
+
+        nodes = list(graph.nodes)
+        index = {node: k for k, node in enumerate(nodes)}
+        node_labels = np.fromiter((code(label) for _, label in graph.nodes(data="label")), dtype=np.int64, count=len(nodes))
+        edges = np.fromiter((value for u, v, label in graph.edges(data="label") for value in (index[u], index[v], code(label))),
+                            dtype=np.int64, count=3 * graph.number_of_edges()).reshape(-1, 3)
+
+        source = np.concatenate((edges[:, 0], edges[:, 1]))
+        target = np.concatenate((edges[:, 1], edges[:, 0]))
+        labels = np.concatenate((edges[:, 2], edges[:, 2]))
+        return cls.from_entries(nodes, node_labels, source, target, labels)
+
+
+    @classmethod
+    def from_entries(cls, nodes, node_labels, source, target, labels):
+        # Записи CSR в обоих направлениях; соседи сортируются по номеру
+        order = np.lexsort((target, source))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=len(nodes)), out=indptr[1:])
+        return cls(nodes, node_labels, indptr, target[order], labels[order])
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    @property
+    def degrees(self):
+        return np.diff(self.indptr)
+
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+
+    def neighbors(self, k):
+        return self.indices[self.indptr[k]:self.indptr[k + 1]]
+
+
+    def subgraph(self, members):
+        # Подграф на вершинах members в их порядке; рёбра наружу отбрасываются
+        members = np.asarray(members, dtype=np.int64)
+        position = np.full(len(self), -1, dtype=np.int64)
+        position[members] = np.arange(len(members))
+        owner = np.repeat(np.arange(len(self)), self.degrees)
+        kept = (position[owner] >= 0) & (position[self.indices] >= 0)
+        return CompactGraph.from_entries([self.nodes[k] for k in members.tolist()], self.node_labels[members],
+                                         position[owner[kept]], position[self.indices[kept]], self.edge_labels[kept])
+
+
+    def translate(self, vocabulary, into):
+        # Тот же граф с кодами меток из словаря into (недостающие метки
+        # добавляются в него); vocabulary - словарь, по которому он построен
+        codes = np.empty(len(vocabulary), dtype=np.int64)
+        for label, value in vocabulary.items():
+            codes[value] = into.setdefault(label, len(into))
+        return CompactGraph(self.nodes, codes[self.node_labels], self.indptr, self.indices, codes[self.edge_labels])
+
+
+    def part(self, begin, end):
+        # Вершины begin..end-1, если рёбер между ними и остальными нет
+        # (например, связная компонента после subgraph в порядке компонент)
+        first, last = self.indptr[begin], self.indptr[end]
+        return CompactGraph(self.nodes[begin:end], self.node_labels[begin:end], self.indptr[begin:end + 1] - first,
+                            self.indices[first:last] - begin, self.edge_labels[first:last])
+
+
+def component_labels(graph):
+    # Связные компоненты подвешиванием корней и сжатием путей: номер
+    # компоненты - наименьшая вершина в ней; число проходов растёт как
+    # логарифм, а не как диаметр графа
+    owner = np.repeat(np.arange(len(graph)), graph.degrees)
+    parent = np.arange(len(graph))
+    while True:
+        first, second = parent[owner], parent[graph.indices]
+        if np.array_equal(first, second):
+            return parent
+        np.minimum.at(parent, np.maximum(first, second), np.minimum(first, second))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def neighbourhood_profiles(graph, size, width):
+    # Профиль вершины: число соседей для каждой пары (метка ребра, метка
+    # соседа) и width наибольших степеней соседей по каждой метке ребра.
+    # Вложение переводит соседей вершины в разных соседей её образа, а
+    # степени не уменьшает, поэтому профиль образа не меньше покомпонентно.
+    # size - граница кодов меток, общая для сравниваемых графов
+    n = len(graph)
+    owner = np.repeat(np.arange(n), graph.degrees)
+    pairs = owner * size * size + graph.edge_labels * size + graph.node_labels[graph.indices]
+    counts = np.bincount(pairs, minlength=n * size * size).reshape(n, size * size)
+
+    neighbour_degrees = graph.degrees[graph.indices]
+    order = np.lexsort((-neighbour_degrees, graph.edge_labels, owner))
+    groups = owner[order] * size + graph.edge_labels[order]
+    starts = np.flatnonzero(np.diff(groups, prepend=-1))
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+    kept = order[rank < width]
+    top = np.zeros((n, size * width), dtype=np.int64)
+    top[owner[kept], graph.edge_labels[kept] * width + rank[rank < width]] = neighbour_degrees[kept]
+    return np.hstack((counts, top)).astype(np.int32)
+
+
+def refine_colours(graphs, iterations=None, frozen=None):
+    # Совместное уточнение раскраски (1-WL) нескольких графов: цвет вершины -
+    # номер пары (свой цвет, мультимножество (метка ребра, цвет соседа)).
+    # Цвета общие для всех графов, поэтому их гистограммы можно сравнивать.
+    # Вершины из масок frozen сохраняют исходный цвет метки.
+    # Выдаёт раскраску каждой итерации, пока разбиение не перестанет дробиться
+    sizes = np.cumsum([0] + [len(graph) for graph in graphs])
+    edge_sizes = np.cumsum([0] + [len(graph.indices) for graph in graphs])
+    indptr = np.concatenate([graphs[0].indptr[:1]] + [graph.indptr[1:] + shift for graph, shift in zip(graphs, edge_sizes)])
+    indices = np.concatenate([graph.indices + shift for graph, shift in zip(graphs, sizes)])
+    edge_labels = np.concatenate([graph.edge_labels for graph in graphs]).astype(np.uint64)
+    bound = np.uint64(int(edge_labels.max()) + 1 if len(edge_labels) else 1)
+
+    _, colours = np.unique(np.concatenate([graph.node_labels for graph in graphs]), return_inverse=True)
+    if frozen is not None:
+        frozen = np.concatenate(frozen)
+        fixed = mix(colours)[frozen] ^ np.uint64(0x9e3779b97f4a7c15)
+    count = int(colours.max()) + 1 if len(colours) else 0
+    yield np.split(colours, sizes[1:-1])
+
+    limit = sizes[-1] if iterations is None else iterations
+    for _ in range(limit):
+        neighbours = mix(colours[indices].astype(np.uint64) * bound + edge_labels)
+        signatures = mix(mix(colours) + segment_sums(neighbours, indptr))
+        if frozen is not None:
+            signatures[frozen] = fixed
+        _, colours = np.unique(signatures, return_inverse=True)
+        refined = int(colours.max()) + 1 if len(colours) else 0
+        if refined == count:
+            break
+        count = refined
+        yield np.split(colours, sizes[1:-1])
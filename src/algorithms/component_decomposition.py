@@ -0,0 +1,222 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+from src.algorithms.compact_graph import CompactGraph, component_labels, refine_colours
+from src.algorithms.mismatch_localization import HUB_DEGREE
+from src.algorithms.partition_refinement import LVSResult, NET_LABEL, compare_compact
+
+
+# Отпечаток компоненты - гистограмма цветов 1-WL после нескольких итераций:
+# одинаковые блоки получают одинаковые отпечатки, разные почти всегда разные
+FINGERPRINT_ITERATIONS = 3
+
+SUPPLY_LABEL = "supply"
+
+
+def supply_nets(graph, net):
+    # Глобальные цепи питания - цепи, к которым подключено больше HUB_DEGREE приборов
+    return np.flatnonzero((graph.node_labels == net) & (graph.degrees > HUB_DEGREE)).tolist()
+
+
+def supply_key(graph, k):
+    neighbours = graph.neighbors(k)
+    pairs = graph.node_labels[neighbours] * (int(graph.edge_labels.max(initial=0)) + 1) + graph.edge_labels[graph.indptr[k]:graph.indptr[k + 1]]
+    values, counts = np.unique(pairs, return_counts=True)
+    return len(neighbours), values.tobytes(), counts.tobytes()
+
+
+def declared_supplies(first, second, net, declared):
+    # Объявленной цепи питания первого графа ставится в пару единственная
+    # цепь второго графа с той же степенью и тем же составом соседей
+    pairs = []
+    for node in declared:
+        k = first.index.get(node)
+        if k is None or first.node_labels[k] != net:
+            continue
+        key = supply_key(first, k)
+        candidates = np.flatnonzero((second.node_labels == net) & (second.degrees == first.degrees[k])).tolist()
+        matches = [candidate for candidate in candidates if supply_key(second, candidate) == key]
+        if len(matches) != 1:
+            return []
+        pairs.append((k, matches[0]))
+    return pairs
+
+
+def supply_pairs(G1, G2, declared):
+    # Пары объявленных цепей питания в исходных номерах вершин
+    vocabulary = {}
+    first = CompactGraph.from_networkx(G1, vocabulary)
+    second = CompactGraph.from_networkx(G2, vocabulary)
+    return {first.nodes[k1]: second.nodes[k2] for k1, k2 in declared_supplies(first, second, vocabulary.get(NET_LABEL), declared)}
+
+
+def pair_supplies(first, second, net, declared=None):
+    # Цепи питания двух графов сопоставляются по степени и составу соседей;
+    # если так их не различить, графы не разрезаются. declared - вершины
+    # первого графа, объявленные цепями питания, иначе ими считаются цепи
+    # со степенью больше HUB_DEGREE
+    if declared:
+        pairs = declared_supplies(first, second, net, declared)
+    else:
+        supplies1, supplies2 = supply_nets(first, net), supply_nets(second, net)
+        keys1 = {supply_key(first, k): k for k in supplies1}
+        keys2 = {supply_key(second, k): k for k in supplies2}
+        if not keys1 or set(keys1) != set(keys2) or len(keys1) != len(supplies1) or len(keys2) != len(supplies2):
+            return []
+        pairs = [(keys1[key], keys2[key]) for key in sorted(keys1)]
+    for graph, supplies in ((first, [k for k, _ in pairs]), (second, [k for _, k in pairs])):
+        # Ребро между двумя цепями питания разрез потерял бы
+        if np.isin(np.concatenate([graph.neighbors(k) for k in supplies] + [np.zeros(0, dtype=np.int64)]), supplies).any():
+            return []
+    return pairs
+
+
+def cut_supplies(graph, supplies, vocabulary):
+    # Каждое ребро к цепи питания k заменяется отдельным листом с меткой
+    # supply{k}: граф распадается на блоки, а изоморфизм блоков по-прежнему
+    # учитывает, к какой цепи питания подключён прибор. Сами цепи питания
+    # остаются изолированными вершинами
+    if not supplies:
+        return graph, set()
+    rank = np.full(len(graph), -1, dtype=np.int64)
+    rank[supplies] = np.arange(len(supplies))
+    codes = np.array([vocabulary.setdefault(f"{SUPPLY_LABEL}{k}", len(vocabulary)) for k in range(len(supplies))], dtype=np.int64)
+    owner = np.repeat(np.arange(len(graph)), graph.degrees)
+    towards = rank[graph.indices] >= 0
+    kept = ~towards & (rank[owner] < 0)
+    devices = owner[towards]
+    leaves = len(graph) + np.arange(len(devices))
+    leaf_nodes = [(SUPPLY_LABEL, k, graph.nodes[device]) for k, device in zip(rank[graph.indices[towards]].tolist(), devices.tolist())]
+    cut = CompactGraph.from_entries(graph.nodes + leaf_nodes,
+                                    np.concatenate((graph.node_labels, codes[rank[graph.indices[towards]]])),
+                                    np.concatenate((owner[kept], devices, leaves)),
+                                    np.concatenate((graph.indices[kept], leaves, devices)),
+                                    np.concatenate((graph.edge_labels[kept], graph.edge_labels[towards], graph.edge_labels[towards])))
+    return cut, set(leaf_nodes)
+
+
+def split_components(graph, skip):
+    # Вершины переставляются по компонентам, каждая компонента - отрезок;
+    # компоненты из одних вершин skip (изолированные цепи питания) опускаются.
+    # Выдаёт (отпечаток, наименьшая вершина компоненты, подграф)
+    labels = component_labels(graph)
+    order = np.lexsort((np.arange(len(graph)), labels))
+    whole = graph.subgraph(order)
+    bounds = np.flatnonzero(np.diff(labels[order], prepend=-1)).tolist() + [len(graph)]
+    for colours in refine_colours([whole], FINGERPRINT_ITERATIONS):
+        pass
+    colours = colours[0]
+    parts = []
+    for begin, end in zip(bounds, bounds[1:]):
+        if end - begin == 1 and order[begin] in skip:
+            continue
+        values, counts = np.unique(colours[begin:end], return_counts=True)
+        parts.append(((values.tobytes(), counts.tobytes()), int(order[begin]), whole.part(begin, end)))
+    return parts
+
+
+def compare_batch(pairs):
+    # Выполняется в процессе пула: пары компонент сравниваются по очереди
+    results = []
+    for index, first, second, net in pairs:
+        start = timer()
+        result = compare_compact(first, second, net)
+        results.append((index, result, timer() - start, len(first)))
+    return results
+
+
+def run_batches(tasks, workers):
+    if workers <= 1 or len(tasks) < 2:
+        return compare_batch(tasks)
+    # Крупные компоненты раздаются первыми, чтобы процессы загружались ровнее
+    batches = [[] for _ in range(min(len(tasks), workers * 4))]
+    for k, task in enumerate(sorted(tasks, key=lambda task: -len(task[1]))):
+        batches[k % len(batches)].append(task)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [item for results in executor.map(compare_batch, batches) for item in results]
+
+
+def compare_components(G1, G2, split_supplies=True, workers=1, supplies=None):
+    # Графы режутся по цепям питания и на связные компоненты, компоненты
+    # разбиваются на пары по отпечаткам и сравниваются независимо.
+    # Неудачная пара пересобирается внутри своей группы отпечатка:
+    # изоморфизм - отношение эквивалентности, поэтому жадный перебор
+    # находит пары всегда, когда они существуют. supplies - объявленные
+    # цепи питания G1 (например, по именам в списке соединений)
+    vocabulary = {}
+    first = CompactGraph.from_networkx(G1, vocabulary)
+    second = CompactGraph.from_networkx(G2, vocabulary)
+    net = vocabulary.get(NET_LABEL)
+    supplies = pair_supplies(first, second, net, supplies) if split_supplies else []
+    first, leaves1 = cut_supplies(first, [k for k, _ in supplies], vocabulary)
+    second, leaves2 = cut_supplies(second, [k for _, k in supplies], vocabulary)
+
+    # Цвета общие для обоих графов, только если раскрашивать их вместе
+    joint = CompactGraph.from_entries(first.nodes + second.nodes, np.concatenate((first.node_labels, second.node_labels)),
+                                      np.concatenate((np.repeat(np.arange(len(first)), first.degrees),
+                                                      np.repeat(np.arange(len(second)), second.degrees) + len(first))),
+                                      np.concatenate((first.indices, second.indices + len(first))),
+                                      np.concatenate((first.edge_labels, second.edge_labels)))
+    skip = {k for pair in supplies for k in (pair[0], pair[1] + len(first))}
+    groups = {}
+    for key, node, part in split_components(joint, skip):
+        groups.setdefault(key, ([], []))[node >= len(first)].append(part)
+
+    tasks = []
+    unmatched = []
+    for key, (parts1, parts2) in groups.items():
+        for k, (part1, part2) in enumerate(zip(parts1, parts2)):
+            tasks.append(((key, k), part1, part2, net))
+        for part in parts1[len(parts2):]:
+            unmatched.append(([node for node in part.nodes if node not in leaves1], []))
+        for part in parts2[len(parts1):]:
+            unmatched.append(([], [node for node in part.nodes if node not in leaves2]))
+
+    results = run_batches(tasks, workers)
+
+    failed = {}
+    accepted = []
+    for (key, k), result, elapsed, size in results:
+        if result.equivalent:
+            accepted.append((result, elapsed, size))
+        else:
+            failed.setdefault(key, []).append((k, (result, elapsed, size)))
+    for key, pairs in failed.items():
+        parts1, parts2 = groups[key]
+        free = [k for k, _ in pairs]
+        unpaired = []
+        for own, report in pairs:
+            for k in free:
+                if k == own:
+                    continue
+                start = timer()
+                result = compare_compact(parts1[own], parts2[k], net)
+                if result.equivalent:
+                    accepted.append((result, report[1] + timer() - start, report[2]))
+                    free.remove(k)
+                    break
+            else:
+                unpaired.append((own, report))
+        # Отчёт неудачного сравнения верен, только пока его вторая компонента
+        # никому не досталась; иначе компоненты без пары выдаются целиком
+        for own, report in unpaired:
+            if own in free:
+                accepted.append(report)
+                free.remove(own)
+            else:
+                unmatched.append(([node for node in parts1[own].nodes if node not in leaves1], []))
+        for k in free:
+            unmatched.append(([], [node for node in parts2[k].nodes if node not in leaves2]))
+
+    devices = {}
+    nets = {first.nodes[k1]: second.nodes[k2] for k1, k2 in supplies}
+    individualized = 0
+    timings = []
+    for result, elapsed, size in accepted:
+        devices.update((node1, node2) for node1, node2 in result.devices.items() if node1 not in leaves1)
+        nets.update(result.nets)
+        individualized += result.individualized
+        for nodes1, nodes2 in result.unmatched:
+            unmatched.append(([node for node in nodes1 if node not in leaves1], [node for node in nodes2 if node not in leaves2]))
+        timings.append((size, elapsed))
+    return LVSResult(devices, nets, unmatched, individualized, timings)
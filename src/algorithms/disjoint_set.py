@@ -0,0 +1,29 @@
+class DisjointSet:
+    # Корень множества - наименьший элемент, поэтому порядок групп
+    # совпадает с порядком их первых элементов
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a < root_b:
+            self.parent[root_b] = root_a
+        elif root_b < root_a:
+            self.parent[root_a] = root_b
+
+
+    def groups(self):
+        groups = {}
+        for x in range(len(self.parent)):
+            groups.setdefault(self.find(x), []).append(x)
+        return groups
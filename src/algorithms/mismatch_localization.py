@@ -0,0 +1,235 @@
+import numpy as np
+from src.algorithms.compact_graph import CompactGraph, refine_colours
+
+
+# Цвет вершины после k итераций 1-WL зависит только от её k-окрестности,
+# поэтому дефект портит якоря лишь в радиусе k от себя
+LOCAL_ITERATIONS = 3
+
+# Цепи питания касаются почти всех приборов: изменение их степени иначе
+# испортило бы все локальные раскраски, а разбор их соседей на каждом шаге
+# роста стоил бы квадрат степени. Такие вершины сопоставляются голосованием
+HUB_DEGREE = 64
+
+
+class MismatchReport:
+    # mapping - сопоставленные вершины первого графа -> второго;
+    # unmatched и suspects - пары списков (первый граф, второй граф):
+    # вершины без пары и сопоставленные вершины, у которых разошлись соседи
+    def __init__(self, mapping, unmatched, suspects):
+        self.mapping = mapping
+        self.unmatched = unmatched
+        self.suspects = suspects
+
+
+    @property
+    def consistent(self):
+        return not any(self.unmatched) and not any(self.suspects)
+
+
+    def nodes(self, side):
+        return self.unmatched[side] + self.suspects[side]
+
+
+class MismatchLocalizer:
+    # Сопоставленные области растут от якорей - вершин, чья локальная
+    # раскраска встречается ровно один раз в каждом графе. Сосед x вершины a
+    # сопоставляется соседу y её образа b, если у них одинаковы метка, метка
+    # ребра и образы уже сопоставленных соседей (в строгом проходе ещё и
+    # степень). Что осталось без пары или с разными соседями - и есть дефекты.
+    # supplies - заранее известные пары цепей питания {вершина G1: вершина G2}
+    def __init__(self, first, second, supplies=None):
+        self.graphs = (first, second)
+        self.labels = (first.node_labels.tolist(), second.node_labels.tolist())
+        self.degrees = (first.degrees.tolist(), second.degrees.tolist())
+        self.adjacency = []
+        for graph in self.graphs:
+            indptr, indices, labels = graph.indptr.tolist(), graph.indices.tolist(), graph.edge_labels.tolist()
+            self.adjacency.append([dict(zip(indices[indptr[k]:indptr[k + 1]], labels[indptr[k]:indptr[k + 1]])) for k in range(len(graph))])
+        self.core = ([-1] * len(first), [-1] * len(second))
+        self.hubs = tuple(graph.degrees > HUB_DEGREE for graph in self.graphs)
+        self.supplies = [(first.index[a], second.index[b]) for a, b in (supplies or {}).items() if a in first.index and b in second.index]
+        for a, b in self.supplies:
+            # Объявленная цепь питания - концентратор при любой степени
+            self.hubs[0][a] = self.hubs[1][b] = True
+        self.is_hub = tuple(hubs.tolist() for hubs in self.hubs)
+
+
+    def anchors(self, seed=None):
+        pairs = []
+        for a, b in (seed or {}).items():
+            a, b = self.graphs[0].index.get(a), self.graphs[1].index.get(b)
+            if a is not None and b is not None:
+                pairs.append((a, b))
+        for colours in refine_colours(list(self.graphs), LOCAL_ITERATIONS, self.hubs):
+            pass
+        self.colours = colours
+        first, second = colours
+        size = int(max(first.max(initial=-1), second.max(initial=-1))) + 1
+        unique = np.flatnonzero((np.bincount(first, minlength=size) == 1) & (np.bincount(second, minlength=size) == 1))
+        position = np.full(size, -1, dtype=np.int64)
+        position[second] = np.arange(len(second))
+        pairs.extend(zip(np.flatnonzero(np.isin(first, unique)).tolist(), position[first[np.isin(first, unique)]].tolist()))
+        return pairs
+
+
+    def match(self, a, b):
+        if self.core[0][a] >= 0 or self.core[1][b] >= 0 or self.labels[0][a] != self.labels[1][b]:
+            return False
+        self.core[0][a] = b
+        self.core[1][b] = a
+        return True
+
+
+    def key(self, side, x, label, strict):
+        # Соседи описываются номерами вершин первого графа
+        core = self.core[side]
+        images = frozenset((core[y] if side else y, edge) for y, edge in self.adjacency[side][x].items() if core[y] >= 0)
+        return self.labels[side][x], label, self.degrees[side][x] if strict else None, images
+
+
+    def groups(self, pair, strict):
+        result = []
+        for side, node in enumerate(pair):
+            groups = {}
+            core = self.core[side]
+            is_hub = self.is_hub[side]
+            for x, label in self.adjacency[side][node].items():
+                if core[x] < 0 and not is_hub[x]:
+                    groups.setdefault(self.key(side, x, label, strict), []).append(x)
+            result.append(groups)
+        return result
+
+
+    def grow(self, queue, strict):
+        deferred = []
+        while queue or deferred:
+            if not queue:
+                # Однозначные продолжения кончились - неразличимые соседи
+                # (например, параллельные транзисторы) сопоставляются по порядку
+                pair = deferred.pop()
+                first, second = self.groups(pair, strict)
+                for key, nodes in first.items():
+                    others = second.get(key)
+                    if others and len(others) == len(nodes) > 1:
+                        for a, b in zip(nodes, others):
+                            if self.match(a, b):
+                                queue.append((a, b))
+                        deferred.append(pair)
+                        break
+                continue
+
+            pair = queue.pop()
+            first, second = self.groups(pair, strict)
+            ambiguous = False
+            for key, nodes in first.items():
+                others = second.get(key)
+                if not others or len(others) != len(nodes):
+                    continue
+                if len(nodes) > 1:
+                    ambiguous = True
+                elif self.match(nodes[0], others[0]):
+                    queue.append((nodes[0], others[0]))
+            if ambiguous:
+                deferred.append(pair)
+
+
+    def match_hubs(self):
+        # Каждая несопоставленная цепь питания голосует соседями: образы её
+        # сопоставленных соседей указывают на цепь второго графа
+        core = self.core[0]
+        hubs = [y for y in np.flatnonzero(self.hubs[1]).tolist() if self.core[1][y] < 0]
+        matched = []
+        for x in np.flatnonzero(self.hubs[0]).tolist():
+            if core[x] >= 0:
+                continue
+            votes = {}
+            for neighbour, label in self.adjacency[0][x].items():
+                image = core[neighbour]
+                if image < 0:
+                    continue
+                for y in hubs:
+                    if self.adjacency[1][image].get(y) == label:
+                        votes[y] = votes.get(y, 0) + 1
+            for y in sorted(votes, key=votes.get, reverse=True):
+                if self.match(x, y):
+                    matched.append((x, y))
+                    break
+        return matched
+
+
+    def tied_classes(self):
+        # Классы локальных цветов, в которых вершин больше одной: у
+        # повторяющихся блоков уникальных якорей нет. Сначала идут классы
+        # с равным числом вершин в двух графах, среди них - меньшие
+        classes = {}
+        for side, colours in enumerate(self.colours):
+            for node, colour in enumerate(colours.tolist()):
+                if not self.is_hub[side][node]:
+                    classes.setdefault(colour, ([], []))[side].append(node)
+        tied = [nodes for nodes in classes.values() if nodes[0] and nodes[1]]
+        tied.sort(key=lambda nodes: (len(nodes[0]) != len(nodes[1]), len(nodes[0]) + len(nodes[1])))
+        return tied
+
+
+    def ties(self):
+        # Пары для индивидуализации, как в PartitionRefinement: первые ещё
+        # не сопоставленные вершины наименьшего класса, в котором их поровну
+        # в обоих графах. У дефекта классы расходятся и не трогаются
+        for nodes in self.tied_classes():
+            while True:
+                free = [[node for node in nodes[side] if self.core[side][node] < 0] for side in (0, 1)]
+                if not free[0] or len(free[0]) != len(free[1]):
+                    break
+                yield free[0][0], free[1][0]
+
+
+    def frontier(self):
+        core = self.core[0]
+        return [(a, b) for a, b in enumerate(core) if b >= 0 and
+                (any(core[x] < 0 for x in self.adjacency[0][a]) or any(self.core[1][y] < 0 for y in self.adjacency[1][b]))]
+
+
+    def run(self, seed=None):
+        # Цепи питания сопоставляются первыми и служат неподвижными якорями,
+        # но строгий рост от них не идёт: он обходил бы почти все приборы
+        for pair in self.supplies:
+            self.match(*pair)
+        queue = [pair for pair in self.anchors(seed) if self.match(*pair) and not self.is_hub[0][pair[0]]]
+        self.grow(queue, strict=True)
+        self.match_hubs()
+        self.grow(self.frontier(), strict=False)
+        # Рост остановился, а вершины без пары остались - одна пара из
+        # наименьшего неразличимого класса становится якорем, рост продолжается
+        tied = False
+        for pair in self.ties():
+            if self.match(*pair):
+                tied = True
+                self.grow([pair], strict=True)
+        if tied:
+            self.grow(self.frontier(), strict=False)
+
+
+    def report(self):
+        first, second = self.graphs
+        core = self.core[0]
+        unmatched = ([first.nodes[a] for a, b in enumerate(core) if b < 0],
+                     [second.nodes[b] for b, a in enumerate(self.core[1]) if a < 0])
+        suspects = ([], [])
+        for a, b in enumerate(core):
+            if b < 0:
+                continue
+            edges1 = {(x, label) for x, label in self.adjacency[0][a].items() if core[x] >= 0}
+            edges2 = {(self.core[1][y], label) for y, label in self.adjacency[1][b].items() if self.core[1][y] >= 0}
+            if edges1 != edges2 or self.degrees[0][a] != self.degrees[1][b]:
+                suspects[0].append(first.nodes[a])
+                suspects[1].append(second.nodes[b])
+        mapping = {first.nodes[a]: second.nodes[b] for a, b in enumerate(core) if b >= 0}
+        return MismatchReport(mapping, unmatched, suspects)
+
+
+def localize_mismatches(G1, G2, seed=None, supplies=None):
+    vocabulary = {}
+    localizer = MismatchLocalizer(CompactGraph.from_networkx(G1, vocabulary), CompactGraph.from_networkx(G2, vocabulary), supplies)
+    localizer.run(seed)
+    return localizer.report()
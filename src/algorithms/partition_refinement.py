@@ -0,0 +1,228 @@
+import heapq
+from src.algorithms.compact_graph import CompactGraph
+
+
+NET_LABEL = "bus"
+
+
+class LVSResult:
+    # Итог сравнения: соответствие приборов и цепей первого графа второму
+    # и классы, в которых число вершин двух графов разошлось; timings -
+    # (число вершин, секунды) для каждой сравненной пары компонент
+    def __init__(self, devices, nets, unmatched, individualized, timings=None):
+        self.devices = devices
+        self.nets = nets
+        self.unmatched = unmatched
+        self.individualized = individualized
+        self.timings = [] if timings is None else timings
+
+
+    @property
+    def equivalent(self):
+        return not self.unmatched
+
+
+class PartitionRefinement:
+    # Совместное уточнение разбиения вершин двух графов (как в Gemini):
+    # класс дробится по числу соседей в классе-разделителе отдельно для
+    # каждой метки ребра, в очередь идут все части, кроме наибольшей.
+    # Вершины 0..n1-1 - первый граф, дальше - второй. Разбиение только
+    # дробится, поэтому откат - это слияние классов в обратном порядке
+    def __init__(self, first, second):
+        self.size = len(first)
+        self.adjacency = []
+        for graph, shift in ((first, 0), (second, len(first))):
+            indptr, indices, labels = graph.indptr.tolist(), graph.indices.tolist(), graph.edge_labels.tolist()
+            self.adjacency.extend([(index + shift, label) for index, label in zip(indices[indptr[k]:indptr[k + 1]], labels[indptr[k]:indptr[k + 1]])]
+                                  for k in range(len(graph)))
+
+        self.colour = [0] * len(self.adjacency)
+        self.members = []
+        self.trail = []
+        self.queue = []
+        self.queued = []
+        self.ties = []
+        classes = {}
+        for node, label in enumerate(first.node_labels.tolist() + second.node_labels.tolist()):
+            colour = classes.get(label)
+            if colour is None:
+                colour = classes[label] = self.new_class()
+                self.push(colour)
+            self.colour[node] = colour
+            self.members[colour].add(node)
+        for colour in range(len(self.members)):
+            self.note_tie(colour)
+
+
+    def new_class(self):
+        self.members.append(set())
+        self.queued.append(False)
+        return len(self.members) - 1
+
+
+    def push(self, colour):
+        if not self.queued[colour]:
+            self.queued[colour] = True
+            self.queue.append(colour)
+
+
+    def note_tie(self, colour):
+        if len(self.members[colour]) > 2:
+            heapq.heappush(self.ties, (len(self.members[colour]), colour))
+
+
+    def sides(self, colour):
+        nodes = self.members[colour]
+        first = sum(1 for node in nodes if node < self.size)
+        return first, len(nodes) - first
+
+
+    def move(self, nodes, source):
+        target = self.new_class()
+        self.members[source].difference_update(nodes)
+        self.members[target].update(nodes)
+        for node in nodes:
+            self.colour[node] = target
+        self.trail.append((target, source))
+        return target
+
+
+    def split(self, splitter):
+        counts = {}
+        for node in self.members[splitter]:
+            for neighbour, label in self.adjacency[node]:
+                row = counts.get(neighbour)
+                if row is None:
+                    row = counts[neighbour] = {}
+                row[label] = row.get(label, 0) + 1
+
+        touched = {}
+        for node, row in counts.items():
+            touched.setdefault(self.colour[node], {}).setdefault(tuple(sorted(row.items())), []).append(node)
+
+        created = []
+        for colour, groups in touched.items():
+            rest = len(self.members[colour]) - sum(len(nodes) for nodes in groups.values())
+            if rest == 0 and len(groups) == 1:
+                continue
+            parts = sorted(groups.values(), key=len, reverse=True)
+            if rest == 0:
+                # Самая большая группа остаётся под старым номером класса
+                parts = parts[1:]
+            was_queued = self.queued[colour]
+            new = [self.move(nodes, colour) for nodes in parts]
+            created.extend(new)
+            if was_queued:
+                for part in new:
+                    self.push(part)
+            else:
+                largest = max([colour] + new, key=lambda part: len(self.members[part]))
+                for part in [colour] + new:
+                    if part != largest:
+                        self.push(part)
+            self.note_tie(colour)
+            for part in new:
+                self.note_tie(part)
+        return created
+
+
+    def refine(self):
+        changed = []
+        while self.queue:
+            splitter = self.queue.pop()
+            self.queued[splitter] = False
+            changed.extend(self.split(splitter))
+        return changed
+
+
+    def balanced(self, colours):
+        return all(first == second for first, second in map(self.sides, colours))
+
+
+    def undo(self, checkpoint):
+        while len(self.trail) > checkpoint:
+            target, source = self.trail.pop()
+            nodes = self.members.pop()
+            self.queued.pop()
+            self.members[source].update(nodes)
+            for node in nodes:
+                self.colour[node] = source
+        for colour in self.queue:
+            self.queued[colour] = False
+        self.queue.clear()
+
+
+    def individualize(self, first, second):
+        # Пара вершин одного класса выносится в отдельный класс и становится разделителем
+        colour = self.colour[first]
+        checkpoint = len(self.trail)
+        single = self.move([first, second], colour)
+        self.push(single)
+        self.note_tie(colour)
+        changed = self.refine() + [colour, single]
+        return checkpoint, self.balanced(changed)
+
+
+    def next_tie(self):
+        while self.ties:
+            size, colour = heapq.heappop(self.ties)
+            if colour < len(self.members) and len(self.members[colour]) == size and size > 2 and self.balanced([colour]):
+                return colour
+        return None
+
+
+    def run(self):
+        self.refine()
+        individualized = 0
+        if self.balanced(range(len(self.members))):
+            # Неразличимые вершины сопоставляются по одной; если выбор
+            # нарушил равновесие классов, пробуется следующая вершина
+            # второго графа, иначе расхождение остаётся в отчёте
+            colour = self.next_tie()
+            while colour is not None:
+                nodes = sorted(self.members[colour])
+                first = nodes[0]
+                candidates = [node for node in nodes if node >= self.size]
+                for second in candidates:
+                    checkpoint, balanced = self.individualize(first, second)
+                    individualized += 1
+                    if balanced:
+                        break
+                    self.undo(checkpoint)
+                    self.note_tie(colour)
+                else:
+                    self.individualize(first, candidates[0])
+                    break
+                colour = self.next_tie()
+        return individualized
+
+
+    def classes(self):
+        for nodes in self.members:
+            if nodes:
+                yield sorted(node for node in nodes if node < self.size), sorted(node - self.size for node in nodes if node >= self.size)
+
+
+def compare_compact(first, second, net):
+    # net - код метки цепи в общем словаре графов
+    refinement = PartitionRefinement(first, second)
+    individualized = refinement.run()
+
+    devices = {}
+    nets = {}
+    unmatched = []
+    labels = first.node_labels.tolist()
+    for nodes1, nodes2 in refinement.classes():
+        if len(nodes1) == 1 and len(nodes2) == 1:
+            target = nets if labels[nodes1[0]] == net else devices
+            target[first.nodes[nodes1[0]]] = second.nodes[nodes2[0]]
+        elif len(nodes1) != len(nodes2):
+            unmatched.append(([first.nodes[k] for k in nodes1], [second.nodes[k] for k in nodes2]))
+    return LVSResult(devices, nets, unmatched, individualized)
+
+
+def compare_graphs(G1, G2):
+    vocabulary = {}
+    first = CompactGraph.from_networkx(G1, vocabulary)
+    second = CompactGraph.from_networkx(G2, vocabulary)
+    return compare_compact(first, second, vocabulary.get(NET_LABEL))
@@ -0,0 +1,106 @@
+import numpy as np
+from src.algorithms.compact_graph import CompactGraph, mix, segment_sums
+from src.algorithms.partition_refinement import NET_LABEL
+from src.algorithms.vf2 import CompiledTarget
+from src.algorithms.vf2pp import SearchState, TargetState, back_edges, csr_groups, matching_order
+
+
+def root_keys(graph):
+    # Инвариант вершины для индекса опор: метка, степень и хэш мультимножества
+    # (метка ребра, метка соседа). У прибора, все выводы которого входят в
+    # ячейку, он одинаков в образце и в его образе в графе топологии
+    labels = graph.node_labels.astype(np.uint64)
+    neighbours = mix((labels[graph.indices] << np.uint64(32)) + graph.edge_labels.astype(np.uint64))
+    own = mix(labels + (graph.degrees.astype(np.uint64) << np.uint64(32)))
+    return mix(own + segment_sums(neighbours, graph.indptr))
+
+
+class LibraryMatches:
+    # placements - для каждой ячейки библиотеки список отображений
+    # {вершина графа: вершина образца}, как у subgraph_embeddings
+    def __init__(self, placements):
+        self.placements = placements
+
+
+    @property
+    def counts(self):
+        return {name: len(mappings) for name, mappings in self.placements.items()}
+
+
+class PatternLibrary:
+    # Набор ячеек, скомпилированных один раз: у каждой ячейки для каждого её
+    # прибора заранее вычислены порядок сопоставления с этим прибором в корне
+    # и обратные рёбра. Индекс root_keys -> (ячейка, порядок) позволяет за
+    # один проход по графу пробовать в каждой вершине только ячейки, у
+    # которых есть прибор с тем же инвариантом
+    def __init__(self, induced=True):
+        self.induced = induced
+        self.vocabulary = {}
+        self.names = []
+        self.patterns = []
+        self.edges = []
+        self.index = {}
+
+
+    def add(self, name, graph):
+        pattern = CompactGraph.from_networkx(graph, self.vocabulary)
+        roots = np.flatnonzero(pattern.node_labels != self.vocabulary.get(NET_LABEL, -1))
+        if not len(roots):
+            raise ValueError(f"Pattern without devices: {name}")
+        number = len(self.patterns)
+        self.names.append(name)
+        self.patterns.append(pattern)
+        owners = np.repeat(np.arange(len(pattern)), pattern.degrees)
+        forward = owners < pattern.indices
+        self.edges.append(list(zip(owners[forward].tolist(), pattern.indices[forward].tolist())))
+
+        rarity = np.bincount(pattern.node_labels)[pattern.node_labels]
+        keys = root_keys(pattern)
+        for root in roots.tolist():
+            order = matching_order(pattern, rarity, root)
+            entries = self.index.setdefault(int(keys[root]), [])
+            entries.append((number, int(pattern.degrees[root]), order) + back_edges(pattern, order))
+            # Сначала пробуются большие ячейки: иначе инвертор, входящий
+            # в and_2, занял бы её приборы раньше
+            entries.sort(key=lambda entry: -len(self.patterns[entry[0]]))
+
+
+    def search(self, graph):
+        # Экземпляры не делят рёбер (общие цепи вроде питания разделяются),
+        # как в subgraph_embeddings; каждый прибор графа - опора не больше
+        # одного раза. graph - граф networkx или CompiledTarget, у которого
+        # берётся уже построенный CompactGraph с перекодированными метками
+        if isinstance(graph, CompiledTarget):
+            target = graph.graph.translate(graph.vocabulary, self.vocabulary)
+        else:
+            target = CompactGraph.from_networkx(graph, self.vocabulary)
+        colour_ptr, colour_nodes = csr_groups(target.node_labels, len(self.vocabulary))
+        state = TargetState(target.indptr, target.indices, target.edge_labels, target.node_labels, target.degrees,
+                            colour_ptr, colour_nodes)
+        searches = {}
+        placements = {name: [] for name in self.names}
+
+        keys = root_keys(target)
+        anchors = np.flatnonzero(np.isin(keys, np.fromiter(self.index, dtype=np.uint64, count=len(self.index))))
+        for x in anchors.tolist():
+            for entry in self.index[int(keys[x])]:
+                number, degree, order, back_ptr, back_nodes, back_labels = entry
+                if state.degrees[x] != degree:
+                    # Рёбра прибора уже заняты найденным экземпляром
+                    break
+                search = searches.get(id(entry))
+                if search is None:
+                    pattern = self.patterns[number]
+                    search = searches[id(entry)] = SearchState(order, back_ptr, back_nodes, back_labels,
+                                                               pattern.node_labels, pattern.degrees, state, self.induced)
+                core = next(search.matches([x]), None)
+                if core is None:
+                    continue
+                pattern = self.patterns[number]
+                placements[self.names[number]].append({target.nodes[v]: pattern.nodes[u] for u, v in enumerate(core)})
+                images = [(core[u], core[w]) for u, w in self.edges[number]]
+                search.clear()
+                for v, w in images:
+                    state.remove_edge(v, w)
+                break
+        return LibraryMatches(placements)
@@ -0,0 +1,132 @@
+from networkx import Graph
+from src.algorithms.compact_graph import CompactGraph
+
+
+DEVICE_LABELS = ("N", "P")
+BUS_EDGE = "bus"
+
+
+def combine(first, second):
+    # Кратное ребро хранится одним ребром с составной меткой ("bus+gate"),
+    # чтобы после слияний не терялось, чем цепь подключена к прибору
+    if first is None:
+        return second
+    return "+".join(sorted(first.split("+") + second.split("+")))
+
+
+class SeriesParallelReduction:
+    # Последовательные и параллельные слияния транзисторов до неподвижной
+    # точки. Вершины хранятся по номерам CompactGraph, соседи - словарями
+    # {сосед: метка ребра}; слитая вершина занимает место одной из исходных.
+    # После слияния в очередь идут только затронутые вершины: прибор -
+    # искать параллельных ему, его цепи - искать последовательное соединение.
+    # provenance - исходные приборы, вошедшие в каждую вершину
+    def __init__(self, graph, vocabulary):
+        names = {code: label for label, code in vocabulary.items()}
+        indptr, indices = graph.indptr.tolist(), graph.indices.tolist()
+        edge_labels = [names[code] for code in graph.edge_labels.tolist()]
+        self.nodes = graph.nodes
+        self.labels = [names[code] for code in graph.node_labels.tolist()]
+        self.adjacency = [dict(zip(indices[indptr[k]:indptr[k + 1]], edge_labels[indptr[k]:indptr[k + 1]])) for k in range(len(graph))]
+        self.alive = [True] * len(graph)
+        self.provenance = [[name] if label in DEVICE_LABELS else None for name, label in zip(self.nodes, self.labels)]
+        self.queue = list(range(len(graph) - 1, -1, -1))
+        self.queued = [True] * len(graph)
+
+
+    def push(self, node):
+        if not self.queued[node]:
+            self.queued[node] = True
+            self.queue.append(node)
+
+
+    def touch(self, device):
+        self.push(device)
+        for net in self.adjacency[device]:
+            self.push(net)
+
+
+    def terminals(self, device):
+        return sum(label.split("+").count(BUS_EDGE) for label in self.adjacency[device].values())
+
+
+    def remove(self, target, source):
+        # source удаляется, его исходные приборы переходят к target
+        row = self.adjacency[source]
+        for x in row:
+            del self.adjacency[x][source]
+        self.adjacency[source] = {}
+        self.alive[source] = False
+        self.provenance[target].extend(self.provenance[source])
+        self.provenance[source] = None
+        return row
+
+
+    def series(self, net):
+        # Цепь только между двумя выводами двух однотипных приборов,
+        # у каждого из которых ровно два вывода, исчезает вместе с одним из них
+        row = self.adjacency[net]
+        if len(row) != 2 or any(label != BUS_EDGE for label in row.values()):
+            return False
+        first, second = row
+        if self.labels[first] != self.labels[second] or self.labels[first] not in DEVICE_LABELS:
+            return False
+        if self.terminals(first) != 2 or self.terminals(second) != 2:
+            return False
+        if self.adjacency[first] == self.adjacency[second]:
+            # Те же соседи - это параллельное соединение, его сольёт parallel
+            return False
+        adjacency = self.adjacency[first]
+        for x, label in self.remove(first, second).items():
+            if x != net:
+                adjacency[x] = self.adjacency[x][first] = combine(adjacency.get(x), label)
+        del adjacency[net]
+        self.adjacency[net] = {}
+        self.alive[net] = False
+        self.touch(first)
+        return True
+
+
+    def parallel(self, device):
+        # Параллельные приборы - те же метка и соседи с теми же метками рёбер;
+        # кандидаты берутся у цепи прибора с наименьшим числом соседей
+        row = self.adjacency[device]
+        if self.labels[device] not in DEVICE_LABELS or not row:
+            return False
+        net = min(row, key=lambda x: len(self.adjacency[x]))
+        partners = [x for x in self.adjacency[net] if x != device and self.labels[x] == self.labels[device] and self.adjacency[x] == row]
+        for partner in partners:
+            self.remove(device, partner)
+        if partners:
+            self.touch(device)
+        return bool(partners)
+
+
+    def run(self):
+        merges = 0
+        while self.queue:
+            node = self.queue.pop()
+            self.queued[node] = False
+            if self.alive[node] and (self.parallel(node) if self.labels[node] in DEVICE_LABELS else self.series(node)):
+                merges += 1
+        return merges
+
+
+    def graph(self):
+        nx_graph = Graph()
+        nx_graph.add_nodes_from((self.nodes[k], {"label": self.labels[k]}) for k in range(len(self.nodes)) if self.alive[k])
+        nx_graph.add_edges_from((self.nodes[k], self.nodes[x], {"label": label})
+                                for k in range(len(self.nodes)) if self.alive[k] for x, label in self.adjacency[k].items() if k < x)
+        return nx_graph
+
+
+    def origins(self):
+        return {self.nodes[k]: devices for k, devices in enumerate(self.provenance) if devices is not None}
+
+
+def reduce_series_parallel(nx_graph):
+    # Возвращает сжатый граф и {прибор сжатого графа: исходные приборы}
+    vocabulary = {}
+    reduction = SeriesParallelReduction(CompactGraph.from_networkx(nx_graph, vocabulary), vocabulary)
+    reduction.run()
+    return reduction.graph(), reduction.origins()
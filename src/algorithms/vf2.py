@@ -1,20 +1,53 @@
 from networkx.algorithms import isomorphism
+from src.algorithms.compact_graph import CompactGraph
+from src.algorithms.vf2pp import NeighbourhoodIndex, Vf2ppMatcher
 from timeit import default_timer as timer
 
 
+def match_compact(subgraph, graph, induced):
+    # Метки переводятся в целые один раз, сопоставление идёт без обращений
+    # к атрибутам networkx
+    vocabulary = {}
+    target = CompactGraph.from_networkx(graph, vocabulary)
+    pattern = CompactGraph.from_networkx(subgraph, vocabulary)
+    matcher = Vf2ppMatcher(pattern, target, induced)
+    return matcher.match(), matcher.mapping()
+
+
+class CompiledTarget:
+    # Граф, в котором вложения ищутся многократно: CompactGraph, словарь
+    # меток и индекс окрестностей строятся один раз. Образец получает копию
+    # словаря, поэтому коды меток графа не меняются
+    def __init__(self, graph):
+        self.vocabulary = {}
+        self.graph = CompactGraph.from_networkx(graph, self.vocabulary)
+        self.index = None
+
+
+    def matcher(self, subgraph, induced=True):
+        if self.index is None:
+            self.index = NeighbourhoodIndex(self.graph)
+        pattern = CompactGraph.from_networkx(subgraph, dict(self.vocabulary))
+        return Vf2ppMatcher(pattern, self.graph, induced, self.index)
+
+
+    def embeddings(self, subgraph, induced=True, overlapping=False):
+        yield from self.matcher(subgraph, induced).embeddings(overlapping)
+
+
+def subgraph_embeddings(subgraph, graph, induced=True, overlapping=False):
+    # Генератор отображений {вершина графа: вершина образца} для всех
+    # вложений, найденных за один обход; graph - граф networkx или
+    # CompiledTarget, если в нём уже искали
+    target = graph if isinstance(graph, CompiledTarget) else CompiledTarget(graph)
+    yield from target.embeddings(subgraph, induced, overlapping)
+
+
 def subgraph_monomorphism(subgraph, graph):
-    def node_match(node1, node2):
-        return node1.get('label') == node2.get('label')
-    
-    def edge_match(edge1, edge2):
-        return edge1.get('label') == edge2.get('label')
-    
     start_time = timer()
 
-    matcher = isomorphism.GraphMatcher(graph, subgraph, node_match=node_match, edge_match=edge_match)
-    is_isomorphic = matcher.subgraph_is_monomorphic()
-    
-    mapping = matcher.mapping
+    is_isomorphic, mapping = match_compact(subgraph, graph, induced=False)
+
     end_time = timer()
     elapsed_time = end_time - start_time
 
@@ -22,18 +55,10 @@ def subgraph_monomorphism(subgraph, graph):
 
 
 def subgraph_isomorphism(subgraph, graph):
-    def node_match(node1, node2):
-        return node1.get('label') == node2.get('label')
-    
-    def edge_match(edge1, edge2):
-        return edge1.get('label') == edge2.get('label')
-    
     start_time = timer()
 
-    matcher = isomorphism.GraphMatcher(graph, subgraph, node_match=node_match, edge_match=edge_match)
-    is_isomorphic = matcher.subgraph_is_isomorphic()
-    
-    mapping = matcher.mapping
+    is_isomorphic, mapping = match_compact(subgraph, graph, induced=True)
+
     end_time = timer()
     elapsed_time = end_time - start_time
 
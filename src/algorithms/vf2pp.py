@@ -0,0 +1,401 @@
+import heapq
+import importlib
+import numpy as np
+from src.algorithms.compact_graph import neighbourhood_profiles, refine_colours
+
+try:
+    native = importlib.import_module("vf2pp_cpp")
+except ImportError:
+    native = None
+
+# Длинные цепочки одинаковых ячеек дробятся 1-WL по одной вершине за итерацию;
+# для выбора кандидатов хватает нескольких итераций
+REFINE_ITERATIONS = 16
+
+# Сколько наибольших степеней соседей по каждой метке ребра входит в профиль
+PROFILE_WIDTH = 3
+
+
+def csr_groups(keys, size):
+    # Номера элементов, сгруппированные по ключу: group_nodes[group_ptr[k]:group_ptr[k + 1]]
+    order = np.argsort(keys, kind="stable")
+    ptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=ptr[1:])
+    return ptr, order.astype(np.int64)
+
+
+def matching_order(pattern, rarity, root=None):
+    # Следующей берётся вершина с наибольшим числом связей с уже
+    # упорядоченными, затем та, чей упорядоченный сосед имеет наименьшую
+    # степень (кандидаты берутся из соседей его образа), затем с самой
+    # редкой меткой и наибольшей степенью. Строгие уровни обхода в ширину
+    # здесь не годятся: после шины питания в порядок подряд попали бы все
+    # транзисторы на ней. root - вершина, с которой порядок обязан начаться
+    n = len(pattern)
+    degrees = pattern.degrees.tolist()
+    indptr, indices = pattern.indptr.tolist(), pattern.indices.tolist()
+    rarity = rarity.tolist()
+    connections = [0] * n
+    anchor = [0] * n
+    placed = [False] * n
+    order = []
+
+    starts = sorted(range(n), key=lambda k: (rarity[k], -degrees[k]))
+    if root is not None:
+        starts.insert(0, root)
+    for start in starts:
+        if placed[start]:
+            continue
+        heap = [(0, 0, rarity[start], -degrees[start], start)]
+        while heap:
+            links, smallest, _, _, k = heapq.heappop(heap)
+            if placed[k] or -links != connections[k] or smallest != anchor[k]:
+                continue
+            placed[k] = True
+            order.append(k)
+            for j in indices[indptr[k]:indptr[k + 1]]:
+                if not placed[j]:
+                    anchor[j] = degrees[k] if connections[j] == 0 else min(anchor[j], degrees[k])
+                    connections[j] += 1
+                    heapq.heappush(heap, (-connections[j], anchor[j], rarity[j], -degrees[j], j))
+    return np.array(order, dtype=np.int64)
+
+
+def back_edges(pattern, order):
+    # Для каждой позиции порядка - рёбра к вершинам, стоящим раньше
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    owner = np.repeat(np.arange(len(pattern)), pattern.degrees)
+    earlier = position[pattern.indices] < position[owner]
+    owners = position[owner[earlier]]
+    ptr, group = csr_groups(owners, len(order))
+    return ptr, pattern.indices[earlier][group], pattern.edge_labels[earlier][group]
+
+
+class NeighbourhoodIndex:
+    # Инвертированный индекс графа, в котором ищутся вложения: метка ->
+    # различные профили окрестности этой метки -> вершины с таким профилем.
+    # Кандидаты вершины образца - вершины её метки, профиль которых не
+    # меньше её профиля; профилей намного меньше, чем вершин
+    def __init__(self, graph, width=PROFILE_WIDTH):
+        self.size = int(max(graph.node_labels.max(initial=-1), graph.edge_labels.max(initial=-1))) + 1
+        self.width = width
+        profiles = neighbourhood_profiles(graph, self.size, width)
+        self.groups = {}
+        for label in np.unique(graph.node_labels).tolist():
+            nodes = np.flatnonzero(graph.node_labels == label)
+            rows = profiles[nodes]
+            # np.unique(axis=0) сортирует строки как байты и здесь в разы
+            # медленнее lexsort по ненулевым столбцам
+            columns = np.flatnonzero(rows.any(axis=0)) if rows.any() else np.zeros(1, dtype=np.int64)
+            order = np.lexsort(rows[:, columns].T[::-1])
+            rows, nodes = rows[order], nodes[order]
+            starts = np.flatnonzero(np.any(np.diff(rows[:, columns], axis=0, prepend=-1), axis=1))
+            ptr = np.append(starts, len(nodes)).astype(np.int64)
+            self.groups[label] = (rows[starts], ptr, nodes)
+
+
+    def profiles(self, pattern):
+        # Профили образца в тех же столбцах или None, если у образца есть
+        # метки, которых в графе нет вовсе
+        if max(pattern.node_labels.max(initial=-1), pattern.edge_labels.max(initial=-1)) >= self.size:
+            return None
+        return neighbourhood_profiles(pattern, self.size, self.width)
+
+
+    def fitting(self, label, profile):
+        unique, ptr, _ = self.groups.get(label, (np.zeros((0, len(profile)), dtype=np.int32), np.zeros(1, dtype=np.int64), None))
+        return np.flatnonzero((unique >= profile).all(axis=1)), ptr
+
+
+    def count(self, label, profile):
+        fits, ptr = self.fitting(label, profile)
+        return int((ptr[fits + 1] - ptr[fits]).sum())
+
+
+    def candidates(self, label, profile):
+        fits, ptr = self.fitting(label, profile)
+        if not len(fits):
+            return np.zeros(0, dtype=np.int64)
+        nodes = self.groups[label][2]
+        return np.concatenate([nodes[ptr[k]:ptr[k + 1]] for k in fits.tolist()])
+
+
+class TargetState:
+    # Граф, в котором ищутся вложения, в виде, удобном для перебора на Python:
+    # словари соседей, текущие степени и занятые вершины. Одно состояние
+    # могут по очереди использовать поиски разных образцов
+    def __init__(self, target_ptr, target_nodes, target_labels, target_colours, target_degrees, colour_ptr, colour_nodes):
+        ptr, nodes, labels = target_ptr.tolist(), target_nodes.tolist(), target_labels.tolist()
+        self.adjacency = [dict(zip(nodes[ptr[v]:ptr[v + 1]], labels[ptr[v]:ptr[v + 1]])) for v in range(len(ptr) - 1)]
+        self.colours, self.degrees = target_colours.tolist(), target_degrees.tolist()
+        self.colour_ptr, self.colour_nodes = colour_ptr.tolist(), colour_nodes.tolist()
+        self.core = [-1] * len(self.colours)
+
+
+    def remove_edge(self, v, x):
+        del self.adjacency[v][x]
+        del self.adjacency[x][v]
+        self.degrees[v] -= 1
+        self.degrees[x] -= 1
+
+
+class SearchState:
+    # Тот же поиск в глубину, что и в vf2pp_cpp, но на Python: его можно
+    # продолжить после найденного вложения и убрать из графа рёбра, занятые
+    # уже принятыми вложениями, не начиная перебор заново
+    def __init__(self, order, back_ptr, back_nodes, back_labels, pattern_colours, pattern_degrees, target, induced):
+        self.order = order.tolist()
+        self.back_ptr, self.back_nodes, self.back_labels = back_ptr.tolist(), back_nodes.tolist(), back_labels.tolist()
+        self.pattern_colours, self.pattern_degrees = pattern_colours.tolist(), pattern_degrees.tolist()
+        self.target = target
+        self.target_colours, self.target_degrees = target.colours, target.degrees
+        self.colour_ptr, self.colour_nodes = target.colour_ptr, target.colour_nodes
+        self.adjacency = target.adjacency
+        self.induced = induced
+
+        self.core_p = [-1] * len(self.pattern_colours)
+        self.core_g = target.core
+        self.resume = None
+        self.first_back = next((k for k in range(len(self.order)) if self.back_ptr[k] < self.back_ptr[k + 1]), None)
+
+
+    @classmethod
+    def from_arguments(cls, *arguments):
+        # Аргументы в том же порядке, что у vf2pp_cpp.search
+        return cls(*arguments[:6], TargetState(*arguments[6:13]), arguments[13])
+
+
+    def feasible(self, u, v, depth):
+        if self.core_g[v] >= 0 or self.target_colours[v] != self.pattern_colours[u] or self.target_degrees[v] < self.pattern_degrees[u]:
+            return False
+        row = self.adjacency[v]
+        core_p, back_nodes, back_labels = self.core_p, self.back_nodes, self.back_labels
+        begin, end = self.back_ptr[depth], self.back_ptr[depth + 1]
+        for k in range(begin, end):
+            if row.get(core_p[back_nodes[k]]) != back_labels[k]:
+                return False
+        if not self.induced:
+            return True
+        # Для порождённого подграфа других занятых соседей у v быть не должно.
+        # Они считаются по меньшему из списков - соседям v или уже
+        # сопоставленным вершинам, чтобы не обходить шины питания целиком
+        if len(row) <= depth:
+            mapped = sum(1 for x in row if self.core_g[x] >= 0)
+        else:
+            order = self.order
+            mapped = sum(1 for k in range(depth) if core_p[order[k]] in row)
+        return mapped == end - begin
+
+
+    def candidates(self, depth, roots=None):
+        u = self.order[depth]
+        begin, end = self.back_ptr[depth], self.back_ptr[depth + 1]
+        if begin == end:
+            if depth == 0 and roots is not None:
+                return iter(roots)
+            colour = self.pattern_colours[u]
+            return iter(self.colour_nodes[self.colour_ptr[colour]:self.colour_ptr[colour + 1]])
+        # Кандидаты - соседи образа той уже сопоставленной вершины,
+        # у которой меньше всего соседей; список снимается сразу, потому
+        # что рёбра могут удаляться во время перебора
+        k = min(range(begin, end), key=lambda k: self.target_degrees[self.core_p[self.back_nodes[k]]])
+        label = self.back_labels[k]
+        return iter([x for x, edge in self.adjacency[self.core_p[self.back_nodes[k]]].items() if edge == label])
+
+
+    def assign(self, u, v):
+        self.core_p[u] = v
+        self.core_g[v] = u
+
+
+    def release(self, u):
+        v = self.core_p[u]
+        self.core_p[u] = self.core_g[v] = -1
+
+
+    def remove_edge(self, v, x):
+        # Вызывается между вложениями, когда обе вершины сопоставлены.
+        # Сопоставления глубже первой вершины с обратными рёбрами могли
+        # опираться на это ребро, поэтому перебор вернётся к ней
+        self.resume = self.first_back
+        self.target.remove_edge(v, x)
+
+
+    def clear(self):
+        # Освобождает вершины графа, если перебор брошен на найденном вложении
+        for u in self.order:
+            if self.core_p[u] >= 0:
+                self.release(u)
+
+
+    def matches(self, roots=None):
+        # roots - кандидаты для первой вершины порядка вместо всех вершин её цвета
+        n = len(self.order)
+        candidates = [None] * n
+        depth = 0
+        while depth >= 0:
+            if depth == n:
+                yield self.core_p
+                depth -= 1
+                if self.resume is not None:
+                    for k in range(depth, self.resume, -1):
+                        self.release(self.order[k])
+                        candidates[k] = None
+                    depth = self.resume
+                    self.resume = None
+                continue
+            u = self.order[depth]
+            if candidates[depth] is None:
+                candidates[depth] = self.candidates(depth, roots)
+            else:
+                self.release(u)
+
+            for v in candidates[depth]:
+                if self.feasible(u, v, depth):
+                    self.assign(u, v)
+                    depth += 1
+                    break
+            else:
+                candidates[depth] = None
+                depth -= 1
+
+
+def search_python(*arguments):
+    core = next(SearchState.from_arguments(*arguments).matches(), None)
+    return None if core is None else list(core)
+
+
+class Vf2ppMatcher:
+    # Вложение образца pattern в граф target (оба CompactGraph с общим
+    # словарём меток) в духе VF2++: вершины образца упорядочиваются один раз,
+    # начиная с самой редкой метки и наибольшей степени, кандидаты берутся
+    # только из вершин той же метки или из соседей уже сопоставленных.
+    # induced=True - изоморфизм на порождённый подграф, иначе мономорфизм.
+    # index - NeighbourhoodIndex графа target, если он уже построен
+    def __init__(self, pattern, target, induced=True, index=None):
+        self.pattern = pattern
+        self.target = target
+        self.induced = induced
+        self.index = index
+        self.core = None
+
+
+    def same_size(self):
+        return len(self.pattern) == len(self.target) and self.pattern.number_of_edges() == self.target.number_of_edges()
+
+
+    def colours(self):
+        pattern, target = self.pattern, self.target
+        if self.same_size():
+            # При равных размерах вложение - изоморфизм, и цвета 1-WL
+            # становятся допустимыми метками: классы кандидатов намного уже
+            for colours in refine_colours([pattern, target], REFINE_ITERATIONS):
+                pass
+            return colours
+        _, colours = np.unique(np.concatenate((pattern.node_labels, target.node_labels)), return_inverse=True)
+        return colours[:len(pattern)], colours[len(pattern):]
+
+
+    def arguments(self):
+        # Массивы для поиска в глубину или None, если вложения заведомо нет
+        pattern, target = self.pattern, self.target
+        if len(pattern) > len(target) or pattern.number_of_edges() > target.number_of_edges():
+            return None
+        pattern_colours, target_colours = self.colours()
+        size = int(max(pattern_colours.max(initial=0), target_colours.max(initial=0))) + 1
+        colour_counts = np.bincount(target_colours, minlength=size)
+        if np.any(np.bincount(pattern_colours, minlength=size) > colour_counts):
+            return None
+
+        rarity, root, roots = colour_counts[pattern_colours], None, None
+        if not self.same_size():
+            # Цвета здесь - просто метки, поэтому корень и редкость вершин
+            # уточняются по индексу профилей: поиск начинается с вершины
+            # образца, у которой меньше всего кандидатов, и только с них
+            if self.index is None:
+                self.index = NeighbourhoodIndex(target)
+            profiles = self.index.profiles(pattern)
+            if profiles is None:
+                return None
+            rows, inverse = np.unique(np.column_stack((pattern.node_labels, profiles)), axis=0, return_inverse=True)
+            rarity = np.array([self.index.count(int(row[0]), row[1:]) for row in rows], dtype=np.int64)[inverse.ravel()]
+            if not rarity.all():
+                return None
+            root = int(np.lexsort((-pattern.degrees, rarity))[0])
+            roots = self.index.candidates(int(pattern.node_labels[root]), profiles[root])
+
+        order = matching_order(pattern, rarity, root)
+        back_ptr, back_nodes, back_labels = back_edges(pattern, order)
+        colour_ptr, colour_nodes = csr_groups(target_colours, size)
+        # Вершины одной метки перебираются от больших степеней к меньшим
+        colour_nodes = colour_nodes[np.lexsort((-target.degrees[colour_nodes], target_colours[colour_nodes]))]
+        if roots is not None and np.count_nonzero(back_ptr[1:] == back_ptr[:-1]) == 1:
+            # У связного образца группа цвета нужна только корню - в ней
+            # остаются лишь подходящие по профилю вершины
+            colour = pattern_colours[root]
+            begin, end = colour_ptr[colour], colour_ptr[colour + 1]
+            segment = colour_nodes[begin:end]
+            segment = segment[np.isin(segment, roots)]
+            colour_nodes = np.concatenate((colour_nodes[:begin], segment, colour_nodes[end:]))
+            colour_ptr = colour_ptr.copy()
+            colour_ptr[colour + 1:] -= end - begin - len(segment)
+        return (order, back_ptr, back_nodes, back_labels,
+                pattern_colours.astype(np.int64), pattern.degrees,
+                target.indptr, target.indices, target.edge_labels,
+                target_colours.astype(np.int64), target.degrees,
+                colour_ptr, colour_nodes, self.induced)
+
+
+    def match(self):
+        self.core = None
+        if not len(self.pattern):
+            self.core = np.zeros(0, dtype=np.int64)
+            return True
+        arguments = self.arguments()
+        if arguments is None:
+            return False
+        if native is not None:
+            core = native.search(*arguments)
+            core = core if len(core) else None
+        else:
+            core = search_python(*arguments)
+        if core is None:
+            return False
+        self.core = np.asarray(core, dtype=np.int64)
+        return True
+
+
+    def embeddings(self, overlapping=False):
+        # Все вложения за один обход. Без overlapping рёбра принятого
+        # вложения удаляются из графа, и следующие вложения их не используют
+        # (общие цепи вроде питания по-прежнему разделяются). Вложения,
+        # отличающиеся только автоморфизмом образца, выдаются один раз
+        if not len(self.pattern):
+            return
+        arguments = self.arguments()
+        if arguments is None:
+            return
+        state = SearchState.from_arguments(*arguments)
+        owners = np.repeat(np.arange(len(self.pattern)), self.pattern.degrees)
+        forward = owners < self.pattern.indices
+        edges = list(zip(owners[forward].tolist(), self.pattern.indices[forward].tolist()))
+        seen = set()
+        for core in state.matches():
+            images = [(core[u], core[w]) for u, w in edges]
+            key = (frozenset(core), frozenset((min(v, x), max(v, x)) for v, x in images))
+            if key in seen:
+                continue
+            seen.add(key)
+            self.core = np.array(core, dtype=np.int64)
+            yield self.mapping()
+            if not overlapping:
+                for v, x in images:
+                    state.remove_edge(v, x)
+
+
+    def mapping(self):
+        # Как у networkx.GraphMatcher(graph, subgraph): вершина графа -> вершина образца
+        if self.core is None:
+            return {}
+        return {self.target.nodes[v]: self.pattern.nodes[u] for u, v in enumerate(self.core.tolist())}
@@ -1,15 +1,37 @@
 from src.circuits.elements.Transistor import Transistor
+from src.circuits.spice_reader import SpiceNetlist
+from src.circuits.gc_pause import gc_paused
 from networkx import Graph
+from array import array
+import numpy as np
 import json
 
+
+SPICE_EXTENSIONS = (".sp", ".spi", ".spice", ".cir", ".cdl", ".ckt")
+
+# Имена цепей питания, которые считаются объявленными без .global
+SUPPLY_NAMES = ("vcc", "vdd", "gnd", "vss")
+
 class ElecrticalCircuit:
     def __init__(self, name):
         self.name = name
         self.id_counter = 0
         self.transistors = []
-        self.buses = []
+        self.nets = {}
+        self.bus_ids = array('q')
+        self.bus_names = []
+        self.member_buses = array('q')
+        self.member_transistors = array('q')
+        self.netlist = None
+        self.subcircuits = {}
         self.nx_graph = Graph()
 
+    def load(self, filename):
+        if filename.lower().endswith(SPICE_EXTENSIONS):
+            self.load_SPICE(filename)
+        else:
+            self.load_NET(filename)
+
     def load_NET(self, filename):    
         with open(filename, 'r') as file:
             for line in file:
@@ -19,46 +41,85 @@ class ElecrticalCircuit:
                 self.id_counter += 1
 
 
+    def load_SPICE(self, filename):
+        # Каждая подсхема разбирается и разворачивается один раз, экземпляры
+        # получают её транзисторы с перенумерованными цепями
+        self.netlist = SpiceNetlist().read(filename)
+        self.add_devices(self.netlist.expand())
+
+
+    def add_devices(self, devices):
+        for kind, gate, drain, source in devices:
+            self.transistors.append(Transistor(gate, drain, source, kind, self.id_counter))
+            self.id_counter += 1
+
+
+    def subcircuit(self, name):
+        # Скомпилированный граф подсхемы для иерархического сопоставления;
+        # выводы подсхемы остаются цепями с исходными именами
+        circuit = self.subcircuits.get(name.lower())
+        if circuit is None:
+            cell = self.netlist.subcircuits.get(name.lower()) if self.netlist is not None else None
+            if cell is None:
+                raise ValueError(f"Undefined subcircuit: {name}")
+            circuit = self.subcircuits[name.lower()] = ElecrticalCircuit(cell.name)
+            circuit.add_devices(self.netlist.expand(cell))
+            circuit.compile()
+        return circuit
+
+
+    def supply_nets(self, names=SUPPLY_NAMES):
+        # Цепи питания, объявленные в списке соединений: по имени или
+        # через .global в SPICE (туда же входит земля 0)
+        declared = {name.lower() for name in names}
+        if self.netlist is not None:
+            declared.update(name.lower() for name in self.netlist.globals)
+        return [bus_id for bus_id, name in zip(self.bus_ids, self.bus_names) if name.lower() in declared]
+
+
+    def bus_members(self):
+        # Принадлежность к шинам хранится плоскими массивами (шина, транзистор);
+        # устойчивая сортировка группирует их по шинам в исходном порядке
+        buses = np.frombuffer(self.member_buses, dtype=np.int64)
+        transistors = np.frombuffer(self.member_transistors, dtype=np.int64)
+        order = np.argsort(buses, kind="stable")
+        return buses[order].tolist(), transistors[order].tolist()
+
+
     def graph_nx_compile(self):
+        nodes = []
+        gate_edges = []
         for trans in self.transistors:
-            self.nx_graph.add_node(trans.id, label=trans.type)
-            for con in trans.connections:
-                self.nx_graph.add_edge(trans.id, con, label="bus")
+            nodes.append((trans.id, {"label": trans.type}))
             for con in trans.gate_connections:
-                self.nx_graph.add_edge(trans.id, con, label="gate")
+                nodes.append((con, {"label": "bus"}))
+                gate_edges.append((trans.id, con))
+        nodes.extend((bus_id, {"label": "bus"}) for bus_id in self.bus_ids)
 
-        for bus in self.buses:
-            self.nx_graph.add_node(bus[0], label="bus")
-            for con in bus[2]:
-                self.nx_graph.add_edge(bus[0], con, label="bus")
+        self.nx_graph.add_nodes_from(nodes)
+        self.nx_graph.add_edges_from(gate_edges, label="gate")
+        self.nx_graph.add_edges_from(zip(*self.bus_members()), label="bus")
 
 
     def compile(self):
-        for trans1 in self.transistors:
-            for bus in self.buses:
-                if bus[1] == trans1.drain:
-                    bus[2].append(trans1.id)
-                    break
-            else:
-                self.buses.append((self.id_counter, trans1.drain, [trans1.id]))
-                self.id_counter += 1
-            for bus in self.buses:
-                if bus[1] == trans1.source:
-                    bus[2].append(trans1.id)
-                    break
-            else:
-                self.buses.append((self.id_counter, trans1.source, [trans1.id]))
-                self.id_counter += 1
-            for bus in self.buses:
-                if bus[1] == trans1.gate:
-                    trans1.gate_connections.add(bus[0])
-                    break
-            else:
-                self.buses.append((self.id_counter, trans1.gate, []))
-                trans1.gate_connections.add(self.id_counter)
+        def intern(name):
+            bus_id = self.nets.get(name)
+            if bus_id is None:
+                bus_id = self.nets[name] = self.id_counter
+                self.bus_ids.append(bus_id)
+                self.bus_names.append(name)
                 self.id_counter += 1
+            return bus_id
+
+        with gc_paused():
+            for trans in self.transistors:
+                self.member_buses.append(intern(trans.drain))
+                self.member_transistors.append(trans.id)
+                self.member_buses.append(intern(trans.source))
+                self.member_transistors.append(trans.id)
+                trans.gate_connections.add(intern(trans.gate))
 
-        self.graph_nx_compile()
+            self.graph_nx_compile()
             
 
     def graph_to_json(self, filename):
@@ -73,10 +134,10 @@ class ElecrticalCircuit:
                 edges.append({"source": trans.id, "target": con, "label": "gate"})
 
 
-        for bus in self.buses:
-            nodes.append({"id": bus[0], "name": bus[1], "label" : "bus"})
-            for con in bus[2]:
-                edges.append({"source": bus[0], "target": con, "label": "bus"})
+        for bus_id, name in zip(self.bus_ids, self.bus_names):
+            nodes.append({"id": bus_id, "name": name, "label" : "bus"})
+        for bus_id, trans_id in zip(*self.bus_members()):
+            edges.append({"source": bus_id, "target": trans_id, "label": "bus"})
 
 
         graph = {
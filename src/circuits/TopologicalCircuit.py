@@ -1,8 +1,10 @@
-from re import findall as re_findall
-from src.circuits.elements.Layer import Layer
+from src.circuits.cif_reader import CIFReader, CHUNK_SIZE
+from src.circuits.hierarchy import HierarchyExtractor, BUS_LAYERS
+from src.circuits.elements.Layer import Layer, as_layer, rectangle_bounds, rectangles_overlap
 from src.circuits.elements.Contact import Contact
 from src.circuits.elements.Transistor import Transistor
 from src.circuits.elements.Bus import Bus
+from src.algorithms.disjoint_set import DisjointSet
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
 from networkx import Graph
@@ -10,13 +12,25 @@ import pyvista as pv
 import numpy as np
 import json
 import importlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+EXTRACTOR_VERSION = 1
 
 
 class TopologicalCircuit:
     def __init__(self, name=None, geometry="Clipper2"):
         self.name = name
+        self.geometry = geometry
         self.id_counter = 0
         self.layers = []
+        self.layer_map = {}
+        self.labels = []
+        self.load_stats = None
+        self.layout = None
+        self.polygon_keys = None
+        self.adjacency = None
         self.transistors = []
         self.contacts = []
         self.buses = []
@@ -29,130 +43,219 @@ class TopologicalCircuit:
     def clean(self):
         self.id_counter = 0
         self.layers = []
+        self.layer_map = {}
+        self.labels = []
+        self.load_stats = None
+        self.layout = None
+        self.polygon_keys = None
+        self.adjacency = None
         self.transistors = []
         self.contacts = []
         self.buses = []
         self.nx_graph = Graph()
 
-    def load_CIF(self, filename):
-        current_layer_name = None
-        polygon_line = ''
-        collecting_polygon = False
-        with open(filename, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith('L '):
-                    current_layer_name = line.split()[1].replace(';', '')
-                elif line.startswith('P ') or collecting_polygon:
-                    polygon_line += ' ' + line
-                    collecting_polygon = not polygon_line.strip().endswith(';')
-                    
-                    if not collecting_polygon:
-                        points = tuple(map(int, re_findall(r'-?\d+', polygon_line)))
-                        size_of_points = len(points)
-                        if size_of_points >= 6 and size_of_points % 2 == 0:
-                            polygon = [(points[i], points[i + 1]) for i in range(0, size_of_points, 2)]
-                            for layer in self.layers:
-                                if layer.name == current_layer_name:
-                                    layer.addPolygon(polygon)
-                                    break
-                            else:
-                                self.layers.append(Layer(current_layer_name, polygon))
+    def load_CIF(self, filename, chunk_size=CHUNK_SIZE):
+        reader = CIFReader(chunk_size).read(filename)
+        builders, labels = reader.flatten()
+        self.add_layers(builders)
+        self.labels.extend(labels)
+        self.layout = reader
+        self.load_stats = {"bytes": reader.bytes_read, "seconds": reader.elapsed, "bytes_per_second": reader.bytes_per_second}
+        return self.load_stats
 
-                        polygon_line = ''
 
-        for layer in self.layers:
-            layer.deleteDuplicate()
+    def add_layers(self, builders):
+        for name, builder in builders.items():
+            layer = Layer(name)
+            layer.polygons = builder.polygons()
+            coords, offsets = builder.arrays()
+            layer.packed = coords.astype(np.float64), offsets
+            layer.build_index()
+            layer.rectangles()
+            self.layers.append(layer)
+            self.layer_map[name] = layer
 
 
     def find_layer(self, layername):
-        for layer in self.layers:
-            if layer.name == layername:
-                 return layer
-        return None
+        return self.layer_map.get(layername)
 
     
-    def find_all_transistors(self):
-        SN_layer = self.find_layer("SN")
-        NA_layer = self.find_layer("NA")
-        if SN_layer is not None and NA_layer is not None:            
-            for gate in SN_layer.polygons:
-                for i in range(len(NA_layer.polygons)):
-                    if len(self.geometry_module.intersect_polygon(gate, NA_layer.polygons[i])) > 2:
-                        source, drain = self.geometry_module.split_polygon(NA_layer.polygons[i], gate)
-                        NA_layer.polygons.pop(i)
-                        NA_layer.polygons.append(drain)
-                        NA_layer.polygons.append(source)
-                        if source and drain:
-                            self.transistors.append(Transistor(gate, drain, source, "N", self.id_counter))
-                            self.id_counter += 1
-                            break
-        
-        SP_layer = self.find_layer("SP")
+    def find_overlaps(self, polygons1, polygons2, accept=None):
+        layer1 = as_layer(polygons1)
+        layer2 = as_layer(polygons2)
+        if self.adjacency is not None:
+            pairs = self.adjacent_pairs(layer1.polygons, layer2.polygons, accept)
+            if pairs is not None:
+                return pairs
+        if layer2.index is None:
+            layer2.build_index()
+        pairs = [(i, j) for i, polygon in enumerate(layer1.polygons) for j in layer2.index.query(polygon) if accept is None or accept(i, j)]
+        if not pairs:
+            return []
+        pairs = np.array(pairs, dtype=np.int64)
+
+        # Пары прямоугольников проверяются векторно, в C++ уходят только остальные
+        rects1, is_rect1 = layer1.rectangles()
+        rects2, is_rect2 = layer2.rectangles()
+        both_rects = is_rect1[pairs[:, 0]] & is_rect2[pairs[:, 1]]
+        found = np.zeros(len(pairs), dtype=bool)
+        found[both_rects] = rectangles_overlap(rects1[pairs[both_rects, 0]], rects2[pairs[both_rects, 1]])
+
+        other = np.flatnonzero(~both_rects)
+        if len(other):
+            coords1, offsets1 = layer1.pack()
+            coords2, offsets2 = layer2.pack()
+            overlaps, _ = self.geometry_module.intersect_pairs(coords1, offsets1, coords2, offsets2, pairs[other])
+            keys = pairs[other, 0] * len(layer2.polygons) + pairs[other, 1]
+            found[other] = np.isin(keys, overlaps[:, 0] * len(layer2.polygons) + overlaps[:, 1])
+        return pairs[found].tolist()
+
+
+    def adjacent_pairs(self, polygons1, polygons2, accept=None):
+        # После иерархической экстракции касания полигонов уже известны:
+        # пары берутся из списка смежности вместо геометрии
+        keys1 = np.array([self.polygon_keys.get(id(polygon), -1) for polygon in polygons1], dtype=np.int64)
+        keys2 = np.array([self.polygon_keys.get(id(polygon), -1) for polygon in polygons2], dtype=np.int64)
+        if (keys1 < 0).any() or (keys2 < 0).any() or len(np.unique(keys1)) < len(keys1) or len(np.unique(keys2)) < len(keys2):
+            return None
+        first, second = self.adjacency
+        position1 = np.full(len(self.polygon_keys), -1, dtype=np.int64)
+        position1[keys1] = np.arange(len(keys1))
+        position2 = np.full(len(self.polygon_keys), -1, dtype=np.int64)
+        position2[keys2] = np.arange(len(keys2))
+        i = position1[first]
+        j = position2[second]
+        found = (i >= 0) & (j >= 0)
+        i, j = i[found], j[found]
+        order = np.lexsort((j, i))
+        pairs = np.stack((i[order], j[order]), axis=1).tolist()
+        if accept is not None:
+            pairs = [pair for pair in pairs if accept(*pair)]
+        return pairs
+
+
+    def run_stages(self, stages, executor=None):
+        if executor is None:
+            return [stage() for stage in stages]
+        return list(executor.map(lambda stage: stage(), stages))
+
+
+    def find_all_transistors(self, executor=None):
         NA_layer = self.find_layer("NA")
-        if SP_layer is not None and NA_layer is not None:            
-            for gate in SP_layer.polygons:
-                for i in range(len(NA_layer.polygons)):
-                    if len(self.geometry_module.intersect_polygon(gate, NA_layer.polygons[i])) > 2:
-                        source, drain = self.geometry_module.split_polygon(NA_layer.polygons[i], gate)
-                        NA_layer.polygons.pop(i)
-                        NA_layer.polygons.append(drain)
-                        NA_layer.polygons.append(source)
-                        if source and drain:
-                            self.transistors.append(Transistor(gate, drain , source, "P", self.id_counter))
-                            self.id_counter += 1
-                            break
+        if NA_layer is None:
+            return
+
+        # Каждый тип транзисторов режет свою часть активной области:
+        # полигоны NA, которых касаются затворы этого типа
+        def touched_NA(gate_layer):
+            gate_layer = self.find_layer(gate_layer)
+            if gate_layer is None:
+                return []
+            return sorted({i for gate in gate_layer.polygons for i in NA_layer.index.query(gate)})
+
+        def find_trans(gate_layer, touched):
+            gate_layer = self.find_layer(gate_layer)
+            NA_part = Layer("NA")
+            NA_part.polygons = [NA_layer.polygons[i] for i in touched]
+            NA_part.build_index()
+            found = []
+            if gate_layer is not None:
+                for gate in gate_layer.polygons:
+                    gate_rect = rectangle_bounds(gate)
+                    for i in NA_part.index.query(gate):
+                        NA_rect = rectangle_bounds(NA_part.polygons[i])
+                        if gate_rect is not None and NA_rect is not None:
+                            overlap = gate_rect[0] < NA_rect[2] and NA_rect[0] < gate_rect[2] and gate_rect[1] < NA_rect[3] and NA_rect[1] < gate_rect[3]
+                        else:
+                            overlap = self.geometry_module.polygons_overlap(gate, NA_part.polygons[i], "area")
+                        if overlap:
+                            source, drain = self.geometry_module.split_polygon(NA_part.polygons[i], gate)
+                            NA_part.replacePolygon(i, drain)
+                            NA_part.appendPolygon(source)
+                            if source and drain:
+                                found.append((gate, drain, source))
+                                break
+            return touched, NA_part, found
+
+        def merge_trans(trans_type, touched, NA_part, found):
+            for k, i in enumerate(touched):
+                NA_layer.replacePolygon(i, NA_part.polygons[k])
+            for polygon in NA_part.polygons[len(touched):]:
+                NA_layer.appendPolygon(polygon)
+            for gate, drain, source in found:
+                self.transistors.append(Transistor(gate, drain, source, trans_type, self.id_counter))
+                self.id_counter += 1
+
+        touched_N = touched_NA("SN")
+        touched_P = touched_NA("SP")
+        if set(touched_N).isdisjoint(touched_P):
+            results = self.run_stages([lambda: find_trans("SN", touched_N), lambda: find_trans("SP", touched_P)], executor)
+            merge_trans("N", *results[0])
+            merge_trans("P", *results[1])
+        else:
+            merge_trans("N", *find_trans("SN", touched_N))
+            merge_trans("P", *find_trans("SP", touched_NA("SP")))
 
 
-    def find_all_contacts(self):
+    def find_all_contacts(self, executor=None):
         def find_cont(layer_contact, layer_name, melal_layer, contact_name):
             layer1 = self.find_layer(layer_contact)
             layer2 = self.find_layer(layer_name)
             layer3 = self.find_layer(melal_layer)
+            found = []
             if layer1 is not None and layer2 is not None and layer3 is not None:            
-                for contact in layer1.polygons:
-                    for polygon in layer2.polygons:
-                        for M_contact in layer3.polygons:
-                            if self.geometry_module.intersect_polygon(contact, polygon) and polygon == M_contact:
-                                self.contacts.append(Contact(contact_name, layer_name, melal_layer, contact, polygon, self.id_counter))
-                                self.id_counter += 1
-                                break
+                metal_polygons = set(map(tuple, layer3.polygons))
+                on_metal = [tuple(polygon) in metal_polygons for polygon in layer2.polygons]
+                for i, j in self.find_overlaps(layer1, layer2, lambda i, j: on_metal[j]):
+                    found.append((contact_name, layer_name, melal_layer, layer1.polygons[i], layer2.polygons[j]))
+            return found
 
         def find_cont_E(layer_contact, layer_name, melal_layer, contact_name):
             layer1 = self.find_layer(layer_contact)
             layer2 = self.find_layer(layer_name)
             layer3 = self.find_layer(melal_layer)
+            found = []
             if layer1 is not None and layer2 is not None and layer3 is not None:            
-                for contact in layer1.polygons:
-                    for polygon in layer2.polygons:
-                        for M_contact in layer3.polygons:
-                            if self.geometry_module.intersect_polygon(contact, polygon) and self.geometry_module.intersect_polygon(M_contact, polygon):
-                                self.contacts.append(Contact(contact_name, layer_name, melal_layer, contact, polygon, self.id_counter))
-                                self.id_counter += 1
-                                break
+                on_metal = {i for i, _ in self.find_overlaps(layer2, layer3)}
+                for i, j in self.find_overlaps(layer1, layer2, lambda i, j: j in on_metal):
+                    found.append((contact_name, layer_name, melal_layer, layer1.polygons[i], layer2.polygons[j]))
+            return found
         
-        find_cont("CNA", "NA", "M1", "CN")
-        find_cont("CPA", "NA", "M1", "CP")
-        find_cont_E("CNE", "NA", "M1", "CNE")
-        find_cont_E("CPE", "NA", "M1", "CPE")
-        find_cont("CM1", "M1", "M2", "CM")
-        find_cont("CSI", "SI", "M1", "CSI")
-
-
-    def find_all_buses(self):
+        stages = [
+            lambda: find_cont("CNA", "NA", "M1", "CN"),
+            lambda: find_cont("CPA", "NA", "M1", "CP"),
+            lambda: find_cont_E("CNE", "NA", "M1", "CNE"),
+            lambda: find_cont_E("CPE", "NA", "M1", "CPE"),
+            lambda: find_cont("CM1", "M1", "M2", "CM"),
+            lambda: find_cont("CSI", "SI", "M1", "CSI"),
+        ]
+        for found in self.run_stages(stages, executor):
+            for args in found:
+                self.contacts.append(Contact(*args, self.id_counter))
+                self.id_counter += 1
+
+
+    def find_all_buses(self, executor=None):
         def find_bus(layer_bus, bus_name):
             layer = self.find_layer(layer_bus)
+            found = []
             if layer is not None:            
                 for bus in layer.polygons:
                     for contact in self.contacts:
                         if bus != contact.polygon_layer:
-                            self.buses.append(Bus(bus_name, layer_bus, [bus], self.id_counter))
-                            self.id_counter += 1
+                            found.append((bus_name, layer_bus, [bus]))
                             break
+            return found
         
-        find_bus("M1", "M1")
-        find_bus("M2", "M2")
-        find_bus("SI", "SI")
+        stages = [
+            lambda: find_bus("M1", "M1"),
+            lambda: find_bus("M2", "M2"),
+            lambda: find_bus("SI", "SI"),
+        ]
+        for found in self.run_stages(stages, executor):
+            for args in found:
+                self.buses.append(Bus(*args, self.id_counter))
+                self.id_counter += 1
 
 
     def get_polygons(self, element_id):
@@ -211,105 +314,146 @@ class TopologicalCircuit:
 
 
     def unite_buses(self):
+        buses_by_layer = defaultdict(list)
+        for k, bus in enumerate(self.buses):
+            buses_by_layer[bus.layer].append(k)
+
+        nets = DisjointSet(len(self.buses))
+        for indices in buses_by_layer.values():
+            polygons = []
+            owners = []
+            for k in indices:
+                polygons.extend(self.buses[k].polygons)
+                owners.extend([k] * len(self.buses[k].polygons))
+
+            first_owner = {}
+            for polygon, k in zip(polygons, owners):
+                nets.union(first_owner.setdefault(tuple(polygon), k), k)
+            for i, j in self.find_overlaps(polygons, polygons, accept=lambda i, j: owners[i] < owners[j]):
+                nets.union(owners[i], owners[j])
+
         new_buses = []
-        while self.buses:
-            j = 0
-            while j < len(self.buses):
-                if self.buses[0] != self.buses[j] and self.buses[0].layer == self.buses[j].layer:
-                    flag = False
-                    for poly1 in self.buses[0].polygons:
-                        for poly2 in self.buses[j].polygons:
-                            if poly1 == poly2 or self.geometry_module.intersect_polygon(poly1, poly2):
-                                self.buses[0].polygons.extend(self.buses[j].polygons)
-                                flag = True
-                                self.buses.pop(j)
-                                j = -1
-                                break
-                        if flag:
-                            break
-                j += 1         
-            new_buses.append(self.buses[0])
-            self.buses.pop(0)
+        for members in nets.groups().values():
+            bus = self.buses[members[0]]
+            for k in members[1:]:
+                bus.polygons.extend(self.buses[k].polygons)
+            new_buses.append(bus)
         self.buses = new_buses    
         
 
     def connect_bus_contact(self):
+        bus_polygons = []
+        bus_owners = []
         for bus in self.buses:
-            for contact in self.contacts:
-                if (bus.layer == contact.layer1 or bus.layer == contact.layer2):
-                    for poly in bus.polygons:
-                        if self.geometry_module.intersect_polygon(poly, contact.polygon_contact):
-                            contact.connections.add(bus.id)
-                            break
+            bus_polygons.extend(bus.polygons)
+            bus_owners.extend([bus] * len(bus.polygons))
+        contact_polygons = [contact.polygon_contact for contact in self.contacts]
+
+        def same_layer(i, j):
+            return bus_owners[i].layer == self.contacts[j].layer1 or bus_owners[i].layer == self.contacts[j].layer2
+
+        for i, j in self.find_overlaps(bus_polygons, contact_polygons, accept=same_layer):
+            self.contacts[j].connections.add(bus_owners[i].id)
     
 
     def connect_trans_contact(self):
-        for trans in self.transistors:
-            for contact in self.contacts:
-                if contact.layer1 == "NA" and (self.geometry_module.intersect_polygon(trans.drain, contact.polygon_contact) or self.geometry_module.intersect_polygon(trans.source, contact.polygon_contact)):
-                    contact.connections.add(trans.id)
+        contact_polygons = as_layer([contact.polygon_contact for contact in self.contacts])
+
+        def is_NA(i, j):
+            return self.contacts[j].layer1 == "NA"
+
+        for polygons in ([trans.drain for trans in self.transistors], [trans.source for trans in self.transistors]):
+            for i, j in self.find_overlaps(polygons, contact_polygons, accept=is_NA):
+                self.contacts[j].connections.add(self.transistors[i].id)
 
 
     def connect_trans(self):
-        for trans1 in self.transistors:
-            for trans2 in self.transistors:
-                for contact in self.contacts:
-                    if contact.layer1 == "NA" and self.geometry_module.intersect_polygon(trans1.drain, contact.polygon_contact) and self.geometry_module.intersect_polygon(trans2.source, contact.polygon_contact):
-                        break
-                else:        
-                    if self.geometry_module.intersect_polygon(trans1.drain, trans2.source):
-                        self.buses.append(Bus("C", "NA", [], self.id_counter))
-                        self.buses[-1].connections.add(trans2.id)
-                        trans1.connections.add(self.id_counter)
-                        self.id_counter += 1
+        contact_polygons = as_layer([contact.polygon_contact for contact in self.contacts])
+        drains = as_layer([trans.drain for trans in self.transistors])
+        sources = [trans.source for trans in self.transistors]
+
+        def is_NA(i, j):
+            return self.contacts[j].layer1 == "NA"
+
+        drain_contacts = defaultdict(set)
+        for i, j in self.find_overlaps(drains, contact_polygons, accept=is_NA):
+            drain_contacts[i].add(j)
+        source_contacts = defaultdict(set)
+        for i, j in self.find_overlaps(sources, contact_polygons, accept=is_NA):
+            source_contacts[i].add(j)
+
+        for i, j in self.find_overlaps(drains, sources):
+            if not drain_contacts[i] & source_contacts[j]:
+                trans1 = self.transistors[i]
+                trans2 = self.transistors[j]
+                self.buses.append(Bus("C", "NA", [], self.id_counter))
+                self.buses[-1].connections.add(trans2.id)
+                trans1.connections.add(self.id_counter)
+                self.id_counter += 1
                     
 
     def unite_gates_buses(self):
+        SI_polygons = []
+        owners = []
+        for k, bus in enumerate(self.buses):
+            if bus.layer == "SI":
+                SI_polygons.extend(bus.polygons)
+                owners.extend([k] * len(bus.polygons))
+        gates = [trans.gate for trans in self.transistors]
+
+        # Вершины 0..len(buses)-1 - шины, дальше - затворы транзисторов
+        first_id = self.id_counter
+        self.id_counter += len(self.transistors)
+        offset = len(self.buses)
+        nets = DisjointSet(offset + len(self.transistors))
+        for t, i in self.find_overlaps(gates, SI_polygons, accept=lambda t, i: gates[t] not in self.buses[owners[i]].polygons):
+            nets.union(offset + t, owners[i])
+
+        united = set()
         new_buses = []
-        for trans in self.transistors:
-            bus = Bus("SI", "SI", [], self.id_counter)
-            self.id_counter += 1
-            flag = False
-            j = 0
-            while j < len(self.buses):
-                if self.buses[j].layer == "SI":
-                    for poly1 in self.buses[j].polygons:
-                        if trans.gate not in self.buses[j].polygons and self.geometry_module.intersect_polygon(poly1, trans.gate):
-                            bus.polygons.extend(self.buses[j].polygons)
-                            bus.polygons.append(trans.gate)
-                            self.buses.pop(j)
-                            flag = True
-                            j = -1
-                            break
-                j += 1
-            if flag:
-                new_buses.append(bus)  
+        for members in nets.groups().values():
+            bus_members = [k for k in members if k < offset]
+            trans_members = [k - offset for k in members if k >= offset]
+            if not bus_members or not trans_members:
+                continue
+            bus = Bus("SI", "SI", [], first_id + trans_members[0])
+            for k in bus_members:
+                bus.polygons.extend(self.buses[k].polygons)
+            bus.polygons.extend(gates[t] for t in trans_members)
+            new_buses.append(bus)
+            united.update(bus_members)
+
+        new_buses.sort(key=lambda bus: bus.id)
+        self.buses = [bus for k, bus in enumerate(self.buses) if k not in united]
         self.buses.extend(new_buses) 
 
 
     def connect_gate(self):
-        for trans in self.transistors:
-            for bus in self.buses:
-                if bus.layer == "SI":
-                    for poly in bus.polygons:
-                        if poly == trans.gate or self.geometry_module.intersect_polygon(poly, trans.gate):
-                            trans.gate_connections.add(bus.id)
-                            break
+        SI_polygons = []
+        SI_buses = []
+        for bus in self.buses:
+            if bus.layer == "SI":
+                SI_polygons.extend(bus.polygons)
+                SI_buses.extend([bus] * len(bus.polygons))
+        for i, j in self.find_overlaps([trans.gate for trans in self.transistors], SI_polygons):
+            self.transistors[i].gate_connections.add(SI_buses[j].id)
 
 
     def merge_contact(self):
+        bus_by_id = {bus.id: bus for bus in self.buses}
         for contact in self.contacts:
-            for bus in self.buses:
-                if bus.id in contact.connections:
+            for bus_id in contact.connections:
+                if bus_id in bus_by_id:
+                    bus = bus_by_id[bus_id]
                     bus.graph_connections = bus.graph_connections.union(contact.connections)
                     if bus.id in bus.graph_connections:
                         bus.graph_connections.remove(bus.id)
 
 
     def merge_M2(self):
-        for bus_M2 in self.buses:
+        for bus_M2 in [bus for bus in self.buses if bus.layer == "M2"]:
             for bus in self.buses:
-                if bus_M2.layer == "M2" and (bus.id in bus_M2.graph_connections or bus_M2.id in bus.graph_connections):
+                if bus.id in bus_M2.graph_connections or bus_M2.id in bus.graph_connections:
                     bus_M2.graph_connections = bus_M2.graph_connections.union(bus.graph_connections)
                     if bus_M2.id in bus_M2.graph_connections:
                         bus_M2.graph_connections.remove(bus_M2.id)
@@ -319,16 +463,28 @@ class TopologicalCircuit:
 
 
     def merge_SI(self):
+        # Затвор переходит на первую по списку шину, связанную с шиной SI
+        position = {bus.id: k for k, bus in enumerate(self.buses)}
+        containing = defaultdict(set)
+        for k, bus in enumerate(self.buses):
+            for con in bus.graph_connections:
+                containing[con].add(k)
+
+        SI_buses = [bus for bus in self.buses if bus.layer == "SI"]
         for trans in self.transistors:
-            for bus_SI in self.buses:
-                for bus in self.buses:
-                    if bus_SI.layer == "SI" and bus_SI.id in trans.graph_gate_connections and (bus_SI.id in bus.graph_connections or bus.id in bus_SI.graph_connections):
-                        trans.graph_gate_connections.add(bus.id)
-                        if bus_SI.id in trans.graph_gate_connections: 
-                            trans.graph_gate_connections.remove(bus_SI.id)
-                        if bus_SI.id in bus.graph_connections: 
-                            bus.graph_connections.remove(bus_SI.id)
-                        bus_SI.on_graph = False
+            for bus_SI in SI_buses:
+                if bus_SI.id not in trans.graph_gate_connections:
+                    continue
+                candidates = containing[bus_SI.id] | {position[con] for con in bus_SI.graph_connections if con in position}
+                if not candidates:
+                    continue
+                k = min(candidates)
+                bus = self.buses[k]
+                trans.graph_gate_connections.add(bus.id)
+                trans.graph_gate_connections.discard(bus_SI.id)
+                bus.graph_connections.discard(bus_SI.id)
+                containing[bus_SI.id].discard(k)
+                bus_SI.on_graph = False
 
     
     def graph_nx_compile(self):
@@ -346,10 +502,18 @@ class TopologicalCircuit:
                     self.nx_graph.add_edge(bus.id, con, label="bus")
 
 
-    def compile(self):
-        self.find_all_transistors()
-        self.find_all_contacts()
-        self.find_all_buses()
+    def compile(self, workers=1, hierarchical=True):
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if hierarchical and self.layout is not None and self.layout.root().calls:
+                self.place_extraction(HierarchyExtractor(self, self.layout, executor).extract(self.layout.root()))
+            else:
+                self.find_all_transistors(executor)
+                self.find_all_contacts(executor)
+                self.find_all_buses(executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         self.unite_gates_buses()
         self.unite_buses()
@@ -361,6 +525,31 @@ class TopologicalCircuit:
 
         self.graph_merge()
         self.graph_nx_compile()
+        self.polygon_keys = None
+        self.adjacency = None
+
+
+    def place_extraction(self, extraction):
+        # Элементы в том же порядке, что и при плоской экстракции:
+        # N, затем P транзисторы, контакты по стадиям, шины по слоям
+        polygons = extraction.polygons.polygons()
+        for kind, gate, drain, source in sorted(extraction.transistors, key=lambda trans: trans[0] != "N"):
+            self.transistors.append(Transistor(polygons[gate], polygons[drain], polygons[source], kind, self.id_counter))
+            self.id_counter += 1
+        for _, name, layer1, layer2, contact, layer in sorted(extraction.contacts, key=lambda contact: contact[0]):
+            self.contacts.append(Contact(name, layer1, layer2, polygons[contact], polygons[layer], self.id_counter))
+            self.id_counter += 1
+        for layer, k in sorted(extraction.buses, key=lambda bus: BUS_LAYERS.index(bus[0])):
+            for contact in self.contacts:
+                if polygons[k] != contact.polygon_layer:
+                    self.buses.append(Bus(layer, layer, [polygons[k]], self.id_counter))
+                    self.id_counter += 1
+                    break
+
+        self.polygon_keys = {id(polygon): k for k, polygon in enumerate(polygons)}
+        pairs = extraction.pairs
+        mirrored = pairs[pairs[:, 0] != pairs[:, 1]]
+        self.adjacency = np.concatenate((pairs[:, 0], mirrored[:, 1])), np.concatenate((pairs[:, 1], mirrored[:, 0]))
 
 
     def graph_merge(self):
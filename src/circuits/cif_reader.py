@@ -0,0 +1,344 @@
+from array import array
+from math import hypot
+from re import compile as re_compile
+import time
+import numpy as np
+
+
+CHUNK_SIZE = 1 << 20
+_PARENS = re_compile(rb'[()]')
+_NUMBERS = re_compile(rb'-?\d+')
+_B, _C, _E, _L, _P, _W = b'BCELPW'
+_CALL_TOKENS = re_compile(rb'-?\d+|[A-Z]')
+
+
+def strip_comments(chunk, depth=0):
+    # Комментарии CIF в круглых скобках могут быть вложенными и переходить
+    # через границу блока, поэтому глубина передаётся между вызовами.
+    if depth == 0 and b'(' not in chunk:
+        return chunk, 0
+    parts = []
+    start = 0
+    for match in _PARENS.finditer(chunk):
+        if match.group() == b'(':
+            if depth == 0:
+                parts.append(chunk[start:match.start()])
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                parts.append(b' ')
+                start = match.end()
+    if depth == 0:
+        parts.append(chunk[start:])
+    return b''.join(parts), depth
+
+
+def iter_commands(file, chunk_size=CHUNK_SIZE, on_chunk=None):
+    pending = b''
+    depth = 0
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        if on_chunk is not None:
+            on_chunk(len(chunk))
+        chunk, depth = strip_comments(chunk, depth)
+        commands = (pending + chunk).split(b';')
+        pending = commands.pop()
+        for command in commands:
+            command = command.strip()
+            if command:
+                yield command
+    pending = pending.strip()
+    if pending:
+        yield pending
+
+
+def parse_numbers(text):
+    try:
+        return list(map(int, text.split()))
+    except ValueError:
+        return list(map(int, _NUMBERS.findall(text)))
+
+
+def decode_name(text):
+    return text.decode("cp1251", errors="replace")
+
+
+def box_points(length, width, cx, cy, dx=1, dy=0):
+    # Углы прямоугольника CIF; дробные координаты округляются до единиц CIF.
+    if dy == 0 or dx == 0:
+        if dx == 0:
+            length, width = width, length
+        x0, x1 = round(cx - length / 2), round(cx + length / 2)
+        y0, y1 = round(cy - width / 2), round(cy + width / 2)
+        return [x0, y0, x1, y0, x1, y1, x0, y1]
+    norm = hypot(dx, dy)
+    ux, uy = dx / norm * length / 2, dy / norm * length / 2
+    vx, vy = -dy / norm * width / 2, dx / norm * width / 2
+    return [round(cx - ux - vx), round(cy - uy - vy), round(cx + ux - vx), round(cy + uy - vy),
+            round(cx + ux + vx), round(cy + uy + vy), round(cx - ux + vx), round(cy - uy + vy)]
+
+
+def wire_points(width, path):
+    # Провод раскладывается на прямоугольники по сегментам, продлённые на
+    # половину ширины с обоих концов; провода нулевой ширины площади не имеют.
+    if width <= 0:
+        return []
+    segments = []
+    for k in range(2, len(path) - 1, 2):
+        x1, y1, x2, y2 = path[k - 2], path[k - 1], path[k], path[k + 1]
+        length = hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            continue
+        segments.append(box_points(length + width, width, (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1))
+    return segments
+
+
+class LayerBuilder:
+    def __init__(self, name):
+        self.name = name
+        self.coords = array('q')
+        self.offsets = array('q', [0])
+        self.seen = set()
+
+
+    def add(self, points):
+        key = tuple(points)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        self.coords.extend(points)
+        self.offsets.append(len(self.coords) // 2)
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def arrays(self):
+        coords = np.frombuffer(self.coords, dtype=np.int64).reshape(-1, 2) if self.coords else np.zeros((0, 2), dtype=np.int64)
+        return coords, np.frombuffer(self.offsets, dtype=np.int64)
+
+
+    def polygons(self):
+        flat = self.coords.tolist()
+        offsets = self.offsets.tolist()
+        return [list(zip(flat[2 * begin:2 * end:2], flat[2 * begin + 1:2 * end:2])) for begin, end in zip(offsets, offsets[1:])]
+
+
+IDENTITY = (1, 0, 0, 1, 0, 0)
+
+
+def compose(first, second):
+    # Сначала first, затем second: x' = a * x + b * y + e, y' = c * x + d * y + f
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (a2 * a1 + b2 * c1, a2 * b1 + b2 * d1, c2 * a1 + d2 * c1, c2 * b1 + d2 * d1,
+            a2 * e1 + b2 * f1 + e2, c2 * e1 + d2 * f1 + f2)
+
+
+def is_manhattan(transform):
+    return all(isinstance(value, int) for value in transform) and all(value in (-1, 0, 1) for value in transform[:4])
+
+
+def rotation(dx, dy):
+    if dy == 0:
+        return (1 if dx > 0 else -1, 0, 0, 1 if dx > 0 else -1, 0, 0)
+    if dx == 0:
+        return (0, -1 if dy > 0 else 1, 1 if dy > 0 else -1, 0, 0, 0)
+    norm = hypot(dx, dy)
+    return (dx / norm, -dy / norm, dy / norm, dx / norm, 0, 0)
+
+
+def parse_transform(fields, scale=1):
+    transform = IDENTITY
+    k = 0
+    while k < len(fields):
+        op = fields[k]
+        if op == b'T' and k + 2 < len(fields):
+            step = (1, 0, 0, 1, scale_value(int(fields[k + 1]), scale), scale_value(int(fields[k + 2]), scale))
+            k += 3
+        elif op == b'M' and k + 1 < len(fields):
+            step = (-1, 0, 0, 1, 0, 0) if fields[k + 1] == b'X' else (1, 0, 0, -1, 0, 0)
+            k += 2
+        elif op == b'R' and k + 2 < len(fields):
+            step = rotation(int(fields[k + 1]), int(fields[k + 2]))
+            k += 3
+        else:
+            raise ValueError(f"Bad CIF call transformation: {b' '.join(fields).decode('ascii', errors='replace')}")
+        transform = compose(transform, step)
+    return transform
+
+
+def split_call(command):
+    # "C 12 T 10 20 MX" и "C12T10,20MX" - обе записи допустимы в CIF
+    return _CALL_TOKENS.findall(command[1:])
+
+
+def scale_value(value, scale):
+    if scale == 1:
+        return value
+    scaled = value * scale
+    return int(scaled) if scaled == int(scaled) else round(scaled)
+
+
+def apply_transform(coords, transform):
+    a, b, c, d, e, f = transform
+    x, y = coords[:, 0], coords[:, 1]
+    result = np.stack((a * x + b * y + e, c * x + d * y + f), axis=1)
+    if result.dtype != np.int64:
+        result = np.rint(result).astype(np.int64)
+    return result
+
+
+class CIFCell:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.layers = {}
+        self.calls = []
+        self.labels = []
+
+
+    def layer(self, name):
+        builder = self.layers.get(name)
+        if builder is None:
+            builder = self.layers[name] = LayerBuilder(name)
+        return builder
+
+
+    def is_empty(self):
+        return not self.calls and not any(len(builder) for builder in self.layers.values())
+
+
+class CIFReader:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.top = CIFCell(None)
+        self.cells = {}
+        self.cell = self.top
+        self.scale = 1
+        self.ended = False
+        self.current_key = None
+        self.current = None
+        self.bytes_read = 0
+        self.elapsed = 0.0
+
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_read / self.elapsed if self.elapsed > 0 else 0.0
+
+
+    def count_bytes(self, size):
+        self.bytes_read += size
+
+
+    def read(self, filename):
+        start = time.perf_counter()
+        with open(filename, 'rb') as file:
+            for command in iter_commands(file, self.chunk_size, self.count_bytes):
+                self.command(command)
+                if self.ended:
+                    break
+        self.elapsed += time.perf_counter() - start
+        return self
+
+
+    def command(self, command):
+        kind = command[0]
+        if kind == _P:
+            points = parse_numbers(command[1:])
+            if len(points) >= 6 and len(points) % 2 == 0:
+                self.current_layer().add(self.scaled(points))
+        elif kind == _L:
+            name = command[1:].strip()
+            if name != self.current_key:
+                self.current_key = name
+                self.current = None
+        elif kind == _B:
+            numbers = parse_numbers(command[1:])
+            if len(numbers) in (4, 6) and numbers[0] > 0 and numbers[1] > 0:
+                self.current_layer().add(self.scaled(box_points(*numbers)))
+        elif kind == _W:
+            numbers = parse_numbers(command[1:])
+            if len(numbers) >= 3 and len(numbers) % 2 == 1:
+                for points in wire_points(numbers[0], numbers[1:]):
+                    self.current_layer().add(self.scaled(points))
+        elif kind == _C:
+            fields = split_call(command)
+            if fields:
+                self.cell.calls.append((int(fields[0]), parse_transform(fields[1:], self.scale)))
+        elif command.startswith(b'DS'):
+            numbers = parse_numbers(command[2:])
+            self.cell = self.cells[numbers[0]] = CIFCell(numbers[0])
+            self.scale = numbers[1] / numbers[2] if len(numbers) >= 3 and numbers[2] else 1
+            self.current = None
+        elif command.startswith(b'DF'):
+            self.cell = self.top
+            self.scale = 1
+            self.current = None
+        elif command.startswith(b'DD'):
+            first = parse_numbers(command[2:])[0]
+            self.cells = {symbol: cell for symbol, cell in self.cells.items() if symbol < first}
+        elif kind == _E:
+            self.ended = True
+        elif command.startswith(b'94') or command.startswith(b'4N'):
+            fields = command.split()
+            if len(fields) >= 4:
+                layer = decode_name(fields[4]) if len(fields) > 4 else self.current_name()
+                self.cell.labels.append((decode_name(fields[1]), int(fields[2]), int(fields[3]), layer))
+
+
+    def scaled(self, points):
+        if self.scale == 1:
+            return points
+        return [scale_value(value, self.scale) for value in points]
+
+
+    def current_name(self):
+        return None if self.current_key is None else decode_name(self.current_key)
+
+
+    def current_layer(self):
+        # Слой создаётся при первой фигуре, а не при команде L
+        if self.current is None:
+            self.current = self.cell.layer(self.current_name())
+        return self.current
+
+
+    def root(self):
+        # Без вызовов верхнего уровня TopDesign кладёт весь проект в первую
+        # ячейку, которую никто не вызывает; остальные - библиотека
+        if not self.top.is_empty():
+            return self.top
+        called = {symbol for cell in self.cells.values() for symbol, _ in cell.calls}
+        for symbol, cell in self.cells.items():
+            if symbol not in called:
+                return cell
+        return self.top
+
+
+    def flatten(self, cell=None, transform=IDENTITY, layers=None, labels=None, stack=()):
+        cell = self.root() if cell is None else cell
+        layers = {} if layers is None else layers
+        labels = [] if labels is None else labels
+        if cell.symbol in stack:
+            raise ValueError(f"Recursive CIF symbol call: {cell.symbol}")
+        for name, builder in cell.layers.items():
+            coords, offsets = builder.arrays()
+            flat = apply_transform(coords, transform).ravel().tolist() if transform != IDENTITY else builder.coords.tolist()
+            target = layers.get(name)
+            if target is None:
+                target = layers[name] = LayerBuilder(name)
+            for begin, end in zip(offsets.tolist(), offsets[1:].tolist()):
+                target.add(flat[2 * begin:2 * end])
+        for name, x, y, layer in cell.labels:
+            a, b, c, d, e, f = transform
+            labels.append((name, round(a * x + b * y + e), round(c * x + d * y + f), layer))
+        for symbol, call in cell.calls:
+            if symbol not in self.cells:
+                raise ValueError(f"Call of undefined CIF symbol: {symbol}")
+            self.flatten(self.cells[symbol], compose(call, transform), layers, labels, stack + (cell.symbol,))
+        return layers, labels
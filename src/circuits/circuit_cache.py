@@ -0,0 +1,408 @@
+from collections import OrderedDict
+from hashlib import sha256
+import os
+import tempfile
+import zipfile
+import numpy as np
+from networkx import Graph
+from src.circuits.TopologicalCircuit import EXTRACTOR_VERSION
+from src.circuits.elements.Layer import Layer
+from src.circuits.elements.Contact import Contact
+from src.circuits.elements.Transistor import Transistor
+from src.circuits.elements.Bus import Bus
+from src.circuits.gc_pause import gc_paused
+
+
+FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "circuit_verification")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+RESULT_FORMAT_VERSION = 1
+DEFAULT_MAX_RESULTS = 64
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    digest = sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def graph_digest(graph):
+    # Хэш скомпилированного графа: номера и метки вершин и рёбер в порядке
+    # обхода networkx, который у одной и той же компиляции один и тот же
+    nodes = list(graph.nodes(data="label"))
+    edges = list(graph.edges(data="label"))
+    digest = sha256()
+    digest.update(np.fromiter((node for node, _ in nodes), dtype=np.int64, count=len(nodes)).tobytes())
+    digest.update("\0".join([str(label) for _, label in nodes]).encode())
+    digest.update(np.fromiter((node for u, v, _ in edges for node in (u, v)), dtype=np.int64, count=2 * len(edges)).tobytes())
+    digest.update("\0".join([str(label) for _, _, label in edges]).encode())
+    return digest.hexdigest()
+
+
+def evict_files(entries, max_bytes):
+    # LRU: обращение к записи обновляет mtime, удаляются самые старые
+    entries = sorted(entries, key=os.path.getmtime)
+    total = sum(os.path.getsize(entry) for entry in entries)
+    while entries and total > max_bytes:
+        entry = entries.pop(0)
+        total -= os.path.getsize(entry)
+        os.remove(entry)
+
+
+def save_arrays(directory, path, arrays):
+    # Запись во временный файл и переименование: читатель не увидит
+    # недописанный файл
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def pack_lists(lists):
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    values = np.array([value for values in lists for value in values], dtype=np.int64)
+    return offsets, values
+
+
+def unpack_lists(offsets, values):
+    values = values.tolist()
+    offsets = offsets.tolist()
+    return [values[begin:end] for begin, end in zip(offsets, offsets[1:])]
+
+
+def pack_names(names):
+    return np.array(["" if name is None else name for name in names], dtype=str), np.array([name is not None for name in names], dtype=bool)
+
+
+def unpack_names(names, present):
+    return [name if flag else None for name, flag in zip(names.tolist(), present.tolist())]
+
+
+class PolygonTable:
+    # Общая таблица полигонов: один и тот же объект (затвор и полигон SI,
+    # шина и полигон M1) сохраняется один раз
+    def __init__(self):
+        self.keys = {}
+        self.polygons = []
+
+
+    def add(self, polygon):
+        k = self.keys.get(id(polygon))
+        if k is None:
+            k = self.keys[id(polygon)] = len(self.polygons)
+            self.polygons.append(polygon)
+        return k
+
+
+    def arrays(self):
+        offsets = np.zeros(len(self.polygons) + 1, dtype=np.int64)
+        np.cumsum([len(polygon) for polygon in self.polygons], out=offsets[1:])
+        coords = np.array([point for polygon in self.polygons for point in polygon], dtype=np.float64).reshape(-1, 2)
+        integral = np.array([all(isinstance(value, int) for point in polygon for value in point) for polygon in self.polygons], dtype=bool)
+        return coords, offsets, integral
+
+
+def restore_polygons(coords, offsets, integral):
+    # Точки собираются одним zip, полигоны - срезами общего списка
+    points = int_points = None
+    if not integral.all():
+        points = list(zip(coords[:, 0].tolist(), coords[:, 1].tolist()))
+    if integral.any():
+        int_coords = coords.astype(np.int64)
+        int_points = list(zip(int_coords[:, 0].tolist(), int_coords[:, 1].tolist()))
+    offsets = offsets.tolist()
+    return [(int_points if is_int else points)[begin:end] for begin, end, is_int in zip(offsets, offsets[1:], integral.tolist())]
+
+
+class CircuitCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+
+    def key(self, filename, geometry="Clipper2", hierarchical=True):
+        # Содержимое CIF + геометрическое ядро + версия экстрактора
+        digest = sha256(f"{file_digest(filename)}:{geometry}:{EXTRACTOR_VERSION}:{FORMAT_VERSION}:{int(hierarchical)}".encode())
+        return digest.hexdigest()
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+
+    def compile(self, circuit, filename, workers=1, hierarchical=True):
+        key = self.key(filename, circuit.geometry, hierarchical)
+        if self.load(key, circuit):
+            return circuit
+        circuit.load_CIF(filename)
+        circuit.compile(workers, hierarchical)
+        self.store(key, circuit)
+        return circuit
+
+
+    def load(self, key, circuit):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                if int(data["format_version"]) != FORMAT_VERSION or int(data["extractor_version"]) != EXTRACTOR_VERSION:
+                    raise ValueError("stale cache entry")
+                with gc_paused():
+                    self.restore(data, circuit)
+        except FileNotFoundError:
+            return False
+        except (OSError, KeyError, ValueError, IndexError, zipfile.BadZipFile):
+            # Схема могла остаться наполовину восстановленной: load_CIF
+            # дописывает слои, поэтому перед компиляцией её нужно очистить
+            circuit.clean()
+            self.invalidate(key)
+            return False
+        os.utime(path)
+        return True
+
+
+    def store(self, key, circuit):
+        save_arrays(self.directory, self.path(key), self.arrays(circuit))
+        self.evict()
+
+
+    def invalidate(self, key=None):
+        if key is None:
+            for entry in self.entries():
+                os.remove(entry)
+            return
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+    def invalidate_file(self, filename, geometry="Clipper2"):
+        for hierarchical in (True, False):
+            self.invalidate(self.key(filename, geometry, hierarchical))
+
+
+    def entries(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+
+
+    def evict(self):
+        evict_files(self.entries(), self.max_bytes)
+
+
+    def arrays(self, circuit):
+        table = PolygonTable()
+        layer_names, layer_named = pack_names([layer.name for layer in circuit.layers])
+        layer_offsets, layer_polygons = pack_lists([[table.add(polygon) for polygon in layer.polygons] for layer in circuit.layers])
+
+        transistors = circuit.transistors
+        transistor_polygons = np.array([[table.add(trans.gate), table.add(trans.drain), table.add(trans.source)] for trans in transistors], dtype=np.int64).reshape(-1, 3)
+        contacts = circuit.contacts
+        contact_polygons = np.array([[table.add(contact.polygon_contact), table.add(contact.polygon_layer)] for contact in contacts], dtype=np.int64).reshape(-1, 2)
+        buses = circuit.buses
+        bus_offsets, bus_polygons = pack_lists([[table.add(polygon) for polygon in bus.polygons] for bus in buses])
+        coords, offsets, integral = table.arrays()
+
+        nodes = list(circuit.nx_graph.nodes(data="label"))
+        edges = list(circuit.nx_graph.edges(data="label"))
+        node_labels, node_labelled = pack_names([label for _, label in nodes])
+        edge_labels, edge_labelled = pack_names([label for _, _, label in edges])
+        label_names, _ = pack_names([label[0] for label in circuit.labels])
+        label_layers, label_layered = pack_names([label[3] for label in circuit.labels])
+
+        arrays = {
+            "format_version": np.int64(FORMAT_VERSION),
+            "extractor_version": np.int64(EXTRACTOR_VERSION),
+            "id_counter": np.int64(circuit.id_counter),
+            "polygon_coords": coords, "polygon_offsets": offsets, "polygon_integral": integral,
+            "layer_names": layer_names, "layer_named": layer_named,
+            "layer_offsets": layer_offsets, "layer_polygons": layer_polygons,
+            "transistor_types": np.array([trans.type for trans in transistors], dtype=str),
+            "transistor_ids": np.array([trans.id for trans in transistors], dtype=np.int64),
+            "transistor_polygons": transistor_polygons,
+            "contact_names": np.array([contact.name for contact in contacts], dtype=str),
+            "contact_layers": np.array([[contact.layer1, contact.layer2] for contact in contacts], dtype=str).reshape(-1, 2),
+            "contact_ids": np.array([contact.id for contact in contacts], dtype=np.int64),
+            "contact_polygons": contact_polygons,
+            "bus_names": np.array([bus.name for bus in buses], dtype=str),
+            "bus_layers": np.array([bus.layer for bus in buses], dtype=str),
+            "bus_ids": np.array([bus.id for bus in buses], dtype=np.int64),
+            "bus_on_graph": np.array([bus.on_graph for bus in buses], dtype=bool),
+            "bus_offsets": bus_offsets, "bus_polygons": bus_polygons,
+            "graph_nodes": np.array([node for node, _ in nodes], dtype=np.int64),
+            "node_labels": node_labels, "node_labelled": node_labelled,
+            "graph_edges": np.array([[u, v] for u, v, _ in edges], dtype=np.int64).reshape(-1, 2),
+            "edge_labels": edge_labels, "edge_labelled": edge_labelled,
+            "label_names": label_names, "label_layers": label_layers, "label_layered": label_layered,
+            "label_points": np.array([label[1:3] for label in circuit.labels], dtype=np.int64).reshape(-1, 2),
+        }
+        for prefix, elements, fields in (("transistor", transistors, ("connections", "gate_connections", "graph_gate_connections")),
+                                         ("contact", contacts, ("connections",)),
+                                         ("bus", buses, ("connections", "graph_connections"))):
+            for field in fields:
+                arrays[f"{prefix}_{field}_offsets"], arrays[f"{prefix}_{field}"] = pack_lists([list(getattr(element, field)) for element in elements])
+        return arrays
+
+
+    def restore(self, data, circuit):
+        polygons = restore_polygons(data["polygon_coords"], data["polygon_offsets"], data["polygon_integral"])
+        circuit.clean()
+        circuit.id_counter = int(data["id_counter"])
+
+        for name, members in zip(unpack_names(data["layer_names"], data["layer_named"]), unpack_lists(data["layer_offsets"], data["layer_polygons"])):
+            layer = Layer(name)
+            layer.polygons = [polygons[k] for k in members]
+            circuit.layers.append(layer)
+            circuit.layer_map[name] = layer
+
+        def sets(prefix, field):
+            return [set(values) for values in unpack_lists(data[f"{prefix}_{field}_offsets"], data[f"{prefix}_{field}"])]
+
+        for kind, id, (gate, drain, source), connections, gate_connections, graph_gate_connections in zip(
+                data["transistor_types"].tolist(), data["transistor_ids"].tolist(), data["transistor_polygons"].tolist(),
+                sets("transistor", "connections"), sets("transistor", "gate_connections"), sets("transistor", "graph_gate_connections")):
+            trans = Transistor(polygons[gate], polygons[drain], polygons[source], kind, id)
+            trans.connections = connections
+            trans.gate_connections = gate_connections
+            trans.graph_gate_connections = graph_gate_connections
+            circuit.transistors.append(trans)
+
+        for name, (layer1, layer2), id, (contact_polygon, layer_polygon), connections in zip(
+                data["contact_names"].tolist(), data["contact_layers"].tolist(), data["contact_ids"].tolist(),
+                data["contact_polygons"].tolist(), sets("contact", "connections")):
+            contact = Contact(name, layer1, layer2, polygons[contact_polygon], polygons[layer_polygon], id)
+            contact.connections = connections
+            circuit.contacts.append(contact)
+
+        for name, layer, id, on_graph, members, connections, graph_connections in zip(
+                data["bus_names"].tolist(), data["bus_layers"].tolist(), data["bus_ids"].tolist(), data["bus_on_graph"].tolist(),
+                unpack_lists(data["bus_offsets"], data["bus_polygons"]), sets("bus", "connections"), sets("bus", "graph_connections")):
+            bus = Bus(name, layer, [polygons[k] for k in members], id)
+            bus.connections = connections
+            bus.graph_connections = graph_connections
+            bus.on_graph = on_graph
+            circuit.buses.append(bus)
+
+        graph = Graph()
+        node_labels = unpack_names(data["node_labels"], data["node_labelled"])
+        graph.add_nodes_from((node, {"label": label}) if label is not None else node for node, label in zip(data["graph_nodes"].tolist(), node_labels))
+        edge_labels = unpack_names(data["edge_labels"], data["edge_labelled"])
+        graph.add_edges_from((u, v, {"label": label}) if label is not None else (u, v) for (u, v), label in zip(data["graph_edges"].tolist(), edge_labels))
+        circuit.nx_graph = graph
+
+        circuit.labels = [(name, x, y, layer) for name, (x, y), layer in zip(
+            data["label_names"].tolist(), data["label_points"].tolist(), unpack_names(data["label_layers"], data["label_layered"]))]
+
+
+class VerificationRecord:
+    # Итог проверки: вердикт, соответствие вершин сжатых графов (электрический
+    # -> топологический) и потерянные соединения топологического графа
+    def __init__(self, isomorph, mapping, lost_connections):
+        self.isomorph = isomorph
+        self.mapping = mapping
+        self.lost_connections = lost_connections
+
+
+class ResultCache:
+    # Результаты проверки по хэшам двух скомпилированных графов: в памяти
+    # хранятся max_entries последних, а если задан directory - ещё и на
+    # диске, тоже с вытеснением давно не читанных
+    def __init__(self, max_entries=DEFAULT_MAX_RESULTS, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.records = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+
+    def key(self, graph1, graph2, *options):
+        # options - параметры проверки, от которых зависит результат
+        return self.digest_key(graph_digest(graph1), graph_digest(graph2), *options)
+
+
+    def digest_key(self, digest1, digest2, *options):
+        return sha256(f"{digest1}:{digest2}:{RESULT_FORMAT_VERSION}:{options}".encode()).hexdigest()
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+
+    def get(self, key):
+        record = self.records.get(key)
+        if record is not None:
+            self.records.move_to_end(key)
+            return record
+        if self.directory is None:
+            return None
+        record = self.load(key)
+        if record is not None:
+            self.remember(key, record)
+        return record
+
+
+    def put(self, key, record):
+        self.remember(key, record)
+        if self.directory is not None:
+            save_arrays(self.directory, self.path(key), self.arrays(record))
+            evict_files(self.entries(), self.max_bytes)
+
+
+    def remember(self, key, record):
+        self.records[key] = record
+        self.records.move_to_end(key)
+        while len(self.records) > self.max_entries:
+            self.records.popitem(last=False)
+
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                if int(data["format_version"]) != RESULT_FORMAT_VERSION:
+                    raise ValueError("stale cache entry")
+                record = VerificationRecord(bool(data["isomorph"]),
+                                            dict(zip(data["mapping_keys"].tolist(), data["mapping_values"].tolist())),
+                                            data["lost_connections"].tolist())
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError, IndexError, zipfile.BadZipFile):
+            self.invalidate(key)
+            return None
+        os.utime(path)
+        return record
+
+
+    def arrays(self, record):
+        return {
+            "format_version": np.int64(RESULT_FORMAT_VERSION),
+            "isomorph": np.bool_(record.isomorph),
+            "mapping_keys": np.array(list(record.mapping.keys()), dtype=np.int64),
+            "mapping_values": np.array(list(record.mapping.values()), dtype=np.int64),
+            "lost_connections": np.array(record.lost_connections, dtype=np.int64),
+        }
+
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.records.clear()
+            for entry in self.entries():
+                os.remove(entry)
+            return
+        self.records.pop(key, None)
+        if self.directory is not None and os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+
+    def entries(self):
+        if self.directory is None:
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
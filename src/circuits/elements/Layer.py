@@ -1,22 +1,114 @@
+from src.circuits.elements.SpatialIndex import SpatialIndex
+import numpy as np
+
+
+def pack_polygons(polygons):
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum([len(polygon) for polygon in polygons], out=offsets[1:])
+    coords = np.array([point for polygon in polygons for point in polygon], dtype=np.float64).reshape(-1, 2)
+    return coords, offsets
+
+
+def rectangle_bounds(polygon):
+    if len(polygon) != 4:
+        return None
+    for k in range(4):
+        (x1, y1), (x2, y2) = polygon[k], polygon[(k + 1) % 4]
+        if (x1 == x2) == (y1 == y2):
+            return None
+    (x1, y1), (x2, y2) = polygon[0], polygon[2]
+    if x1 == x2 or y1 == y2:
+        return None
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+def pack_rectangles(polygons):
+    rects = np.zeros((len(polygons), 4), dtype=np.float64)
+    is_rect = np.zeros(len(polygons), dtype=bool)
+    for i, polygon in enumerate(polygons):
+        bounds = rectangle_bounds(polygon)
+        if bounds is not None:
+            rects[i] = bounds
+            is_rect[i] = True
+    return rects, is_rect
+
+
+def rectangles_overlap(rects1, rects2, mode="touch"):
+    if mode == "touch":
+        return (rects1[:, 0] <= rects2[:, 2]) & (rects2[:, 0] <= rects1[:, 2]) & (rects1[:, 1] <= rects2[:, 3]) & (rects2[:, 1] <= rects1[:, 3])
+    if mode == "area":
+        return (rects1[:, 0] < rects2[:, 2]) & (rects2[:, 0] < rects1[:, 2]) & (rects1[:, 1] < rects2[:, 3]) & (rects2[:, 1] < rects1[:, 3])
+    if mode == "contain":
+        return (rects1[:, 0] <= rects2[:, 0]) & (rects2[:, 2] <= rects1[:, 2]) & (rects1[:, 1] <= rects2[:, 1]) & (rects2[:, 3] <= rects1[:, 3])
+    raise ValueError(f"Unknown rectangle overlap mode: {mode}")
+
 
 class Layer:
     def __init__(self, name, points=None):
         self.name = name
         self.polygons = []
+        self.index = None
+        self.packed = None
+        self.rects = None
         if points is not None:
             self.polygons.append(points)
 
 
     def addPolygon(self, points):
         self.polygons.append(points)
+        self.reset_cache()
         
     
     def deleteDuplicate(self):
-        self.polygons = list(set([tuple(polygon) for polygon in self.polygons]))
+        self.polygons = list(dict.fromkeys(tuple(polygon) for polygon in self.polygons))
         self.polygons = list(map(list, self.polygons))
+        self.reset_cache()
 
 
+    def build_index(self):
+        self.index = SpatialIndex(self.polygons)
 
 
-    
+    def replacePolygon(self, i, points):
+        self.polygons[i] = points
+        self.reset_cache()
+        if self.index is not None:
+            self.index.remove(i)
+            self.index.insert(i, points)
+
+
+    def appendPolygon(self, points):
+        self.polygons.append(points)
+        self.reset_cache()
+        if self.index is not None:
+            self.index.insert(len(self.polygons) - 1, points)
 
+
+    def reset_cache(self):
+        self.packed = None
+        self.rects = None
+
+
+    def pack(self):
+        if self.packed is None:
+            self.packed = pack_polygons(self.polygons)
+        return self.packed
+
+
+    def rectangles(self):
+        if self.rects is None:
+            self.rects = pack_rectangles(self.polygons)
+        return self.rects
+
+
+def as_layer(polygons):
+    if isinstance(polygons, Layer):
+        return polygons
+    layer = Layer(None)
+    layer.polygons = polygons
+    return layer
+
+
+
+
+    
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+
+def bounding_box(polygon):
+    if not polygon:
+        return None
+    xs = [point[0] for point in polygon]
+    ys = [point[1] for point in polygon]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def boxes_overlap(box1, box2):
+    return box1[0] <= box2[2] and box2[0] <= box1[2] and box1[1] <= box2[3] and box2[1] <= box1[3]
+
+
+class SpatialIndex:
+    # Равномерная сетка по ограничивающим прямоугольникам полигонов.
+    # Касание прямоугольников тоже считается перекрытием, потому что
+    # intersect_polygon возвращает точки касания.
+    def __init__(self, polygons=None, cell_size=None):
+        self.cells = defaultdict(list)
+        self.boxes = {}
+        boxes = [bounding_box(polygon) for polygon in polygons or []]
+        self.cell_size = cell_size if cell_size is not None else self.estimate_cell_size(boxes)
+        for i, box in enumerate(boxes):
+            self.insert_box(i, box)
+
+
+    @staticmethod
+    def estimate_cell_size(boxes):
+        sizes = sorted(max(box[2] - box[0], box[3] - box[1]) for box in boxes if box is not None)
+        if not sizes:
+            return 1
+        return max(sizes[len(sizes) // 2], 1)
+
+
+    def cell_range(self, box):
+        size = self.cell_size
+        return range(int(box[0] // size), int(box[2] // size) + 1), range(int(box[1] // size), int(box[3] // size) + 1)
+
+
+    def insert_box(self, i, box):
+        if box is None:
+            return
+        self.boxes[i] = box
+        xs, ys = self.cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                self.cells[(cx, cy)].append(i)
+
+
+    def insert(self, i, polygon):
+        self.insert_box(i, bounding_box(polygon))
+
+
+    def remove(self, i):
+        box = self.boxes.pop(i, None)
+        if box is None:
+            return
+        xs, ys = self.cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                self.cells[(cx, cy)].remove(i)
+
+
+    def query_box(self, box):
+        if box is None:
+            return []
+        found = set()
+        xs, ys = self.cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return sorted(i for i in found if boxes_overlap(self.boxes[i], box))
+
+
+    def query(self, polygon):
+        return self.query_box(bounding_box(polygon))
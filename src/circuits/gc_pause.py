@@ -0,0 +1,15 @@
+from contextlib import contextmanager
+import gc
+
+
+@contextmanager
+def gc_paused():
+    # Пока создаются сотни тысяч мелких объектов без циклов, сборщик мусора
+    # только мешает; прежнее состояние сборщика восстанавливается на выходе
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
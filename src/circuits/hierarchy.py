@@ -0,0 +1,263 @@
+import numpy as np
+from src.circuits.cif_reader import IDENTITY, apply_transform, is_manhattan
+from src.circuits.elements.SpatialIndex import SpatialIndex
+
+
+BUS_LAYERS = ("M1", "M2", "SI")
+CONTACT_STAGES = ("CN", "CP", "CNE", "CPE", "CM", "CSI")
+DEVICE_LAYERS = ("NA", "SN", "SP", "CNA", "CPA", "CNE", "CPE", "CM1", "CSI")
+
+# Пересечения разных экземпляров, при которых транзисторы и контакты ячейки
+# уже нельзя взять из её собственной экстракции: (проверка, слой, слой соседа)
+INTERACTIONS = [
+    ("area", "SN", "NA"), ("area", "SP", "NA"),
+    ("touch", "CNA", "NA"), ("touch", "CPA", "NA"), ("touch", "CNE", "NA"), ("touch", "CPE", "NA"),
+    ("touch", "CM1", "M1"), ("touch", "CSI", "SI"),
+    ("equal", "NA", "M1"), ("equal", "M1", "M2"), ("equal", "SI", "M1"),
+] + [("equal", layer, layer) for layer in DEVICE_LAYERS]
+
+
+def pack_int_polygons(polygons):
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum([len(polygon) for polygon in polygons], out=offsets[1:])
+    coords = np.array([point for polygon in polygons for point in polygon], dtype=np.int64).reshape(-1, 2)
+    return coords, offsets
+
+
+def union_box(boxes):
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return min(box[0] for box in boxes), min(box[1] for box in boxes), max(box[2] for box in boxes), max(box[3] for box in boxes)
+
+
+def intersect_boxes(box1, box2):
+    return max(box1[0], box2[0]), max(box1[1], box2[1]), min(box1[2], box2[2]), min(box1[3], box2[3])
+
+
+class PackedPolygons:
+    # Полигоны ячейки в целочисленных массивах: coords (N, 2) и offsets (n + 1)
+    def __init__(self, coords, offsets):
+        self.coords = coords
+        self.offsets = offsets
+        if len(offsets) > 1:
+            starts = offsets[:-1]
+            self.boxes = np.stack((np.minimum.reduceat(coords[:, 0], starts), np.minimum.reduceat(coords[:, 1], starts),
+                                   np.maximum.reduceat(coords[:, 0], starts), np.maximum.reduceat(coords[:, 1], starts)), axis=1)
+        else:
+            self.boxes = np.zeros((0, 4), dtype=np.int64)
+
+
+    @classmethod
+    def from_polygons(cls, polygons):
+        return cls(*pack_int_polygons(polygons))
+
+
+    @classmethod
+    def concat(cls, parts):
+        if not parts:
+            return cls(np.zeros((0, 2), dtype=np.int64), np.zeros(1, dtype=np.int64))
+        shifts = np.cumsum([0] + [len(part.coords) for part in parts[:-1]])
+        offsets = np.concatenate([parts[0].offsets[:1]] + [part.offsets[1:] + shift for part, shift in zip(parts, shifts)])
+        return cls(np.concatenate([part.coords for part in parts]), offsets)
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def box(self):
+        if not len(self):
+            return None
+        return tuple(int(value) for value in (*self.boxes[:, :2].min(axis=0), *self.boxes[:, 2:].max(axis=0)))
+
+
+    def transformed(self, transform):
+        if transform == IDENTITY:
+            return self
+        return PackedPolygons(apply_transform(self.coords, transform), self.offsets)
+
+
+    def select(self, box, mask=None):
+        inside = (self.boxes[:, 0] <= box[2]) & (box[0] <= self.boxes[:, 2]) & (self.boxes[:, 1] <= box[3]) & (box[1] <= self.boxes[:, 3])
+        if mask is not None:
+            inside &= mask
+        return np.flatnonzero(inside)
+
+
+    def polygons(self, indices=None):
+        flat = self.coords.ravel().tolist()
+        offsets = self.offsets.tolist()
+        indices = range(len(self)) if indices is None else indices
+        return [list(zip(flat[2 * offsets[k]:2 * offsets[k + 1]:2], flat[2 * offsets[k] + 1:2 * offsets[k + 1]:2])) for k in indices]
+
+
+class CellExtraction:
+    # Транзисторы, контакты и кандидаты в шины одной ячейки. Элементы
+    # ссылаются на полигоны по номеру, pairs - касающиеся друг друга
+    # полигоны, по которым потом соединяются шины, контакты и затворы
+    def __init__(self, polygons, related, transistors, contacts, buses, layers, pairs):
+        self.polygons = polygons
+        self.related = related
+        self.transistors = transistors
+        self.contacts = contacts
+        self.buses = buses
+        self.layers = layers
+        self.pairs = pairs
+
+
+    def box(self):
+        return union_box([self.polygons.box()] + [layer.box() for layer in self.layers.values()])
+
+
+class HierarchyExtractor:
+    def __init__(self, circuit, layout, executor=None):
+        self.circuit = circuit
+        self.layout = layout
+        self.executor = executor
+        self.extractions = {}
+        self.active = set()
+
+
+    def extract(self, cell):
+        if cell.symbol in self.extractions:
+            return self.extractions[cell.symbol]
+        if cell.symbol in self.active:
+            raise ValueError(f"Recursive CIF symbol call: {cell.symbol}")
+        self.active.add(cell.symbol)
+
+        extraction = None
+        if cell.calls and all(is_manhattan(transform) for _, transform in cell.calls):
+            parts = []
+            if any(len(builder) for builder in cell.layers.values()):
+                parts.append((self.extract_leaf(cell.layers), IDENTITY))
+            for symbol, transform in cell.calls:
+                if symbol not in self.layout.cells:
+                    raise ValueError(f"Call of undefined CIF symbol: {symbol}")
+                parts.append((self.extract(self.layout.cells[symbol]), transform))
+            extraction = self.compose(parts)
+        if extraction is None:
+            # Экземпляры влияют на приборы друг друга - ячейка разворачивается целиком
+            builders, _ = self.layout.flatten(cell)
+            extraction = self.extract_leaf(builders)
+
+        self.active.discard(cell.symbol)
+        self.extractions[cell.symbol] = extraction
+        return extraction
+
+
+    def extract_leaf(self, builders):
+        circuit = type(self.circuit)(self.circuit.name, self.circuit.geometry)
+        circuit.add_layers(builders)
+        circuit.find_all_transistors(self.executor)
+        circuit.find_all_contacts(self.executor)
+
+        keys = {}
+        polygons = []
+        related = []
+
+        def key(polygon, is_related=True):
+            k = keys.get(id(polygon))
+            if k is None:
+                k = keys[id(polygon)] = len(polygons)
+                polygons.append(polygon)
+                related.append(is_related)
+            elif is_related:
+                related[k] = True
+            return k
+
+        transistors = [(trans.type, key(trans.gate), key(trans.drain), key(trans.source)) for trans in circuit.transistors]
+        contacts = [(CONTACT_STAGES.index(contact.name), contact.name, contact.layer1, contact.layer2,
+                     key(contact.polygon_contact), key(contact.polygon_layer, False)) for contact in circuit.contacts]
+        buses = []
+        for layer_name in BUS_LAYERS:
+            layer = circuit.find_layer(layer_name)
+            if layer is not None:
+                buses.extend((layer_name, key(polygon)) for polygon in layer.polygons)
+
+        related = np.array(related, dtype=bool)
+        related_keys = np.flatnonzero(related)
+        related_polygons = [polygons[k] for k in related_keys]
+        pairs = np.array(circuit.find_overlaps(related_polygons, related_polygons, accept=lambda i, j: i <= j), dtype=np.int64).reshape(-1, 2)
+        layers = {layer.name: PackedPolygons.from_polygons([polygon for polygon in layer.polygons if polygon]) for layer in circuit.layers}
+        return CellExtraction(PackedPolygons.from_polygons(polygons), related, transistors, contacts, buses, layers, related_keys[pairs])
+
+
+    def compose(self, parts):
+        placed = []
+        base = 0
+        for extraction, transform in parts:
+            layers = {name: layer.transformed(transform) for name, layer in extraction.layers.items()}
+            placed.append((extraction, extraction.polygons.transformed(transform), layers, base))
+            base += len(extraction.polygons)
+        boxes = [union_box([polygons.box()] + [layer.box() for layer in layers.values()]) for _, polygons, layers, _ in placed]
+
+        index = SpatialIndex(cell_size=SpatialIndex.estimate_cell_size([box for box in boxes if box is not None]))
+        for a, box in enumerate(boxes):
+            index.insert_box(a, box)
+        cross = []
+        for a, box in enumerate(boxes):
+            for b in index.query_box(box):
+                if b <= a:
+                    continue
+                region = intersect_boxes(box, boxes[b])
+                if self.interacts(placed[a], placed[b], region) or self.interacts(placed[b], placed[a], region):
+                    return None
+                cross.extend(self.cross_pairs(placed[a], placed[b], region))
+
+        transistors = []
+        contacts = []
+        buses = []
+        for extraction, _, _, base in placed:
+            transistors.extend((kind, gate + base, drain + base, source + base) for kind, gate, drain, source in extraction.transistors)
+            contacts.extend((stage, name, layer1, layer2, contact + base, layer + base) for stage, name, layer1, layer2, contact, layer in extraction.contacts)
+            buses.extend((layer, k + base) for layer, k in extraction.buses)
+        layers = {}
+        for _, _, placed_layers, _ in placed:
+            for name, layer in placed_layers.items():
+                layers.setdefault(name, []).append(layer)
+        pairs = [extraction.pairs + base for extraction, _, _, base in placed]
+        pairs.append(np.array(cross, dtype=np.int64).reshape(-1, 2))
+        return CellExtraction(PackedPolygons.concat([polygons for _, polygons, _, _ in placed]),
+                              np.concatenate([extraction.related for extraction, _, _, _ in placed]),
+                              transistors, contacts, buses,
+                              {name: PackedPolygons.concat(parts) for name, parts in layers.items()},
+                              np.concatenate(pairs))
+
+
+    def interacts(self, first, second, region):
+        layers1, layers2 = first[2], second[2]
+
+        def near(layers, name):
+            layer = layers.get(name)
+            return [] if layer is None else layer.polygons(layer.select(region))
+
+        rules = list(INTERACTIONS)
+        if "CNE" in layers1 or "CPE" in layers1:
+            rules.append(("touch", "NA", "M1"))
+        for mode, name1, name2 in rules:
+            polygons1 = near(layers1, name1)
+            polygons2 = near(layers2, name2) if polygons1 else []
+            if not polygons2:
+                continue
+            if mode == "equal":
+                if set(map(tuple, polygons1)) & set(map(tuple, polygons2)):
+                    return True
+                continue
+            pairs = self.circuit.find_overlaps(polygons1, polygons2)
+            if mode == "touch" and pairs:
+                return True
+            if mode == "area" and any(self.circuit.geometry_module.polygons_overlap(polygons1[i], polygons2[j], "area") for i, j in pairs):
+                return True
+        return False
+
+
+    def cross_pairs(self, first, second, region):
+        extraction1, polygons1, _, base1 = first
+        extraction2, polygons2, _, base2 = second
+        near1 = polygons1.select(region, extraction1.related)
+        near2 = polygons2.select(region, extraction2.related)
+        if not len(near1) or not len(near2):
+            return []
+        found = self.circuit.find_overlaps(polygons1.polygons(near1), polygons2.polygons(near2))
+        return [(base1 + int(near1[i]), base2 + int(near2[j])) for i, j in found]
@@ -0,0 +1,159 @@
+import os
+
+
+GROUND = "0"
+
+
+def logical_lines(file):
+    # Строки-продолжения "+ ..." приклеиваются к предыдущей, комментарии
+    # ("*" в начале строки, "$" и ";" внутри) отбрасываются
+    pending = None
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith('*'):
+            continue
+        for mark in ('$', ';'):
+            position = line.find(mark)
+            if position >= 0:
+                line = line[:position].rstrip()
+        if not line:
+            continue
+        if line.startswith('+'):
+            if pending is not None:
+                pending += ' ' + line[1:].strip()
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending is not None:
+        yield pending
+
+
+def positional(fields):
+    # Параметры "w=1u", "params: ..." к соединениям не относятся
+    result = []
+    for field in fields:
+        if field.lower() == "params:":
+            break
+        if '=' not in field:
+            result.append(field)
+    return result
+
+
+class Subcircuit:
+    def __init__(self, name, pins):
+        self.name = name
+        self.pins = pins
+        self.devices = []
+        self.instances = []
+        self.flat = None
+
+
+class SpiceNetlist:
+    def __init__(self):
+        self.top = Subcircuit(None, [])
+        self.subcircuits = {}
+        self.models = {}
+        self.globals = {GROUND}
+        self.active = set()
+
+
+    def read(self, filename):
+        current = self.top
+        # Прежние карты TP/TN допустимы только в файлах старого формата .net,
+        # подключённых через .include: в SPICE карта T - линия передачи
+        legacy = filename.lower().endswith(".net")
+        with open(filename, 'r') as file:
+            for line in logical_lines(file):
+                fields = line.split()
+                keyword = fields[0].lower()
+                if keyword == ".subckt":
+                    pins = positional(fields[2:])
+                    current = self.subcircuits[fields[1].lower()] = Subcircuit(fields[1], pins)
+                elif keyword == ".ends":
+                    current = self.top
+                elif keyword == ".model" and len(fields) >= 3:
+                    self.models[fields[1].lower()] = fields[2].lower().split('(')[0]
+                elif keyword == ".global":
+                    self.globals.update(name.lower() for name in fields[1:])
+                elif keyword in (".include", ".inc"):
+                    self.read(os.path.join(os.path.dirname(filename), fields[1].strip('"\'')))
+                elif keyword == ".end":
+                    break
+                elif keyword[0] == 'm':
+                    nets = positional(fields[1:])
+                    if len(nets) < 5:
+                        raise ValueError(f"MOSFET needs drain, gate, source, bulk and model: {line}")
+                    drain, gate, source = nets[0], nets[1], nets[2]
+                    current.devices.append((self.device_type(nets[4]), gate, drain, source))
+                elif keyword[0] == 't':
+                    if not legacy:
+                        raise ValueError(f"Transmission lines are not supported: {line}")
+                    if len(fields) < 4 or fields[0][1:2].upper() not in ("N", "P"):
+                        raise ValueError(f"Legacy transistor card needs TN/TP, source, gate and drain: {line}")
+                    # Прежний формат: TP1 исток затвор сток подложка
+                    current.devices.append((fields[0][1].upper(), fields[2], fields[3], fields[1]))
+                elif keyword[0] == 'x':
+                    nets = positional(fields[1:])
+                    if not nets:
+                        raise ValueError(f"Subcircuit instance without subcircuit name: {line}")
+                    current.instances.append((fields[0], nets[-1].lower(), nets[:-1]))
+        return self
+
+
+    def device_type(self, model):
+        kind = self.models.get(model.lower(), model.lower())
+        if kind.startswith('n'):
+            return "N"
+        if kind.startswith('p'):
+            return "P"
+        raise ValueError(f"Unknown MOSFET model type: {model}")
+
+
+    def template(self, subcircuit):
+        # Развёрнутая ячейка: список цепей (сначала выводы) и транзисторы
+        # с номерами цепей. Строится один раз, экземпляры только перенумеровывают
+        if subcircuit.flat is not None:
+            return subcircuit.flat
+        if subcircuit.name in self.active:
+            raise ValueError(f"Recursive subcircuit: {subcircuit.name}")
+        self.active.add(subcircuit.name)
+
+        def canonical(name):
+            # Глобальные цепи, как и питание в supply_nets, не зависят от регистра
+            return name.lower() if name.lower() in self.globals else name
+
+        # Выводы нормализуются так же, как цепи тела: вывод с именем
+        # глобальной цепи остаётся выводом и подключается снаружи
+        nets = list(subcircuit.pins)
+        index = {canonical(name): k for k, name in enumerate(nets)}
+
+        def net(name):
+            name = canonical(name)
+            k = index.get(name)
+            if k is None:
+                k = index[name] = len(nets)
+                nets.append(name)
+            return k
+
+        devices = [(kind, net(gate), net(drain), net(source)) for kind, gate, drain, source in subcircuit.devices]
+        for instance, name, connections in subcircuit.instances:
+            child = self.subcircuits.get(name)
+            if child is None:
+                raise ValueError(f"Instance {instance} of undefined subcircuit {name}")
+            if len(connections) != len(child.pins):
+                raise ValueError(f"Instance {instance} connects {len(connections)} nets to {len(child.pins)} pins of {child.name}")
+            child_nets, child_devices = self.template(child)
+            mapping = [net(connection) for connection in connections]
+            mapping.extend(net(name if name.lower() in self.globals else f"{instance}.{name}") for name in child_nets[len(child.pins):])
+            devices.extend((kind, mapping[gate], mapping[drain], mapping[source]) for kind, gate, drain, source in child_devices)
+
+        self.active.discard(subcircuit.name)
+        subcircuit.flat = nets, devices
+        return subcircuit.flat
+
+
+    def expand(self, subcircuit=None):
+        subcircuit = self.top if subcircuit is None else subcircuit
+        nets, devices = self.template(subcircuit)
+        return [(kind, nets[gate], nets[drain], nets[source]) for kind, gate, drain, source in devices]
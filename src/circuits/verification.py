@@ -1,280 +1,243 @@
-from src.algorithms.vf2 import subgraph_monomorphism
-from src.algorithms.vf2 import subgraph_isomorphism
+from src.algorithms.vf2 import subgraph_embeddings
+from src.algorithms.compact_graph import CompactGraph, refine_colours
+from src.algorithms.component_decomposition import compare_components, supply_pairs
+from src.algorithms.mismatch_localization import localize_mismatches
+from src.algorithms.pattern_library import PatternLibrary
+from src.algorithms.series_parallel import reduce_series_parallel
 from src.circuits.ElectricalСircuit import ElecrticalCircuit
 from src.circuits.TopologicalCircuit import TopologicalCircuit
-from collections import defaultdict
+from src.circuits.circuit_cache import VerificationRecord
 from timeit import default_timer as timer
+import numpy as np
+import os
 
-def compress_parallel_nodes(nx_graph):
-    G = nx_graph.copy()
-    new_node_id = max(G.nodes) + 1
-    grouped = defaultdict(list)
+def count_labels(codes, labels, scale=1):
+    values, counts = np.unique(codes, return_counts=True)
+    return {labels[value]: count // scale for value, count in zip(values.tolist(), counts.tolist())}
 
-    for node in G.nodes:
-        if G.degree[node] != 3:
-            continue
-        label = G.nodes[node].get('label')
-        if label not in ['N', 'P']:
-            continue
 
-        neighbors = list(G.neighbors(node))
-        neighbors_set = frozenset(neighbors)
+def describe_difference(first, second):
+    keys = sorted(set(first) | set(second), key=str)
+    return ", ".join(f"{key}: {first.get(key, 0)} != {second.get(key, 0)}" for key in keys if first.get(key, 0) != second.get(key, 0))
 
-        edge_labels = tuple(
-            sorted((n, G.get_edge_data(node, n).get('label')) for n in neighbors)
-        )
 
-        key = (label, neighbors_set, edge_labels)
-        grouped[key].append(node)
+def check_counts(graph1, graph2, labels):
+    nodes1, nodes2 = count_labels(graph1.node_labels, labels), count_labels(graph2.node_labels, labels)
+    if nodes1 != nodes2:
+        return f"node counts differ ({describe_difference(nodes1, nodes2)})"
+    edges1, edges2 = count_labels(graph1.edge_labels, labels, 2), count_labels(graph2.edge_labels, labels, 2)
+    if edges1 != edges2:
+        return f"edge counts differ ({describe_difference(edges1, edges2)})"
+    return None
 
-    for (label, neighbors_set, _), nodes in grouped.items():
-        if len(nodes) < 2:
-            continue
 
-        new_node = new_node_id
-        new_node_id += 1
-        G.add_node(new_node)
-        G.nodes[new_node]['label'] = label
+def degree_histogram(graph, labels):
+    pairs, counts = np.unique(np.stack((graph.node_labels, graph.degrees), axis=1), axis=0, return_counts=True)
+    return {(labels[label], degree): count for (label, degree), count in zip(pairs.tolist(), counts.tolist())}
 
-        for neighbor in neighbors_set:
-            edge_label = G.get_edge_data(nodes[0], neighbor).get('label')
-            G.add_edge(new_node, neighbor)
-            if edge_label is not None:
-                G[new_node][neighbor]['label'] = edge_label
 
-        for n in nodes:
-            G.remove_node(n)
+def check_degrees(graph1, graph2, labels):
+    histogram1, histogram2 = degree_histogram(graph1, labels), degree_histogram(graph2, labels)
+    if histogram1 != histogram2:
+        return f"degree histograms differ ({describe_difference(histogram1, histogram2)})"
+    return None
 
-    return G
 
-def compress_series_nodes(nx_graph):
-    G = nx_graph.copy()
-    visited = set()
-    new_node_id = max(G.nodes) + 1
-    components_to_merge = []
+def check_colours(graph1, graph2, labels):
+    for iteration, (colours1, colours2) in enumerate(refine_colours([graph1, graph2])):
+        size = max(colours1.max(initial=-1), colours2.max(initial=-1)) + 1
+        histogram1, histogram2 = np.bincount(colours1, minlength=size), np.bincount(colours2, minlength=size)
+        if not np.array_equal(histogram1, histogram2):
+            differ = np.flatnonzero(histogram1 != histogram2)
+            return f"WL colour histograms differ at iteration {iteration} ({len(differ)} colour classes)"
+    return None
 
-    for node in G.nodes:
-        if node in visited:
-            continue
 
-        degree = G.degree[node]
-        label = G.nodes[node].get('label')
+# Дешёвые инварианты по возрастанию стоимости; VF2 запускается, только
+# если все они совпали
+VERIFICATION_STAGES = [
+    ("counts", check_counts),
+    ("degrees", check_degrees),
+    ("colours", check_colours),
+]
 
-        if degree != 3 or label not in ['N', 'P']:
-            continue
 
-        queue = [node]
-        component = set()
-        local_visited = set()
-        valid_label = label
-
-        while queue:
-            current = queue.pop()
-            if current in local_visited:
-                continue
-
-            current_degree = G.degree[current]
-            current_label = G.nodes[current].get('label')
-
-            if current_degree == 3 and current_label != valid_label:
-                continue
-            if current_degree not in [2, 3]:
-                continue
-
-            local_visited.add(current)
-            component.add(current)
-
-            for neighbor in G.neighbors(current):
-                edge_data = G.get_edge_data(current, neighbor, default={})
-                neighbor_degree = G.degree[neighbor]
-
-                if neighbor_degree == 2 and edge_data.get('label') == 'gate':
-                    continue
-
-                if neighbor not in local_visited:
-                    queue.append(neighbor)
-
-        deg3_nodes = [n for n in component if G.degree[n] == 3]
-        if len(deg3_nodes) >= 2:
-            components_to_merge.append((component, valid_label))
-            visited.update(component)
-
-    for comp, label in components_to_merge:
-        new_node = new_node_id
-        new_node_id += 1
+def run_stages(G1, G2, stages=VERIFICATION_STAGES):
+    timings = {}
+    start_time = timer()
+    vocabulary = {}
+    graph1 = CompactGraph.from_networkx(G1, vocabulary)
+    graph2 = CompactGraph.from_networkx(G2, vocabulary)
+    labels = {code: label for label, code in vocabulary.items()}
+    timings["compact"] = timer() - start_time
+
+    for name, check in stages:
+        start_time = timer()
+        reason = check(graph1, graph2, labels)
+        timings[name] = timer() - start_time
+        if reason is not None:
+            return False, f"{name}: {reason}", timings
+    return True, None, timings
+
+
+def load_electrical(filename_electrical, name_electrical=None):
+    electrical_circuit = ElecrticalCircuit(name_electrical)
+    electrical_circuit.load(filename_electrical)
+    electrical_circuit.compile()
+    return electrical_circuit
 
-        G.add_node(new_node)
-        G.nodes[new_node]['label'] = label
 
-        external_neighbors = set()
-        for n in comp:
-            for nb in G.neighbors(n):
-                if nb not in comp:
-                    external_neighbors.add(nb)
+def load_topological(filename_topological, name_topological=None, cache=None):
+    topological_circuit = TopologicalCircuit(name_topological)
+    if cache is not None:
+        cache.compile(topological_circuit, filename_topological)
+    else:
+        topological_circuit.load_CIF(filename_topological)
+        topological_circuit.compile()
+    return topological_circuit
 
-        for nb in external_neighbors:
-            G.add_edge(new_node, nb)
 
-        for n in comp:
-            G.remove_node(n)
+def reduce_circuit(circuit):
+    return reduce_series_parallel(circuit.nx_graph)
 
-    return G
 
-def verification(filename_electrical, name_electrical=None, filename_topological=None, name_topological=None, topological_circuit=None):
+def verification(filename_electrical, name_electrical=None, filename_topological=None, name_topological=None, topological_circuit=None, cache=None,
+                 split_supplies=True, workers=1, results=None):
     start_time = timer()
-    electrical_circuit = ElecrticalCircuit(name_electrical)
-    electrical_circuit.load_NET(filename_electrical)
-    electrical_circuit.compile()
-    
+    electrical_circuit = load_electrical(filename_electrical, name_electrical)
     if topological_circuit == None:
-        topological_circuit = TopologicalCircuit(name_topological)
-        topological_circuit.load_CIF(filename_topological)
-        topological_circuit.compile()
-
+        topological_circuit = load_topological(filename_topological, name_topological, cache)
+    key = None
+    if results is not None:
+        key = results.key(electrical_circuit.nx_graph, topological_circuit.nx_graph, split_supplies, electrical_circuit.supply_nets())
+    return verify_compiled(electrical_circuit, topological_circuit, split_supplies, workers, results, key, start_time=start_time)
+
+
+def verify_compiled(electrical_circuit, topological_circuit, split_supplies=True, workers=1, results=None, key=None,
+                    reduce=reduce_circuit, start_time=None):
+    # Проверка уже скомпилированных схем; reduce - сжатие графа схемы,
+    # VerificationSession подставляет сюда сжатие со своим кэшем
+    start_time = timer() if start_time is None else start_time
     print(f"electrical circuit : {electrical_circuit.nx_graph.number_of_nodes()} : {electrical_circuit.nx_graph.number_of_edges()}")
     print(f"topological circuit : {topological_circuit.nx_graph.number_of_nodes()} : {topological_circuit.nx_graph.number_of_edges()}")
-    G1 = compress_series_nodes(electrical_circuit.nx_graph) 
-    G1 = compress_parallel_nodes(G1)
-    G2 = compress_series_nodes(topological_circuit.nx_graph)
-    G2 = compress_parallel_nodes(G2)
+
+    # Повторная проверка той же пары графов берёт результат из ResultCache
+    if results is not None:
+        record = results.get(key)
+        if record is not None:
+            print("cached result")
+            print("The graphs are isomorphic." if record.isomorph else "The graphs are not isomorphic.")
+            return record.isomorph, record.lost_connections, timer() - start_time
+
+    # Последовательные и параллельные транзисторы сливаются до неподвижной
+    # точки; origins - исходные приборы каждого прибора сжатого графа
+    G1, origins1 = reduce(electrical_circuit)
+    G2, origins2 = reduce(topological_circuit)
 
     print(f"electrical circuit : {G1.number_of_nodes()} : {G1.number_of_edges()}")
     print(f"topological circuit : {G2.number_of_nodes()} : {G2.number_of_edges()}")
 
-    isomorph, _ = subgraph_isomorphism(G2, G1)
-    
+    # Цепи питания, объявленные в списке соединений, сопоставляются
+    # заранее и служат якорями
+    supplies = electrical_circuit.supply_nets()
+    mapping = {}
+    passed, reason, timings = run_stages(G1, G2)
+    if passed:
+        # Схемы сравниваются целиком уточнением разбиения, независимые
+        # блоки (после разреза по цепям питания) - по отдельности,
+        # при workers > 1 - в нескольких процессах
+        start = timer()
+        result = compare_components(G1, G2, split_supplies, workers, supplies)
+        timings["lvs"] = timer() - start
+        isomorph = result.equivalent
+        mapping = {**result.devices, **result.nets}
+        print(f"components : {len(result.timings)}")
+        for size, elapsed in sorted(result.timings, key=lambda timing: -timing[1])[:3]:
+            print(f"component {size} nodes : {elapsed:.6f} s")
+        if not isomorph:
+            print(f"Unmatched classes : {len(result.unmatched)}")
+            for side, (name, origins) in enumerate((("electrical", origins1), ("topological", origins2))):
+                devices = [device for classes in result.unmatched for node in classes[side] for device in origins.get(node, ())]
+                print(f"Unmatched {name} devices : {len(devices)}")
+    else:
+        print(f"Invariant mismatch : {reason}")
+        isomorph = False
+    for name, elapsed in timings.items():
+        print(f"stage {name} : {elapsed:.6f} s")
+
     if isomorph:
         print("The graphs are isomorphic.")
-        end_time = timer()
-        elapsed_time = end_time - start_time
-        return True, [], elapsed_time
+        lost_connection = []
     else:
         print("The graphs are not isomorphic.")
-        lost_connection = search_lost_connections(electrical_circuit.nx_graph, topological_circuit.nx_graph)
-        end_time = timer()
-        elapsed_time = end_time - start_time
-        return False, lost_connection, elapsed_time
+        # Сжатие не трогает цепи, поэтому пары годятся и для исходных графов.
+        # Частичное соответствие сравнения становится якорями поиска дефектов;
+        # слитые приборы в него не входят - их номер называет лишь один из
+        # исходных транзисторов
+        anchors = supply_pairs(G1, G2, supplies)
+        seed = {node1: node2 for node1, node2 in mapping.items() if len(origins1.get(node1, ())) <= 1 and len(origins2.get(node2, ())) <= 1}
+        lost_connection = search_lost_connections(electrical_circuit.nx_graph, topological_circuit.nx_graph, anchors, seed)
+    if results is not None:
+        results.put(key, VerificationRecord(isomorph, mapping, lost_connection))
+    end_time = timer()
+    elapsed_time = end_time - start_time
+    return isomorph, lost_connection, elapsed_time
         
-def search_lost_connections(el_graph, top_graph):
-    electrical_graph = el_graph.copy()
-    topological_graph = top_graph.copy()
-    el_degrees = dict(electrical_graph.degree())
-
-    # Подсчитываем сколько вершин каждой степени
-    el_degree_counts = {}
-
-    for degree in el_degrees.values():
-        if degree in el_degree_counts:
-            el_degree_counts[degree] += 1
-        else:
-            el_degree_counts[degree] = 1
-
-    top_degrees = dict(topological_graph.degree())
-
-    # Подсчитываем сколько вершин каждой степени
-    top_degree_counts = {}
-
-    for degree in top_degrees.values():
-        if degree in top_degree_counts:
-            top_degree_counts[degree] += 1
-        else:
-            top_degree_counts[degree] = 1
-
-    diff_degrees = {}
-    sum_el = sum_top = 0
-    for degree in set(el_degree_counts) | set(top_degree_counts):
-        el_count = el_degree_counts.get(degree, 0)
-        top_count = top_degree_counts.get(degree, 0)
-        if el_count != top_count:
-            print(f"Степень {degree}: {el_count} вершины и {top_count} вершины")
-            sum_el += el_count
-            sum_top += top_count
-            diff_degrees[degree] = el_count - top_count
-
-    
-    if sum(k * v for k, v in diff_degrees.items()) != 0:
-        return []
-    
-    for node, degree in top_degrees.items():
-        if degree in diff_degrees:
-            topological_graph.nodes[node]["label"] = "potential"
-    
-    for node, degree in el_degrees.items():
-        if degree in diff_degrees:
-            electrical_graph.nodes[node]["label"] = "potential"
-
-    positive_diff_degrees = {k for k, v in diff_degrees.items() if v > 0}
-    removable_el_nodes = [
-        n for n, d in electrical_graph.nodes(data=True)
-        if d.get("label") == "potential" and electrical_graph.degree[n] in positive_diff_degrees
-    ]
-    negative_diff_degrees = {k for k, v in diff_degrees.items() if v < 0}
-    removable_top_nodes = [
-        n for n, d in topological_graph.nodes(data=True)
-        if d.get("label") == "potential" and topological_graph.degree[n] in negative_diff_degrees
-    ]
-    if(len(removable_el_nodes) <= len(removable_top_nodes)):
-        for node_to_remove in removable_el_nodes:
-            G_copy = electrical_graph.copy()
-            G_copy.remove_node(node_to_remove)
-            print(f"Удаляем из электрического: {node_to_remove}")
-
-            isomorphic, mapping = subgraph_isomorphism(G_copy, topological_graph)
-            if isomorphic:
-                print(f"Удалена лишняя вершина электрического: {node_to_remove}")
-                lost_connection = [n for n in topological_graph.nodes() if n not in mapping.keys()]
-                return lost_connection
-    else:
-        for node_to_remove in removable_top_nodes:
-            G_copy = topological_graph.copy()
-            G_copy.remove_node(node_to_remove)
-            print(f"Удаляем из топологического: {node_to_remove}")
+def search_lost_connections(el_graph, top_graph, supplies=None, seed=None):
+    # Один проход роста сопоставления от якорей: без пары остаются только
+    # вершины у дефектов, сколько бы обрывов и замыканий ни было
+    report = localize_mismatches(el_graph, top_graph, seed, supplies)
+    print(f"Вершины без пары: электрический граф - {len(report.unmatched[0])}, топологический граф - {len(report.unmatched[1])}")
+    print(f"Вершины с разными соседями: {len(report.suspects[1])}")
+    return report.nodes(1)
+
 
-            monomorphic, mapping = subgraph_monomorphism(electrical_graph, G_copy)
-            if monomorphic:
-                print(f"Удалена лишняя вершина топологического: {node_to_remove}")
-                lost_connection = [n for n in topological_graph.nodes() if n not in mapping.values()]
-                return lost_connection
-            
-    return []
 
+def search_subcircuit(filename_electrical, name_electrical=None, filename_topological=None, name_topological=None, topological_circuit=None, cache=None):
+    start_time = timer()
+    electrical_circuit = load_electrical(filename_electrical, name_electrical)
+    if topological_circuit == None:
+        topological_circuit = load_topological(filename_topological, name_topological, cache)
+    subcircuits = find_subcircuits(electrical_circuit, topological_circuit.nx_graph)
+    end_time = timer()
+    elapsed_time = end_time - start_time
+    return subcircuits, elapsed_time
+
+
+def find_subcircuits(electrical_circuit, target):
+    # target - граф топологии или его CompiledTarget. Рёбра найденного
+    # экземпляра исключаются прямо в состоянии перебора, поэтому все
+    # экземпляры находятся за один обход
+    subcircuits = [mapping.keys() for mapping in subgraph_embeddings(electrical_circuit.nx_graph, target)]
+    if not subcircuits:
+        print("The subcircuit is not found.")
+    return subcircuits
 
 
-def search_subcircuit(filename_electrical, name_electrical=None, filename_topological=None, name_topological=None, topological_circuit=None):
+def load_pattern_library(filenames_electrical):
+    # Каждая ячейка читается и компилируется один раз, дальше библиотеку
+    # можно искать в любом числе топологий
+    library = PatternLibrary()
+    for filename in filenames_electrical:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        library.add(name, load_electrical(filename, name).nx_graph)
+    return library
+
+
+def search_library(library, filename_topological=None, name_topological=None, topological_circuit=None, cache=None):
     start_time = timer()
-    electrical_circuit = ElecrticalCircuit(name_electrical)
-    electrical_circuit.load_NET(filename_electrical)
-    electrical_circuit.compile()
-    
     if topological_circuit == None:
-        topological_circuit = TopologicalCircuit(name_topological)
-        topological_circuit.load_CIF(filename_topological)
-        topological_circuit.compile()
+        topological_circuit = load_topological(filename_topological, name_topological, cache)
+
+    matches = find_library_matches(library, topological_circuit.nx_graph)
+    end_time = timer()
+    elapsed_time = end_time - start_time
+    return matches, elapsed_time
 
-    G_copy = topological_circuit.nx_graph.copy()
-    subcircuits = []
-    isomorph, mapping = subgraph_isomorphism(electrical_circuit.nx_graph, G_copy)
-    while isomorph:
-        subcircuits.append(mapping.keys())
-        for u, v in electrical_circuit.nx_graph.edges():
-            mapped_u = None
-            mapped_v = None
-
-            for copy_node, subgraph_node in mapping.items():
-                if subgraph_node == u:
-                    mapped_u = copy_node
-                elif subgraph_node == v:
-                    mapped_v = copy_node
-
-            if mapped_u is not None and mapped_v is not None and G_copy.has_edge(mapped_u, mapped_v):
-                G_copy.remove_edge(mapped_u, mapped_v)
-                
-        isomorph, mapping = subgraph_isomorphism(electrical_circuit.nx_graph, G_copy)
-    else:
-        print("The subcircuit is not found.")
-        end_time = timer()
-        elapsed_time = end_time - start_time
-        return subcircuits, elapsed_time
-    
 
-    
\ No newline at end of file
+def find_library_matches(library, target):
+    # target - граф топологии или его CompiledTarget, как у find_subcircuits
+    matches = library.search(target)
+    for name, count in matches.counts.items():
+        print(f"{name} : {count}")
+    return matches
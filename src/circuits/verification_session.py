@@ -0,0 +1,139 @@
+from src.algorithms.vf2 import CompiledTarget
+from src.circuits.circuit_cache import graph_digest
+from src.circuits.verification import find_library_matches, find_subcircuits, load_electrical, load_topological, reduce_circuit, verify_compiled
+from timeit import default_timer as timer
+import os
+
+
+def file_stamp(filename):
+    # Файл считается изменённым, если у него другие время записи или размер
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SessionSide:
+    # Одна сторона сессии: скомпилированная схема и всё, что из неё
+    # выводится (сжатый граф, хэш, индексы поиска). Всё это сбрасывается
+    # вместе, когда меняется файл схемы
+    def __init__(self, filename, name, load):
+        self.filename = filename
+        self.name = name
+        self.load = load
+        self.stamp = None
+        self.circuit = None
+        self.derived = {}
+
+
+    def invalidate(self):
+        self.stamp = None
+        self.circuit = None
+        self.derived = {}
+
+
+    def get(self):
+        stamp = file_stamp(self.filename)
+        if self.circuit is None or stamp != self.stamp:
+            self.invalidate()
+            self.circuit = self.load(self.filename, self.name)
+            self.stamp = stamp
+        return self.circuit
+
+
+    def adopt(self, circuit):
+        # Схема, уже загруженная из файла стороны (например, в потоке GUI)
+        self.invalidate()
+        self.circuit = circuit
+        self.stamp = file_stamp(self.filename)
+
+
+    def derive(self, name, build):
+        circuit = self.get()
+        value = self.derived.get(name)
+        if value is None:
+            value = self.derived[name] = build(circuit)
+        return value
+
+
+class VerificationSession:
+    # Схемы, открытые в GUI: каждая компилируется один раз, проверка, повторная
+    # проверка и поиск подсхем пользуются общими сжатыми графами и индексами.
+    # Перед каждым действием стороны сверяются со своими файлами, и
+    # изменившаяся сторона перестраивается независимо от другой
+    def __init__(self, cache=None, results=None, split_supplies=True, workers=1):
+        self.cache = cache
+        self.results = results
+        self.split_supplies = split_supplies
+        self.workers = workers
+        self.electrical_side = None
+        self.topological_side = None
+
+
+    def open_electrical(self, filename, name=None):
+        self.electrical_side = SessionSide(filename, name, load_electrical)
+
+
+    def open_topological(self, filename, name=None, circuit=None):
+        self.topological_side = SessionSide(filename, name, lambda filename, name: load_topological(filename, name, self.cache))
+        if circuit is not None:
+            self.topological_side.adopt(circuit)
+
+
+    def sides(self):
+        if self.electrical_side is None or self.topological_side is None:
+            raise ValueError("Both circuits must be opened before verification")
+        return self.electrical_side, self.topological_side
+
+
+    def invalidate(self):
+        for side in (self.electrical_side, self.topological_side):
+            if side is not None:
+                side.invalidate()
+
+
+    @property
+    def electrical(self):
+        return self.sides()[0].get()
+
+
+    @property
+    def topological(self):
+        return self.sides()[1].get()
+
+
+    def reduce(self, circuit):
+        for side in self.sides():
+            if side.circuit is circuit:
+                return side.derive("reduced", reduce_circuit)
+        return reduce_circuit(circuit)
+
+
+    def key(self):
+        electrical, topological = self.sides()
+        return self.results.digest_key(electrical.derive("digest", lambda circuit: graph_digest(circuit.nx_graph)),
+                                       topological.derive("digest", lambda circuit: graph_digest(circuit.nx_graph)),
+                                       self.split_supplies, electrical.derive("supplies", lambda circuit: circuit.supply_nets()))
+
+
+    def verify(self):
+        start_time = timer()
+        electrical, topological = self.electrical, self.topological
+        key = self.key() if self.results is not None else None
+        return verify_compiled(electrical, topological, self.split_supplies, self.workers, self.results, key,
+                               reduce=self.reduce, start_time=start_time)
+
+
+    def target(self):
+        # Граф топологии для поиска подсхем и ячеек библиотеки строится один раз
+        return self.sides()[1].derive("target", lambda circuit: CompiledTarget(circuit.nx_graph))
+
+
+    def search_subcircuit(self):
+        start_time = timer()
+        subcircuits = find_subcircuits(self.electrical, self.target())
+        return subcircuits, timer() - start_time
+
+
+    def search_library(self, library):
+        start_time = timer()
+        matches = find_library_matches(library, self.target())
+        return matches, timer() - start_time
@@ -5,6 +5,9 @@
 #include <utility>
 #include <set>
 #include <cmath>
+#include <limits>
+#include <stdexcept>
+#include <string>
 
 
 // Функция для вычисления ориентации
@@ -282,3 +285,135 @@ std::pair<std::vector<std::pair<double, double>>, std::vector<std::pair<double,
     return {{}, {}};
 }
 
+double polygon_area(const std::vector<std::pair<double, double>>& polygon)
+{
+    double area = 0;
+    int n = polygon.size();
+    for(int i = 0; i < n; ++i)
+    {
+        const auto& p1 = polygon[i];
+        const auto& p2 = polygon[(i + 1) % n];
+        area += p1.first * p2.second - p2.first * p1.second;
+    }
+    return std::abs(area) / 2;
+}
+
+std::tuple<double, double, double, double> polygon_bounds(const std::vector<std::pair<double, double>>& polygon)
+{
+    double xmin = std::numeric_limits<double>::max(), ymin = std::numeric_limits<double>::max();
+    double xmax = std::numeric_limits<double>::lowest(), ymax = std::numeric_limits<double>::lowest();
+    for(const auto& p : polygon)
+    {
+        xmin = std::min(xmin, p.first);
+        ymin = std::min(ymin, p.second);
+        xmax = std::max(xmax, p.first);
+        ymax = std::max(ymax, p.second);
+    }
+    return std::make_tuple(xmin, ymin, xmax, ymax);
+}
+
+bool is_axis_rectangle(const std::vector<std::pair<double, double>>& polygon)
+{
+    if(polygon.size() != 4) return false;
+    for(size_t i = 0; i < 4; ++i)
+    {
+        const auto& p1 = polygon[i];
+        const auto& p2 = polygon[(i + 1) % 4];
+        if((p1.first == p2.first) == (p1.second == p2.second)) return false;
+    }
+    return polygon[0].first != polygon[2].first && polygon[0].second != polygon[2].second;
+}
+
+bool polygons_touch(const std::vector<std::pair<double, double>>& polygon1,
+                    const std::vector<std::pair<double, double>>& polygon2)
+{
+    int n1 = polygon1.size();
+    int n2 = polygon2.size();
+    for(int i = 0; i < n1; ++i)
+    {
+        for(int j = 0; j < n2; ++j)
+        {
+            if(std::get<0>(do_lines_intersect(polygon1[i], polygon1[(i + 1) % n1], polygon2[j], polygon2[(j + 1) % n2])))
+                return true;
+        }
+    }
+    return is_point_inside_polygon(polygon1[0], polygon2) || is_point_inside_polygon(polygon2[0], polygon1);
+}
+
+bool polygons_overlap(const std::vector<std::pair<double, double>>& polygon1,
+                      const std::vector<std::pair<double, double>>& polygon2,
+                      const std::string& mode)
+{
+    if(mode != "area" && mode != "touch")
+        throw std::invalid_argument("mode must be \"area\" or \"touch\"");
+    if(polygon1.empty() || polygon2.empty()) return false;
+
+    auto [xmin1, ymin1, xmax1, ymax1] = polygon_bounds(polygon1);
+    auto [xmin2, ymin2, xmax2, ymax2] = polygon_bounds(polygon2);
+    if(mode == "touch")
+    {
+        if(xmin1 > xmax2 || xmin2 > xmax1 || ymin1 > ymax2 || ymin2 > ymax1) return false;
+        return polygons_touch(polygon1, polygon2);
+    }
+
+    if(xmin1 >= xmax2 || xmin2 >= xmax1 || ymin1 >= ymax2 || ymin2 >= ymax1) return false;
+    if(is_axis_rectangle(polygon1) && is_axis_rectangle(polygon2)) return true;
+    return polygon_area(intersect_polygon(polygon1, polygon2)) > 0;
+}
+
+void check_pairs(const std::vector<std::pair<int, int>>& pairs, size_t size1, size_t size2)
+{
+    // Номера приходят из Python: выход за границы - IndexError, а не порча памяти
+    for(const auto& [i, j] : pairs)
+    {
+        if(i < 0 || (size_t)i >= size1 || j < 0 || (size_t)j >= size2)
+            throw std::out_of_range("pair (" + std::to_string(i) + ", " + std::to_string(j) + ") is out of range");
+    }
+}
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_pairs(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    const std::vector<std::pair<int, int>>& pairs,
+    bool with_area)
+{
+    check_pairs(pairs, polygons1.size(), polygons2.size());
+    std::vector<std::tuple<double, double, double, double>> bounds1, bounds2;
+    for(const auto& polygon : polygons1) bounds1.push_back(polygon_bounds(polygon));
+    for(const auto& polygon : polygons2) bounds2.push_back(polygon_bounds(polygon));
+
+    std::vector<std::pair<int, int>> result;
+    std::vector<double> areas;
+    for(const auto& [i, j] : pairs)
+    {
+        auto [xmin1, ymin1, xmax1, ymax1] = bounds1[i];
+        auto [xmin2, ymin2, xmax2, ymax2] = bounds2[j];
+        if(xmin1 > xmax2 || xmin2 > xmax1 || ymin1 > ymax2 || ymin2 > ymax1) continue;
+
+        if(!with_area)
+        {
+            if(polygons_touch(polygons1[i], polygons2[j])) result.push_back({i, j});
+            continue;
+        }
+
+        std::vector<std::pair<double, double>> intersection = intersect_polygon(polygons1[i], polygons2[j]);
+        if(!intersection.empty())
+        {
+            result.push_back({i, j});
+            areas.push_back(polygon_area(intersection));
+        }
+    }
+    return {result, areas};
+}
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_layers(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    bool with_area)
+{
+    std::vector<std::pair<int, int>> pairs;
+    for(int i = 0; i < (int)polygons1.size(); ++i)
+        for(int j = 0; j < (int)polygons2.size(); ++j)
+            pairs.push_back({i, j});
+    return intersect_pairs(polygons1, polygons2, pairs, with_area);
+}
@@ -4,6 +4,11 @@
 #include <utility>
 #include <cmath>
 #include <set>
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <stdexcept>
+#include <string>
 
 using namespace Clipper2Lib;
 
@@ -32,7 +37,40 @@ inline std::vector<std::pair<double, double>> fromPathD(const PathD& path) {
     return result;
 }
 
-PathD rotate_path_to_left_bottom(const PathD& path) {
+// CIF задаёт целые координаты, для них используется точный Clipper64
+const double MAX_INTEGRAL_COORD = 1e15;
+
+inline bool is_integral(const std::vector<std::pair<double, double>>& poly) {
+    for (const auto& p : poly) {
+        if (p.first != std::floor(p.first) || p.second != std::floor(p.second) ||
+            std::abs(p.first) > MAX_INTEGRAL_COORD || std::abs(p.second) > MAX_INTEGRAL_COORD)
+            return false;
+    }
+    return true;
+}
+
+inline Point64 toPoint64(const std::pair<double, double>& p) {
+    return Point64(static_cast<int64_t>(p.first), static_cast<int64_t>(p.second));
+}
+
+inline std::pair<double, double> toPair(const Point64& p) {
+    return {static_cast<double>(p.x), static_cast<double>(p.y)};
+}
+
+inline Path64 toPath64(const std::vector<std::pair<double, double>>& poly) {
+    Path64 result;
+    for (const auto& p : poly) result.push_back(toPoint64(p));
+    return result;
+}
+
+inline std::vector<std::pair<double, double>> fromPath64(const Path64& path) {
+    std::vector<std::pair<double, double>> result;
+    for (const auto& p : path) result.push_back(toPair(p));
+    return result;
+}
+
+template <typename T>
+Path<T> rotate_path_to_left_bottom(const Path<T>& path) {
     if (path.empty()) return path;
 
     // Ищем индекс самой левой нижней точки
@@ -45,12 +83,43 @@ PathD rotate_path_to_left_bottom(const PathD& path) {
     }
 
     // Делаем циклический сдвиг
-    PathD rotated;
+    Path<T> rotated;
     rotated.insert(rotated.end(), path.begin() + idx, path.end());
     rotated.insert(rotated.end(), path.begin(), path.begin() + idx);
     return rotated;
 }
 
+// Одинаковые контуры всегда выдаются одинаково: против часовой стрелки,
+// начиная с самой левой нижней вершины
+template <typename T>
+Path<T> normalize_path(Path<T> path) {
+    if (Area(path) < 0) std::reverse(path.begin(), path.end());
+    return rotate_path_to_left_bottom(path);
+}
+
+std::vector<std::vector<std::pair<double, double>>> clip_polygon(ClipType type,
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2)
+{
+    std::vector<std::vector<std::pair<double, double>>> result;
+    if (is_integral(polygon1) && is_integral(polygon2)) {
+        Paths64 solution;
+        Clipper64 clipper;
+        clipper.AddSubject({toPath64(polygon1)});
+        clipper.AddClip({toPath64(polygon2)});
+        clipper.Execute(type, FillRule::NonZero, solution);
+        for (const auto& path : solution) result.push_back(fromPath64(normalize_path(path)));
+    } else {
+        PathsD solution;
+        ClipperD clipper;
+        clipper.AddSubject({toPathD(polygon1)});
+        clipper.AddClip({toPathD(polygon2)});
+        clipper.Execute(type, FillRule::NonZero, solution);
+        for (const auto& path : solution) result.push_back(fromPathD(normalize_path(path)));
+    }
+    return result;
+}
+
 // ===== ПРОВЕРКА ПЕРЕСЕЧЕНИЯ ОТРЕЗКОВ =====
 
 std::tuple<bool, std::pair<double, double>> do_lines_intersect(
@@ -82,6 +151,8 @@ std::tuple<bool, std::pair<double, double>> do_lines_intersect(
 bool is_point_inside_polygon(const std::pair<double, double>& point,
     const std::vector<std::pair<double, double>>& polygon)
 {
+    if (is_integral({point}) && is_integral(polygon))
+        return PointInPolygon(toPoint64(point), toPath64(polygon)) != PointInPolygonResult::IsOutside;
     return PointInPolygon(toPointD(point), toPathD(polygon)) != PointInPolygonResult::IsOutside;
 }
 
@@ -119,14 +190,9 @@ std::vector<std::pair<double, double>> intersect_polygon(
     const std::vector<std::pair<double, double>>& polygon1,
     const std::vector<std::pair<double, double>>& polygon2)
 {
-    PathsD solution;
-    ClipperD clipper;
-    clipper.AddSubject({toPathD(polygon1)});
-    clipper.AddClip({toPathD(polygon2)});
-    clipper.Execute(ClipType::Intersection, FillRule::NonZero, solution);
-
+    auto solution = clip_polygon(ClipType::Intersection, polygon1, polygon2);
     if (!solution.empty())
-        return fromPathD(rotate_path_to_left_bottom(solution[0]));
+        return solution[0];
 
     std::vector<std::pair<double, double>> intersections = get_intersection_points(polygon1, polygon2);
     if(!intersections.empty())
@@ -166,14 +232,9 @@ std::vector<std::pair<double, double>> subtract_polygon(
     const std::vector<std::pair<double, double>>& polygon1,
     const std::vector<std::pair<double, double>>& polygon2)
 {
-    PathsD solution;
-    ClipperD clipper;
-    clipper.AddSubject({toPathD(polygon1)});
-    clipper.AddClip({toPathD(polygon2)});
-    clipper.Execute(ClipType::Difference, FillRule::NonZero, solution);
-
+    auto solution = clip_polygon(ClipType::Difference, polygon1, polygon2);
     if (!solution.empty())
-        return fromPathD(rotate_path_to_left_bottom(solution[0]));
+        return solution[0];
 
     return {};
 }
@@ -184,36 +245,209 @@ std::pair<std::vector<std::pair<double, double>>, std::vector<std::pair<double,
     const std::vector<std::pair<double, double>>& polygon1,
     const std::vector<std::pair<double, double>>& polygon2)
 {
-    PathD path1 = toPathD(polygon1);
-    PathD path2 = toPathD(polygon2);
-
     // Ищем пересечение
-    PathsD intersection;
-    ClipperD clipper;
-    clipper.AddSubject({path1});
-    clipper.AddClip({path2});
-    clipper.Execute(ClipType::Intersection, FillRule::NonZero, intersection);
+    auto intersection = clip_polygon(ClipType::Intersection, polygon1, polygon2);
 
     // Если пересечение найдено
     if (!intersection.empty())
     {
         // Если есть пересечение, то вычитаем второй полигон из первого
-        PathsD result;
-        clipper.Clear();
-        clipper.AddSubject({path1});
-        clipper.AddClip({path2});
-        clipper.Execute(ClipType::Difference, FillRule::NonZero, result);
+        auto result = clip_polygon(ClipType::Difference, polygon1, polygon2);
 
         // Делаем результат пригодным для возвращения
         if (result.size() >= 2)
         {
-            return {
-                fromPathD(rotate_path_to_left_bottom(result[0])),
-                fromPathD(rotate_path_to_left_bottom(result[1]))
-            };
+            return {result[0], result[1]};
         }
     }
 
     // Если пересечения нет, возвращаем пустые полигоны
     return {polygon1, {}};
 }
+
+// ===== ПРЕДИКАТ ПЕРЕСЕЧЕНИЯ =====
+
+inline RectD polygon_bounds(const std::vector<std::pair<double, double>>& polygon) {
+    double xmin = std::numeric_limits<double>::max(), ymin = std::numeric_limits<double>::max();
+    double xmax = std::numeric_limits<double>::lowest(), ymax = std::numeric_limits<double>::lowest();
+    for (const auto& p : polygon) {
+        xmin = std::min(xmin, p.first);
+        ymin = std::min(ymin, p.second);
+        xmax = std::max(xmax, p.first);
+        ymax = std::max(ymax, p.second);
+    }
+    return RectD(xmin, ymin, xmax, ymax);
+}
+
+inline bool bounds_overlap(const RectD& r1, const RectD& r2) {
+    return r1.left <= r2.right && r2.left <= r1.right &&
+           r1.top <= r2.bottom && r2.top <= r1.bottom;
+}
+
+inline bool bounds_overlap_strict(const RectD& r1, const RectD& r2) {
+    return r1.left < r2.right && r2.left < r1.right &&
+           r1.top < r2.bottom && r2.top < r1.bottom;
+}
+
+// Прямоугольник со сторонами вдоль осей: соседние вершины различаются ровно одной координатой
+bool is_axis_rectangle(const std::vector<std::pair<double, double>>& polygon) {
+    if (polygon.size() != 4) return false;
+    for (size_t i = 0; i < 4; ++i) {
+        const auto& p1 = polygon[i];
+        const auto& p2 = polygon[(i + 1) % 4];
+        if ((p1.first == p2.first) == (p1.second == p2.second)) return false;
+    }
+    return polygon[0].first != polygon[2].first && polygon[0].second != polygon[2].second;
+}
+
+// Замкнутые множества пересекаются: есть общая точка границы или один полигон внутри другого
+bool polygons_touch(const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2)
+{
+    size_t n1 = polygon1.size();
+    size_t n2 = polygon2.size();
+    for (size_t i = 0; i < n1; ++i)
+        for (size_t j = 0; j < n2; ++j)
+            if (std::get<0>(do_lines_intersect(polygon1[i], polygon1[(i + 1) % n1], polygon2[j], polygon2[(j + 1) % n2])))
+                return true;
+    return is_point_inside_polygon(polygon1[0], polygon2) || is_point_inside_polygon(polygon2[0], polygon1);
+}
+
+bool clip_is_empty(ClipType type,
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2)
+{
+    if (is_integral(polygon1) && is_integral(polygon2)) {
+        Paths64 solution;
+        Clipper64 clipper;
+        clipper.AddSubject({toPath64(polygon1)});
+        clipper.AddClip({toPath64(polygon2)});
+        clipper.Execute(type, FillRule::NonZero, solution);
+        return solution.empty();
+    }
+    PathsD solution;
+    ClipperD clipper;
+    clipper.AddSubject({toPathD(polygon1)});
+    clipper.AddClip({toPathD(polygon2)});
+    clipper.Execute(type, FillRule::NonZero, solution);
+    return solution.empty();
+}
+
+bool polygons_overlap(const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2,
+    const std::string& mode)
+{
+    if (mode != "area" && mode != "touch")
+        throw std::invalid_argument("mode must be \"area\" or \"touch\"");
+    if (polygon1.empty() || polygon2.empty()) return false;
+
+    RectD bounds1 = polygon_bounds(polygon1);
+    RectD bounds2 = polygon_bounds(polygon2);
+    if (mode == "touch")
+        return bounds_overlap(bounds1, bounds2) && polygons_touch(polygon1, polygon2);
+
+    if (!bounds_overlap_strict(bounds1, bounds2)) return false;
+    if (is_axis_rectangle(polygon1) && is_axis_rectangle(polygon2)) return true;
+    return !clip_is_empty(ClipType::Intersection, polygon1, polygon2);
+}
+
+// ===== ПАКЕТНОЕ ПЕРЕСЕЧЕНИЕ =====
+
+// Полигон, один раз сконвертированный для пакетных проверок
+struct PreparedPolygon {
+    bool integral;
+    Path64 path64;
+    PathD pathD;
+    RectD bounds;
+};
+
+PreparedPolygon prepare_polygon(const std::vector<std::pair<double, double>>& polygon, bool with_paths) {
+    PreparedPolygon prepared;
+    prepared.integral = is_integral(polygon);
+    prepared.bounds = polygon_bounds(polygon);
+    if (with_paths) {
+        if (prepared.integral) prepared.path64 = toPath64(polygon);
+        else prepared.pathD = toPathD(polygon);
+    }
+    return prepared;
+}
+
+// Та же проверка, что и непустой результат intersect_polygon, но на уже сконвертированных путях
+bool overlap_paths(const PreparedPolygon& prepared1, const PreparedPolygon& prepared2,
+    const std::vector<std::pair<double, double>>& polygon1,
+    const std::vector<std::pair<double, double>>& polygon2,
+    double& area)
+{
+    area = 0.0;
+    if (prepared1.integral && prepared2.integral) {
+        Paths64 solution;
+        Clipper64 clipper;
+        clipper.AddSubject({prepared1.path64});
+        clipper.AddClip({prepared2.path64});
+        clipper.Execute(ClipType::Intersection, FillRule::NonZero, solution);
+        if (!solution.empty()) {
+            area = std::abs(Area(solution));
+            return true;
+        }
+    } else {
+        PathsD solution;
+        ClipperD clipper;
+        clipper.AddSubject({prepared1.integral ? toPathD(polygon1) : prepared1.pathD});
+        clipper.AddClip({prepared2.integral ? toPathD(polygon2) : prepared2.pathD});
+        clipper.Execute(ClipType::Intersection, FillRule::NonZero, solution);
+        if (!solution.empty()) {
+            area = std::abs(Area(solution));
+            return true;
+        }
+    }
+    return !get_intersection_points(polygon1, polygon2).empty();
+}
+
+void check_pairs(const std::vector<std::pair<int, int>>& pairs, size_t size1, size_t size2)
+{
+    // Номера приходят из Python: выход за границы - IndexError, а не порча памяти
+    for (const auto& [i, j] : pairs) {
+        if (i < 0 || (size_t)i >= size1 || j < 0 || (size_t)j >= size2)
+            throw std::out_of_range("pair (" + std::to_string(i) + ", " + std::to_string(j) + ") is out of range");
+    }
+}
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_pairs(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    const std::vector<std::pair<int, int>>& pairs,
+    bool with_area)
+{
+    check_pairs(pairs, polygons1.size(), polygons2.size());
+    std::vector<PreparedPolygon> prepared1, prepared2;
+    for (const auto& poly : polygons1) prepared1.push_back(prepare_polygon(poly, with_area));
+    for (const auto& poly : polygons2) prepared2.push_back(prepare_polygon(poly, with_area));
+
+    std::vector<std::pair<int, int>> result;
+    std::vector<double> areas;
+    double area;
+    for (const auto& [i, j] : pairs) {
+        if (!bounds_overlap(prepared1[i].bounds, prepared2[j].bounds)) continue;
+        if (!with_area) {
+            if (polygons_touch(polygons1[i], polygons2[j])) result.push_back({i, j});
+            continue;
+        }
+        if (overlap_paths(prepared1[i], prepared2[j], polygons1[i], polygons2[j], area)) {
+            result.push_back({i, j});
+            areas.push_back(area);
+        }
+    }
+    return {result, areas};
+}
+
+std::pair<std::vector<std::pair<int, int>>, std::vector<double>> intersect_layers(
+    const std::vector<std::vector<std::pair<double, double>>>& polygons1,
+    const std::vector<std::vector<std::pair<double, double>>>& polygons2,
+    bool with_area)
+{
+    std::vector<std::pair<int, int>> pairs;
+    for (int i = 0; i < (int)polygons1.size(); ++i)
+        for (int j = 0; j < (int)polygons2.size(); ++j)
+            pairs.push_back({i, j});
+    return intersect_pairs(polygons1, polygons2, pairs, with_area);
+}
@@ -0,0 +1,139 @@
+#include <algorithm>
+#include <cstdint>
+#include <vector>
+
+
+// Графы в формате CSR: соседи вершины v - nodes[ptr[v]..ptr[v + 1]),
+// отсортированы по номеру, метки рёбер лежат рядом в labels.
+struct CSR
+{
+    const std::vector<int64_t>& ptr;
+    const std::vector<int64_t>& nodes;
+    const std::vector<int64_t>& labels;
+};
+
+// Метка ребра (v, x) или -1, если ребра нет
+static int64_t edge_label(const CSR& graph, int64_t v, int64_t x)
+{
+    auto begin = graph.nodes.begin() + graph.ptr[v];
+    auto end = graph.nodes.begin() + graph.ptr[v + 1];
+    auto found = std::lower_bound(begin, end, x);
+    if (found == end || *found != x)
+        return -1;
+    return graph.labels[found - graph.nodes.begin()];
+}
+
+// Поиск в глубину VF2++ по заранее вычисленному порядку вершин образца.
+// back_* - рёбра вершины на позиции depth к вершинам, стоящим раньше;
+// кандидаты корня компоненты - вершины его цвета (colour_*), остальных -
+// соседи образа ранее сопоставленной вершины. Возвращает образ каждой
+// вершины образца или пустой вектор, если вложения нет.
+std::vector<int64_t> vf2pp_search(
+    const std::vector<int64_t>& order,
+    const std::vector<int64_t>& back_ptr,
+    const std::vector<int64_t>& back_nodes,
+    const std::vector<int64_t>& back_labels,
+    const std::vector<int64_t>& pattern_colours,
+    const std::vector<int64_t>& pattern_degrees,
+    const std::vector<int64_t>& target_ptr,
+    const std::vector<int64_t>& target_nodes,
+    const std::vector<int64_t>& target_labels,
+    const std::vector<int64_t>& target_colours,
+    const std::vector<int64_t>& target_degrees,
+    const std::vector<int64_t>& colour_ptr,
+    const std::vector<int64_t>& colour_nodes,
+    bool induced)
+{
+    const CSR target{target_ptr, target_nodes, target_labels};
+    const int64_t n = static_cast<int64_t>(order.size());
+    std::vector<int64_t> core_p(pattern_colours.size(), -1);
+    std::vector<int64_t> core_g(target_colours.size(), -1);
+    std::vector<int64_t> counts(induced ? target_colours.size() : 0, 0);
+
+    // Состояние перебора на каждой глубине: диапазон кандидатов,
+    // метка ребра к опорной вершине (-1 для корня компоненты)
+    std::vector<int64_t> position(n), end(n), anchor_label(n);
+    std::vector<char> started(n, 0);
+
+    auto feasible = [&](int64_t depth, int64_t u, int64_t v) {
+        if (core_g[v] >= 0 || target_colours[v] != pattern_colours[u] || target_degrees[v] < pattern_degrees[u])
+            return false;
+        for (int64_t k = back_ptr[depth]; k < back_ptr[depth + 1]; ++k)
+            if (edge_label(target, v, core_p[back_nodes[k]]) != back_labels[k])
+                return false;
+        return !induced || counts[v] == back_ptr[depth + 1] - back_ptr[depth];
+    };
+
+    auto update = [&](int64_t v, int64_t step) {
+        if (!induced)
+            return;
+        for (int64_t k = target_ptr[v]; k < target_ptr[v + 1]; ++k)
+            counts[target_nodes[k]] += step;
+    };
+
+    int64_t depth = 0;
+    while (true)
+    {
+        if (depth == n)
+            return core_p;
+        const int64_t u = order[depth];
+        if (!started[depth])
+        {
+            started[depth] = 1;
+            if (back_ptr[depth] == back_ptr[depth + 1])
+            {
+                position[depth] = colour_ptr[pattern_colours[u]];
+                end[depth] = colour_ptr[pattern_colours[u] + 1];
+                anchor_label[depth] = -1;
+            }
+            else
+            {
+                // Опора - сопоставленный сосед, у образа которого меньше всего соседей
+                int64_t best = back_ptr[depth];
+                for (int64_t k = best + 1; k < back_ptr[depth + 1]; ++k)
+                    if (target_degrees[core_p[back_nodes[k]]] < target_degrees[core_p[back_nodes[best]]])
+                        best = k;
+                const int64_t anchor = core_p[back_nodes[best]];
+                position[depth] = target_ptr[anchor];
+                end[depth] = target_ptr[anchor + 1];
+                anchor_label[depth] = back_labels[best];
+            }
+        }
+        else
+        {
+            const int64_t v = core_p[u];
+            core_p[u] = core_g[v] = -1;
+            update(v, -1);
+        }
+
+        bool found = false;
+        while (position[depth] < end[depth])
+        {
+            const int64_t k = position[depth]++;
+            int64_t v;
+            if (anchor_label[depth] < 0)
+                v = colour_nodes[k];
+            else if (target_labels[k] == anchor_label[depth])
+                v = target_nodes[k];
+            else
+                continue;
+            if (feasible(depth, u, v))
+            {
+                core_p[u] = v;
+                core_g[v] = u;
+                update(v, 1);
+                found = true;
+                break;
+            }
+        }
+        if (found)
+        {
+            ++depth;
+            continue;
+        }
+        started[depth] = 0;
+        if (depth == 0)
+            return {};
+        --depth;
+    }
+}
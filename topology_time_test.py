@@ -5,10 +5,11 @@ start = time.time()
 
 # 🔧 Тестируем производительность
 circuit = TopologicalCircuit("test")
-circuit.load_CIF("resources/input/adder2.cif")
+load_stats = circuit.load_CIF("resources/input/adder2.cif")
 circuit.compile()
 circuit.graph_to_json("resources/output/graph_summin.json")
 
 end = time.time()
 circuit.visualize_trans([])
+print(f"📄 Чтение CIF: {load_stats['bytes_per_second'] / 1e6:.2f} МБ/с")
 print(f"⏱ Выполнено за: {end - start:.5f} секунд")
\ No newline at end of file